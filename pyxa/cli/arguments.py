@@ -35,7 +35,8 @@ import argparse
 import logging
 from typing import Optional, Union
 
-from pyxa.utils.settings import AI_NAME, VENV_NAME
+from pyxa.utils.settings import (AI_NAME, DEFAULT_GEOCODE_BATCH,
+                                 DEFAULT_MAX_CONCURRENCY, VENV_NAME)
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -69,6 +70,66 @@ def pass_venv_name_arg(parser: Union[argparse.ArgumentParser,
                         help=help, type=str, metavar='<name>')
 
 
+def pass_geocode_file_arg(parser: Union[argparse.ArgumentParser,
+                                        argparse._ActionsContainer],
+                          help: str) -> None:
+    """Passes argument for the CSV file to be geocoded."""
+    parser.add_argument('file', help=help, type=str, metavar='<file>')
+
+
+def pass_maps_key_arg(parser: Union[argparse.ArgumentParser,
+                                    argparse._ActionsContainer],
+                      help: str) -> None:
+    """Passes argument for the ``Google Maps`` API key."""
+    parser.add_argument('--key', required=True,
+                        help=help, type=str, metavar='<key>')
+
+
+def pass_output_file_arg(parser: Union[argparse.ArgumentParser,
+                                       argparse._ActionsContainer],
+                         help: str,
+                         default: Optional[str] = None) -> None:
+    """Passes argument for the output file."""
+    parser.add_argument('--output', default=default,
+                        help=help, type=str, metavar='<file>')
+
+
+def pass_address_column_arg(parser: Union[argparse.ArgumentParser,
+                                          argparse._ActionsContainer],
+                            help: str,
+                            default: Optional[str] = 'address') -> None:
+    """Passes argument for the column holding the addresses."""
+    parser.add_argument('--column', default=default,
+                        help=help, type=str, metavar='<column>')
+
+
+def pass_concurrency_arg(parser: Union[argparse.ArgumentParser,
+                                       argparse._ActionsContainer],
+                         help: str,
+                         default: Optional[int] = DEFAULT_MAX_CONCURRENCY
+                         ) -> None:
+    """Passes argument for the number of simultaneous calls."""
+    parser.add_argument('--concurrency', default=default,
+                        help=help, type=int, metavar='<calls>')
+
+
+def pass_batch_size_arg(parser: Union[argparse.ArgumentParser,
+                                      argparse._ActionsContainer],
+                        help: str,
+                        default: Optional[int] = DEFAULT_GEOCODE_BATCH
+                        ) -> None:
+    """Passes argument for the number of rows checkpointed at once."""
+    parser.add_argument('--batch', default=default,
+                        help=help, type=int, metavar='<rows>')
+
+
+def pass_restart_arg(parser: Union[argparse.ArgumentParser,
+                                   argparse._ActionsContainer],
+                     help: str) -> None:
+    """Passes argument for ignoring the checkpoint."""
+    parser.add_argument('--restart', action='store_true', help=help)
+
+
 def add_logging_options(parser: Union[argparse.ArgumentParser,
                                       argparse._ActionsContainer]) -> None:
     """Adds logging options to the parser object."""
@@ -0,0 +1,274 @@
+# Copyright 2020 XAMES3. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ======================================================================
+"""
+The `pyxa.cli.commands.geocode` module creates ``geocode`` subparser
+command.
+
+This command geocodes the addresses of a CSV file in batches. Every
+batch is written to the output file and checkpointed before the next
+one is read, hence an interrupted run resumes from the last batch.
+"""
+# The following comment should be removed at some point in the future.
+# pylint: disable=import-error
+# pylint: disable=no-name-in-module
+
+import argparse
+import csv
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from pyxa.cli import strings
+from pyxa.cli.formatter import PyXAHelpFormatter as HelpFormatter
+from pyxa.cli.options import geocode_args
+from pyxa.utils.settings import (DEFAULT_CHARSET, DEFAULT_GEOCODE_BATCH,
+                                 DEFAULT_MAX_CONCURRENCY)
+
+# Columns added to the rows of the output file.
+RESULT_COLUMNS = ['latitude', 'longitude', 'error']
+
+# Seconds between the progress reports.
+REPORT_INTERVAL = 5.0
+
+
+def subparser(subparsers: argparse._SubParsersAction,
+              parents: List[argparse.ArgumentParser]) -> None:
+    """Creates subparser object."""
+    title = os.path.basename(__file__).split('.')[0].capitalize()
+
+    parser = subparsers.add_parser('geocode',
+                                   usage=strings.geocode_usage,
+                                   help=strings.geocode_help,
+                                   formatter_class=HelpFormatter,
+                                   parents=parents,
+                                   description=strings.geocode_description)
+    geocode_args(parser)
+
+    parser._positionals.title = f'{title} Options'
+    parser._optionals.title = f'{title} Arguments'
+
+    parser.set_defaults(function=geocode_addresses)
+
+
+def _read_checkpoint(path: str) -> Optional[Dict[str, Any]]:
+    """Returns checkpoint of an earlier run, if any."""
+    try:
+        with open(path, encoding=DEFAULT_CHARSET) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_checkpoint(path: str, checkpoint: Dict[str, Any]) -> None:
+    """Replaces the checkpoint, never leaving a partial one behind."""
+    with open(f'{path}.tmp', 'w', encoding=DEFAULT_CHARSET) as file:
+        json.dump(checkpoint, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(f'{path}.tmp', path)
+
+
+def geocode_file(api_key: str,
+                 path: str,
+                 output: Optional[str] = None,
+                 column: Optional[str] = 'address',
+                 concurrency: Optional[int] = DEFAULT_MAX_CONCURRENCY,
+                 batch: Optional[int] = DEFAULT_GEOCODE_BATCH,
+                 restart: Optional[bool] = False,
+                 progress: Optional[Callable[[Dict[str, Any]], None]] = None
+                 ) -> Dict[str, Any]:
+    """Geocodes addresses of the CSV file into the output file.
+
+    The rows are read in batches. The unique addresses of a batch are
+    geocoded concurrently through ``geocode_cache``, then the batch is
+    appended to the output with ``latitude``, ``longitude`` & ``error``
+    columns and the number of rows done is checkpointed next to it. A
+    rerun truncates the output to the last checkpoint and resumes from
+    there.
+
+    Rows which can't be geocoded get an error and the run carries on.
+    Once the ``Google Maps`` budget is spent or its circuit is open the
+    run stops instead, keeping the batches done so far.
+
+    Args:
+        api_key: ``Google Maps`` API key.
+        path: Path of the CSV file of addresses.
+        output: Path of the output CSV file. The input path suffixed
+                with ``_geocoded`` is used if ``None`` is passed.
+                Default: None
+        column: Column holding the addresses.
+                Default: address
+        concurrency: Number of simultaneous lookups.
+                     Default: 16
+        batch: Number of rows written & checkpointed at once.
+               Default: 256
+        restart: Boolean, if the checkpoint should be ignored.
+                 Default: False
+        progress: Function called with the statistics after every batch.
+                  Default: None
+
+    Example:
+        >>> from pyxa.cli.commands.geocode import geocode_file
+        >>> geocode_file(maps_key, 'addresses.csv')
+        {'rows': 25000, 'errors': 12, 'resumed': 0, 'rows_per_second': ...}
+
+    Returns:
+        Dictionary of rows done, rows failed, rows skipped as done by an
+        earlier run, throughput and the geocode cache hit ratio.
+
+    Raises:
+        FileExistsError: If the output file exists without a checkpoint
+                         and ``restart`` isn't passed.
+        KeyError: If the CSV file has no such address column.
+        QuotaExceeded: If the ``Google Maps`` budget of the key is spent.
+        CircuitOpen: If ``Google Maps`` is failing & the call is refused.
+    """
+    from pyxa.core.cache import geocode_cache
+    from pyxa.core.location import geocode
+    from pyxa.utils.exceptions import CircuitOpen, QuotaExceeded
+
+    if output is None:
+        root, ext = os.path.splitext(path)
+        output = f'{root}_geocoded{ext or ".csv"}'
+    checkpoint_path = f'{output}.checkpoint'
+
+    checkpoint = None if restart else _read_checkpoint(checkpoint_path)
+    if checkpoint is not None and checkpoint.get('input') != (
+            os.path.abspath(path)):
+        checkpoint = None
+    if checkpoint is not None and (not os.path.exists(output) or
+                                   os.path.getsize(output) <
+                                   checkpoint['offset']):
+        # The output was removed or cut short since it was checkpointed,
+        # truncating it would pad it with NUL bytes, so start over.
+        checkpoint = None
+        restart = True
+    if checkpoint is None and os.path.exists(output) and not restart:
+        raise FileExistsError(f'"{output}" already exists without a '
+                              'checkpoint, pass restart to overwrite it.')
+    checkpoint = checkpoint or {'input': os.path.abspath(path), 'rows': 0,
+                                'errors': 0, 'offset': 0}
+    resumed = checkpoint['rows']
+
+    def _lookup(address: str) -> Tuple[Any, Any, str]:
+        """Returns latitude, longitude & error of the address."""
+        if not address.strip():
+            return '', '', 'Empty address.'
+        try:
+            latitude, longitude = geocode(api_key, address)
+        except (QuotaExceeded, CircuitOpen):
+            raise
+        except Exception as error:
+            return '', '', str(error) or type(error).__name__
+        return latitude, longitude, ''
+
+    start = time.perf_counter()
+    hits, misses = geocode_cache.hits, geocode_cache.misses
+    stats = {}
+
+    def _stats() -> Dict[str, Any]:
+        """Returns statistics of the run so far."""
+        elapsed = time.perf_counter() - start
+        lookups = (geocode_cache.hits - hits) + (geocode_cache.misses
+                                                 - misses)
+        return {'rows': checkpoint['rows'],
+                'errors': checkpoint['errors'],
+                'resumed': resumed,
+                'rows_per_second': ((checkpoint['rows'] - resumed) / elapsed
+                                    if elapsed else 0.0),
+                'cache_hit_ratio': ((geocode_cache.hits - hits) / lookups
+                                    if lookups else 0.0)}
+
+    with open(path, newline='', encoding=DEFAULT_CHARSET) as source, \
+            ThreadPoolExecutor(concurrency) as executor:
+        reader = csv.DictReader(source)
+        if column not in (reader.fieldnames or []):
+            raise KeyError(f'Column "{column}" not found in "{path}".')
+        fieldnames = reader.fieldnames + [name for name in RESULT_COLUMNS
+                                          if name not in reader.fieldnames]
+        rows = islice(reader, checkpoint['rows'], None)
+
+        with open(output, 'a+', newline='', encoding=DEFAULT_CHARSET) as sink:
+            # Anything past the checkpoint is from a batch which wasn't
+            # checkpointed, it is geocoded & written again.
+            sink.truncate(checkpoint['offset'])
+            writer = csv.DictWriter(sink, fieldnames)
+            if not checkpoint['offset']:
+                writer.writeheader()
+
+            while True:
+                chunk = list(islice(rows, batch))
+                if not chunk:
+                    break
+                addresses = list(dict.fromkeys(row[column] or ''
+                                               for row in chunk))
+                results = dict(zip(addresses,
+                                   executor.map(_lookup, addresses)))
+                for row in chunk:
+                    latitude, longitude, error = results[row[column] or '']
+                    row.update(latitude=latitude, longitude=longitude,
+                               error=error)
+                    checkpoint['errors'] += bool(error)
+                writer.writerows(chunk)
+                sink.flush()
+                os.fsync(sink.fileno())
+                checkpoint['rows'] += len(chunk)
+                checkpoint['offset'] = os.fstat(sink.fileno()).st_size
+                _write_checkpoint(checkpoint_path, checkpoint)
+                stats = _stats()
+                if progress is not None:
+                    progress(stats)
+
+    return stats or _stats()
+
+
+def geocode_addresses(args: argparse.Namespace) -> None:
+    """Geocodes addresses of the CSV file, reporting the progress.
+
+    Args:
+        args: Arguments for storing attributes.
+    """
+    last_report = [time.perf_counter()]
+
+    def _report(stats: Dict[str, Any]) -> None:
+        """Prints the progress every few seconds."""
+        if time.perf_counter() - last_report[0] < REPORT_INTERVAL:
+            return
+        last_report[0] = time.perf_counter()
+        print(f'Geocoded {stats["rows"]} rows at '
+              f'{stats["rows_per_second"]:.1f} rows/s, cache hit rate '
+              f'{stats["cache_hit_ratio"]:.1%}, {stats["errors"]} errors.')
+
+    try:
+        stats = geocode_file(args.key, args.file, args.output, args.column,
+                             args.concurrency, args.batch, args.restart,
+                             _report)
+    except (FileExistsError, KeyError) as error:
+        print(error.args[0] if error.args else error)
+        exit(1)
+    except Exception as error:
+        print(f'Geocoding stopped, rerun to resume: {error}')
+        exit(1)
+
+    if stats['resumed']:
+        print(f'Resumed after {stats["resumed"]} rows.')
+    print(f'Geocoded {stats["rows"]} rows at {stats["rows_per_second"]:.1f} '
+          f'rows/s, cache hit rate {stats["cache_hit_ratio"]:.1%}, '
+          f'{stats["errors"]} errors.')
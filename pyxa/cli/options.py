@@ -33,8 +33,15 @@ them.
 
 import argparse
 
-from pyxa.cli.arguments import (pass_project_name_arg,
+from pyxa.cli.arguments import (pass_address_column_arg,
+                                pass_batch_size_arg,
+                                pass_concurrency_arg,
+                                pass_geocode_file_arg,
+                                pass_maps_key_arg,
+                                pass_output_file_arg,
+                                pass_project_name_arg,
                                 pass_project_path_arg,
+                                pass_restart_arg,
                                 pass_venv_name_arg)
 
 
@@ -55,3 +62,17 @@ def create_venv_args(parser: argparse.ArgumentParser):
     """Parses argument for ``create venv`` command."""
     pass_venv_name_arg(parser, help='Name of the virtual environment.')
     pass_project_path_arg(parser, help='Path to the project directory.')
+
+
+def geocode_args(parser: argparse.ArgumentParser):
+    """Parses arguments for ``geocode`` command."""
+    pass_geocode_file_arg(parser, help='CSV file of the addresses.')
+    pass_maps_key_arg(parser, help='Google Maps API key.')
+    pass_output_file_arg(parser, help=('Output CSV file. Defaults to the '
+                                       'input file suffixed with '
+                                       '"_geocoded".'))
+    pass_address_column_arg(parser, help='Column holding the addresses.')
+    pass_concurrency_arg(parser, help='Number of simultaneous lookups.')
+    pass_batch_size_arg(parser, help='Number of rows written & '
+                                     'checkpointed at once.')
+    pass_restart_arg(parser, help='Ignore the checkpoint and start over.')
@@ -75,3 +75,27 @@ venv_description = ('Description:\n  Creates virtual environment:\n\n  '
                     'Virtual environment has access to global site packages '
                     'by default. Currently there isn\'t any option available '
                     'to override it.')
+
+# Geocode subparser object.
+geocode_usage = ('pyxa geocode <file> --key <maps api key> ...\n  '
+                 'pyxa geocode <file> --key <maps api key> --output '
+                 '<output file> ...\n  '
+                 'pyxa geocode <file> --key <maps api key> --column '
+                 '<address column> --concurrency <calls> ...')
+geocode_help = ('Geocode addresses of a CSV file into latitudes & longitudes. '
+                'Results are written as the rows are geocoded and the '
+                'progress is checkpointed, hence an interrupted run resumes '
+                'where it stopped.')
+geocode_description = ('Description:\n  Geocodes a CSV file of addresses:'
+                       '\n\n  '
+                       '- Streams the rows and geocodes them concurrently '
+                       'through the geocode cache.\n  '
+                       '- Appends the results to the output file batch by '
+                       'batch along with a checkpoint.\n  '
+                       '- Resumes from the checkpoint if the output file '
+                       'already has one.\n  '
+                       '- Reports throughput & cache hit rate as it goes.'
+                       '\n\n  '
+                       'Rows which cannot be geocoded are written with an '
+                       'error. The run stops, keeping its progress, once the '
+                       'API budget is spent or the API keeps failing.')
@@ -28,3 +28,6 @@ NOON = 12
 DUSK = 17
 
 DARK = 21
+
+# Mean radius of the Earth in kilometers.
+EARTH_RADIUS_KM = 6371.0088
@@ -0,0 +1,296 @@
+# Copyright 2020 XAMES3. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ======================================================================
+"""
+The `pyxa.core.archive` module keeps the history of fetched forecasts.
+
+Every fetched payload is flattened into rows, one per data point of its
+current, hourly & daily blocks, and appended to an on-disk columnar
+archive. Each numeric field is a raw little-endian array in its own
+file, hence the columns can be memory mapped & sliced without parsing
+a single JSON payload again.
+"""
+# The following comment should be removed at some point in the future.
+# pylint: disable=import-error
+# pylint: disable=no-name-in-module
+
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from pyxa.core.forecast import Forecast
+from pyxa.core.geohash import decode
+from pyxa.utils.settings import ARCHIVE_PATH, DEFAULT_ARCHIVE_FORECASTS
+
+# Blocks of the payload mapped to their code in the ``block`` column.
+BLOCKS = {'currently': 0, 'hourly': 1, 'daily': 2}
+
+# Columns locating every row mapped to their on-disk types. The rows
+# are appended in the order they are fetched, hence ``fetched_at`` is
+# sorted and the time ranges can be found by bisection.
+INDEX_COLUMNS = {
+    'fetched_at': np.dtype('<f8'),
+    'time': np.dtype('<i8'),
+    'latitude': np.dtype('<f8'),
+    'longitude': np.dtype('<f8'),
+    'block': np.dtype('i1'),
+}
+
+# On-disk type of the forecast fields, missing values being ``NaN``.
+FIELD_DTYPE = np.dtype('<f8')
+
+
+class ForecastArchive(object):
+    """Append-only columnar archive of the fetched forecasts.
+
+    The archive is a directory with an ``index`` folder holding the
+    ``fetched_at``, ``time``, ``latitude``, ``longitude`` & ``block``
+    columns and a ``fields`` folder holding one column per numeric field
+    of the payloads. All the columns have the same number of rows.
+    Fields which show up later are backfilled with ``NaN`` and the
+    columns left uneven by an interrupted append are trimmed when the
+    archive is opened.
+
+    Recording is opt-in, ``record`` does nothing until the archive is
+    enabled.
+
+    Args:
+        directory: Directory of the archive.
+                   Default: ARCHIVE_PATH
+        enabled: Boolean, if the fetched forecasts should be recorded.
+                 Default: False
+
+    Example:
+        >>> from pyxa.core.archive import forecast_archive
+        >>> forecast_archive.enabled = True
+        >>> forecast(maps_key, darksky_key, 'London')
+        >>> history = forecast_archive.query(start=time.time() - 86400,
+                                             fields=['temperature'],
+                                             block='hourly')
+        >>> history['temperature']
+        array([ 2.02,  2.3 ,  2.71, ...])
+    """
+
+    def __init__(self,
+                 directory: Optional[str] = ARCHIVE_PATH,
+                 enabled: Optional[bool] = DEFAULT_ARCHIVE_FORECASTS) -> None:
+        self.directory = directory
+        self.enabled = enabled
+        self._rows = None
+        self._lock = threading.Lock()
+
+    def _path(self, column: str) -> str:
+        """Returns path of the index column or the field column."""
+        folder = 'index' if column in INDEX_COLUMNS else 'fields'
+        return os.path.join(self.directory, folder, column)
+
+    @staticmethod
+    def _dtype(column: str) -> np.dtype:
+        """Returns on-disk type of the column."""
+        return INDEX_COLUMNS.get(column, FIELD_DTYPE)
+
+    def _align(self, column: str, rows: int) -> None:
+        """Pads the column with ``NaN`` (or 0) or trims it to the rows."""
+        path, dtype = self._path(column), self._dtype(column)
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        if size > rows * dtype.itemsize:
+            with open(path, 'r+b') as file:
+                file.truncate(rows * dtype.itemsize)
+        elif size < rows * dtype.itemsize:
+            missing = rows - size // dtype.itemsize
+            with open(path, 'ab') as file:
+                fill = np.nan if dtype.kind == 'f' else 0
+                file.write(np.full(missing, fill, dtype).tobytes())
+
+    def _open(self) -> int:
+        """Returns number of rows, making the columns even if needed."""
+        if self._rows is None:
+            for folder in ('index', 'fields'):
+                os.makedirs(os.path.join(self.directory, folder),
+                            exist_ok=True)
+            path = self._path('fetched_at')
+            self._rows = (os.path.getsize(path) // FIELD_DTYPE.itemsize
+                          if os.path.exists(path) else 0)
+            # ``fetched_at`` is written last, anything past it is from
+            # an append which didn't complete.
+            for column in self.columns():
+                self._align(column, self._rows)
+        return self._rows
+
+    def columns(self) -> List[str]:
+        """Returns names of the index & the field columns."""
+        fields = os.path.join(self.directory, 'fields')
+        return list(INDEX_COLUMNS) + (sorted(os.listdir(fields))
+                                      if os.path.isdir(fields) else [])
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._open()
+
+    def record(self,
+               payload: Dict[str, Any],
+               fetched_at: Optional[float] = None) -> int:
+        """Appends data points of the payload to the archive.
+
+        Args:
+            payload: JSON payload returned by the weather API.
+            fetched_at: UNIX time the payload was fetched at. Current
+                        time is used if ``None`` is passed.
+                        Default: None
+
+        Returns:
+            Number of rows appended, 0 if the archive is disabled.
+        """
+        if not self.enabled:
+            return 0
+        forecast = Forecast(payload)
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        blocks = [(code, getattr(forecast, block))
+                  for block, code in BLOCKS.items()]
+        blocks = [(code, series) for code, series in blocks if len(series)]
+        length = sum(len(series) for _, series in blocks)
+        if not length:
+            return 0
+
+        fields = sorted({field for _, series in blocks
+                         for field in series.columns
+                         if field != 'time' and field.isidentifier()})
+        columns = {field: np.concatenate([
+            series.columns[field].astype(FIELD_DTYPE)
+            if field in series.columns
+            else np.full(len(series), np.nan, FIELD_DTYPE)
+            for _, series in blocks]) for field in fields}
+        # Data points without a time are stamped with the fetch time.
+        columns['time'] = np.concatenate([
+            np.nan_to_num(series.columns['time'], nan=fetched_at)
+            if 'time' in series.columns
+            else np.full(len(series), fetched_at)
+            for _, series in blocks]).astype(np.int64)
+        columns['latitude'] = np.full(length, np.nan if forecast.latitude
+                                      is None else forecast.latitude)
+        columns['longitude'] = np.full(length, np.nan if forecast.longitude
+                                       is None else forecast.longitude)
+        columns['block'] = np.concatenate([np.full(len(series), code)
+                                           for code, series in blocks])
+
+        with self._lock:
+            rows = self._open()
+            fetched_at = max(fetched_at, self._last_fetched_at(rows))
+            columns['fetched_at'] = np.full(length, fetched_at)
+            existing = set(self.columns())
+            for column in [*existing - set(columns), *fields]:
+                if column not in existing:
+                    # New fields are backfilled for the earlier rows.
+                    self._align(column, rows)
+                values = columns.get(column)
+                if values is None:
+                    values = np.full(length, np.nan)
+                self._append(column, values)
+            for column in ('time', 'latitude', 'longitude', 'block'):
+                self._append(column, columns[column])
+            self._append('fetched_at', columns['fetched_at'])
+            self._rows = rows + length
+        return length
+
+    def _append(self, column: str, values: np.ndarray) -> None:
+        """Appends values to the end of the column."""
+        with open(self._path(column), 'ab') as file:
+            file.write(values.astype(self._dtype(column)).tobytes())
+
+    def _last_fetched_at(self, rows: int) -> float:
+        """Returns fetch time of the last row, keeping the index sorted."""
+        if not rows:
+            return float('-inf')
+        return float(self._column('fetched_at', rows)[-1])
+
+    def _column(self, column: str, rows: int) -> np.ndarray:
+        """Returns memory map of the first rows of the column."""
+        if not rows:
+            return np.empty(0, self._dtype(column))
+        return np.memmap(self._path(column), self._dtype(column), mode='r',
+                         shape=(rows,))
+
+    def query(self,
+              start: Optional[float] = None,
+              end: Optional[float] = None,
+              fields: Optional[Sequence[str]] = None,
+              block: Optional[str] = None,
+              geohash: Optional[str] = None) -> Dict[str, np.ndarray]:
+        """Returns archived rows fetched within the time range.
+
+        The rows fetched between ``start`` & ``end`` are found by
+        bisecting the sorted ``fetched_at`` column and returned as
+        slices of the memory mapped columns, hence nothing is copied or
+        parsed. Filtering by ``block`` or ``geohash`` selects the rows
+        & copies them.
+
+        Args:
+            start: UNIX time from which the rows are returned.
+                   Default: None
+            end: UNIX time before which the rows are returned.
+                 Default: None
+            fields: Fields to be returned along with the index columns.
+                    All the fields are returned if ``None`` is passed.
+                    Default: None
+            block: Only rows of the ``currently``, ``hourly`` or
+                   ``daily`` block are returned if passed.
+                   Default: None
+            geohash: Only rows of the locations within the geohash cell
+                     are returned if passed.
+                     Default: None
+
+        Returns:
+            Dictionary of column name to its array of values.
+        """
+        if block is not None and block not in BLOCKS:
+            raise ValueError(f'Unknown forecast block "{block}".')
+        with self._lock:
+            rows = self._open()
+            available = self.columns()
+        if fields is None:
+            fields = available[len(INDEX_COLUMNS):]
+        for field in fields:
+            if field not in available:
+                raise KeyError(f'Field "{field}" is not archived.')
+
+        fetched_at = self._column('fetched_at', rows)
+        lower = (0 if start is None
+                 else int(np.searchsorted(fetched_at, start, 'left')))
+        upper = (rows if end is None
+                 else int(np.searchsorted(fetched_at, end, 'left')))
+        result = {column: self._column(column, rows)[lower:upper]
+                  for column in [*INDEX_COLUMNS, *fields]}
+
+        mask = None
+        if block is not None:
+            mask = result['block'] == BLOCKS[block]
+        if geohash is not None:
+            latitude, longitude, lat_error, lon_error = decode(geohash)
+            inside = ((np.abs(result['latitude'] - latitude) <= lat_error)
+                      & (np.abs(result['longitude'] - longitude)
+                         <= lon_error))
+            mask = inside if mask is None else mask & inside
+        if mask is not None:
+            result = {column: values[mask]
+                      for column, values in result.items()}
+        return result
+
+
+# Shared archive for the fetched forecasts.
+forecast_archive = ForecastArchive()
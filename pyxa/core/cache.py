@@ -0,0 +1,528 @@
+# Copyright 2020 XAMES3. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ======================================================================
+"""
+The `pyxa.core.cache` module caches the upstream API responses.
+
+The caches in this module save repeated network round trips & API quota
+by reusing responses which were fetched recently.
+"""
+# The following comment should be removed at some point in the future.
+# pylint: disable=import-error
+# pylint: disable=no-name-in-module
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple
+
+from pyxa.core.geohash import encode
+from pyxa.utils.settings import (CACHE_PATH, DATABASE_FILE_PATH,
+                                 DEFAULT_CHARSET, DEFAULT_FORECAST_DISK_BYTES,
+                                 DEFAULT_FORECAST_MEMORY_ENTRIES,
+                                 DEFAULT_FORECAST_PRECISION,
+                                 DEFAULT_FORECAST_TTL,
+                                 DEFAULT_GEOCODE_PRECISION,
+                                 DEFAULT_GEOCODE_TTL, DEFAULT_TRACKED_CELLS,
+                                 DEFAULT_TRACKED_PRECISIONS)
+
+
+class PrecisionTracker(object):
+    """Hit ratio estimator across the geohash precisions.
+
+    Every lookup is checked against the recently stored cells at each of
+    the tracked precisions, as if the cache was keyed on that precision.
+    This shows how many upstream calls a coarser or a finer key would
+    save or cost, without having to run the cache with it.
+
+    Args:
+        precisions: Geohash precisions to be tracked.
+                    Default: (4, 5, 6, 7, 8)
+        ttl: Seconds for which a stored cell counts as a hit.
+             Default: 600
+        max_cells: Number of recent cells remembered per precision.
+                   Default: 4096
+    """
+
+    def __init__(self,
+                 precisions: Optional[Sequence[int]] = (
+                     DEFAULT_TRACKED_PRECISIONS),
+                 ttl: Optional[float] = DEFAULT_FORECAST_TTL,
+                 max_cells: Optional[int] = DEFAULT_TRACKED_CELLS) -> None:
+        self.precisions = tuple(precisions)
+        self.ttl = ttl
+        self.max_cells = max_cells
+        self._cells = {precision: OrderedDict()
+                       for precision in self.precisions}
+        self._counts = {precision: [0, 0] for precision in self.precisions}
+        self._lock = threading.Lock()
+
+    def lookup(self,
+               latitude: float,
+               longitude: float,
+               suffix: Optional[str] = '') -> None:
+        """Counts lookup of the coordinates as a hit or a miss."""
+        now = time.time()
+        with self._lock:
+            for precision in self.precisions:
+                cell = f'{encode(latitude, longitude, precision)}{suffix}'
+                stored_at = self._cells[precision].get(cell)
+                hit = stored_at is not None and now - stored_at < self.ttl
+                self._counts[precision][0 if hit else 1] += 1
+
+    def store(self,
+              latitude: float,
+              longitude: float,
+              suffix: Optional[str] = '') -> None:
+        """Remembers the coordinates as stored at every precision."""
+        now = time.time()
+        with self._lock:
+            for precision in self.precisions:
+                cells = self._cells[precision]
+                cell = f'{encode(latitude, longitude, precision)}{suffix}'
+                cells[cell] = now
+                cells.move_to_end(cell)
+                while len(cells) > self.max_cells:
+                    cells.popitem(last=False)
+
+    def clear(self) -> None:
+        """Forgets the stored cells and resets the counters."""
+        with self._lock:
+            for precision in self.precisions:
+                self._cells[precision].clear()
+                self._counts[precision] = [0, 0]
+
+    def stats(self) -> Dict[int, Dict[str, float]]:
+        """Returns estimated hits, misses & hit ratio per precision."""
+        with self._lock:
+            return {precision: {'hits': hits,
+                                'misses': misses,
+                                'hit_ratio': (hits / (hits + misses)
+                                              if hits + misses else 0.0)}
+                    for precision, (hits, misses) in self._counts.items()}
+
+
+class ForecastCache(object):
+    """Two-tier TTL cache for weather forecast payloads.
+
+    Payloads are kept in an in-memory LRU which sits in front of a disk
+    store of JSON files. Entries are keyed on the geohash cell of the
+    coordinates and the units of the forecast, hence nearby locations
+    share a forecast. Entries expire after ``ttl`` seconds in both the
+    tiers.
+
+    Only the in-memory LRU is guarded by the cache lock, the disk store
+    is read & written outside of it so that memory hits never wait on
+    disk I/O. Sizes of the stored files are tracked as they are written,
+    hence the store is scanned once instead of on every write.
+
+    Args:
+        ttl: Seconds after which a cached forecast expires.
+             Default: 600
+        precision: Geohash precision of the cache key.
+                   Default: 5
+        max_entries: Maximum number of forecasts held in memory.
+                     Default: 256
+        max_disk_bytes: Maximum size of the disk store in bytes. Oldest
+                        files are evicted first once it is exceeded.
+                        Default: 50 MB
+        directory: Directory of the disk store. Disk store is disabled
+                   if ``None`` is passed.
+                   Default: CACHE_PATH
+
+    Example:
+        >>> from pyxa.core.cache import ForecastCache
+        >>> cache = ForecastCache(ttl=300)
+        >>> cache.set(51.5119, -0.0808, 'si', {'currently': {}})
+        >>> cache.get(51.5123, -0.0812, 'si')
+        {'currently': {}}
+        >>> cache.stats()
+        {'hits': 1, 'misses': 0, 'memory_hits': 1, 'disk_hits': 0, ...,
+         'by_precision': {4: {'hits': 1, 'misses': 0, ...}, ...}}
+    """
+
+    def __init__(self,
+                 ttl: Optional[float] = DEFAULT_FORECAST_TTL,
+                 precision: Optional[int] = DEFAULT_FORECAST_PRECISION,
+                 max_entries: Optional[int] = DEFAULT_FORECAST_MEMORY_ENTRIES,
+                 max_disk_bytes: Optional[int] = DEFAULT_FORECAST_DISK_BYTES,
+                 directory: Optional[str] = CACHE_PATH) -> None:
+        self.ttl = ttl
+        self.precision = precision
+        self.max_entries = max_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.directory = directory
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        # Sizes of the files in the disk store ordered from the oldest,
+        # loaded on the first write & guarded by their own lock.
+        self._disk_lock = threading.Lock()
+        self._disk_files = None
+        self._disk_bytes = 0
+        self.tracker = PrecisionTracker(ttl=ttl)
+        self.hits = self.misses = self.memory_hits = self.disk_hits = 0
+
+    def key(self, latitude: float, longitude: float, units: str) -> str:
+        """Returns cache key for the location and units."""
+        return f'{encode(latitude, longitude, self.precision)}_{units}'
+
+    def _path(self, key: str) -> str:
+        """Returns path of the disk store file for the key."""
+        return os.path.join(self.directory, f'forecast_{key}.json')
+
+    def _read_disk(self, key: str) -> Optional[Tuple[float, Any]]:
+        """Reads entry from the disk store."""
+        if self.directory is None:
+            return None
+        try:
+            with open(self._path(key), encoding=DEFAULT_CHARSET) as file:
+                entry = json.load(file)
+        except (OSError, ValueError):
+            return None
+        return entry['fetched_at'], entry['payload']
+
+    def _write_disk(self, key: str, fetched_at: float, payload: Any) -> None:
+        """Writes entry to the disk store and evicts the oldest files."""
+        if self.directory is None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        temp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'w', encoding=DEFAULT_CHARSET) as file:
+            json.dump({'fetched_at': fetched_at, 'payload': payload}, file)
+        os.replace(temp_path, path)
+        size = os.path.getsize(path)
+
+        with self._disk_lock:
+            if self._disk_files is None:
+                self._scan_disk()
+            self._disk_bytes += size - self._disk_files.pop(path, 0)
+            self._disk_files[path] = size
+            if self._disk_bytes > self.max_disk_bytes:
+                self._evict_disk()
+
+    def _scan_disk(self) -> None:
+        """Loads sizes of the files already in the disk store."""
+        files = []
+        for entry in os.scandir(self.directory):
+            if not (entry.name.startswith('forecast_')
+                    and entry.name.endswith('.json')):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, entry.path, stat.st_size))
+        self._disk_files = OrderedDict((path, size)
+                                       for _, path, size in sorted(files))
+        self._disk_bytes = sum(self._disk_files.values())
+
+    def _evict_disk(self) -> None:
+        """Deletes the oldest files until the store fits its size."""
+        while self._disk_files and self._disk_bytes > self.max_disk_bytes:
+            path, size = self._disk_files.popitem(last=False)
+            self._disk_bytes -= size
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+
+    def _remember(self, key: str, fetched_at: float, payload: Any) -> None:
+        """Stores entry in the in-memory LRU."""
+        self._memory[key] = (fetched_at, payload)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, latitude: float, longitude: float, units: str) -> Any:
+        """Returns cached forecast payload or ``None`` if not cached."""
+        key = self.key(latitude, longitude, units)
+        now = time.time()
+        self.tracker.lookup(latitude, longitude, units)
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                self.memory_hits += 1
+                return entry[1]
+
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is not None and now - entry[0] < self.ttl:
+                self._remember(key, *entry)
+                self.hits += 1
+                self.disk_hits += 1
+                return entry[1]
+
+            # Expired entries are left to the LRU, so that they can still
+            # be served stale through ``lookup`` while being refreshed.
+            self.misses += 1
+            return None
+
+    def lookup(self,
+               latitude: float,
+               longitude: float,
+               units: str) -> Optional[Tuple[float, Any]]:
+        """Returns ``(fetched_at, payload)`` entry even if it expired.
+
+        This doesn't count towards the hits & misses and is meant for
+        serving stale forecasts while they are being refreshed.
+        """
+        key = self.key(latitude, longitude, units)
+
+        with self._lock:
+            entry = self._memory.get(key)
+        if entry is not None:
+            return entry
+
+        entry = self._read_disk(key)
+        if entry is not None:
+            with self._lock:
+                # A fresher entry may have been stored in the meantime.
+                if key in self._memory:
+                    return self._memory[key]
+                self._remember(key, *entry)
+        return entry
+
+    def set(self,
+            latitude: float,
+            longitude: float,
+            units: str,
+            payload: Any) -> None:
+        """Caches forecast payload in both the tiers."""
+        key = self.key(latitude, longitude, units)
+        fetched_at = time.time()
+        self.tracker.store(latitude, longitude, units)
+
+        with self._lock:
+            self._remember(key, fetched_at, payload)
+        try:
+            self._write_disk(key, fetched_at, payload)
+        except OSError:
+            # A read-only or full disk should only cost the second tier,
+            # never the forecast itself.
+            pass
+
+    def clear(self) -> None:
+        """Empties both the tiers and resets the counters."""
+        with self._lock:
+            self._memory.clear()
+            self.tracker.clear()
+            self.hits = self.misses = self.memory_hits = self.disk_hits = 0
+        with self._disk_lock:
+            self._disk_files = None
+            self._disk_bytes = 0
+            if self.directory is not None and os.path.isdir(self.directory):
+                for entry in os.scandir(self.directory):
+                    if entry.name.startswith('forecast_'):
+                        os.remove(entry.path)
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns hit & miss counters of the cache."""
+        total = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'hit_ratio': self.hits / total if total else 0.0,
+                'entries': len(self._memory),
+                'precision': self.precision,
+                'by_precision': self.tracker.stats()}
+
+
+def normalize_address(address: str) -> str:
+    """Returns normalized address used as the geocode cache key."""
+    address = re.sub(r'\s+', ' ', str(address).lower())
+    address = re.sub(r'\s*,\s*', ', ', address)
+    return address.strip(' ,.;')
+
+
+class GeocodeCache(object):
+    """SQLite backed cache for geocode & reverse geocode lookups.
+
+    Geocoded addresses and the reverse looked up zone names are stored
+    in the project database so that they survive restarts. Addresses
+    are normalized before lookup, hence ``'Fenchurch St,London'`` and
+    ``' fenchurch st, london '`` share the same entry. Zone names are
+    keyed on the geohash cell of the coordinates.
+
+    Args:
+        path: Path of the SQLite database file.
+              Default: DATABASE_FILE_PATH
+        ttl: Seconds after which a cached lookup expires.
+             Default: 30 days
+        precision: Geohash precision of the reverse lookups.
+                   Default: 7
+
+    Example:
+        >>> from pyxa.core.cache import GeocodeCache
+        >>> cache = GeocodeCache()
+        >>> cache.seed([('Fenchurch St, London', 51.5119, -0.0808)])
+        >>> cache.get_coordinates('fenchurch st,london')
+        (51.5119, -0.0808)
+    """
+
+    def __init__(self,
+                 path: Optional[str] = DATABASE_FILE_PATH,
+                 ttl: Optional[float] = DEFAULT_GEOCODE_TTL,
+                 precision: Optional[int] = DEFAULT_GEOCODE_PRECISION) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.precision = precision
+        self._connection = None
+        self._lock = threading.Lock()
+        self.tracker = PrecisionTracker(ttl=ttl)
+        self.hits = self.misses = 0
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """Returns connection to the database, opening it if needed."""
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._connection = sqlite3.connect(self.path,
+                                               check_same_thread=False)
+            self._connection.executescript(
+                'CREATE TABLE IF NOT EXISTS geocode ('
+                '    address TEXT PRIMARY KEY,'
+                '    latitude REAL NOT NULL,'
+                '    longitude REAL NOT NULL,'
+                '    cached_at REAL NOT NULL);'
+                'CREATE TABLE IF NOT EXISTS reverse_geocode_cell ('
+                '    geohash TEXT NOT NULL,'
+                '    zone TEXT NOT NULL,'
+                '    name TEXT NOT NULL,'
+                '    cached_at REAL NOT NULL,'
+                '    PRIMARY KEY (geohash, zone));')
+        return self._connection
+
+    def cell(self, latitude: float, longitude: float) -> str:
+        """Returns geohash cell of the coordinates for reverse lookups."""
+        return encode(latitude, longitude, self.precision)
+
+    def _fetch(self, query: str, params: Tuple) -> Optional[Tuple]:
+        """Returns the unexpired row for the query and counts it."""
+        try:
+            with self._lock:
+                row = self.connection.execute(query, params).fetchone()
+        except (OSError, sqlite3.Error):
+            row = None
+        if row is not None and time.time() - row[-1] < self.ttl:
+            self.hits += 1
+            return row
+        self.misses += 1
+        return None
+
+    def get_coordinates(self, address: str) -> Optional[Tuple[float, float]]:
+        """Returns cached latitude & longitude of the address."""
+        row = self._fetch('SELECT latitude, longitude, cached_at '
+                          'FROM geocode WHERE address = ?',
+                          (normalize_address(address),))
+        return None if row is None else (row[0], row[1])
+
+    def set_coordinates(self,
+                        address: str,
+                        latitude: float,
+                        longitude: float) -> None:
+        """Caches latitude & longitude of the address."""
+        try:
+            self.seed([(address, latitude, longitude)])
+        except (OSError, sqlite3.Error):
+            pass
+
+    def get_zone(self,
+                 latitude: float,
+                 longitude: float,
+                 zone: Optional[str] = None) -> Optional[str]:
+        """Returns cached zone name for the coordinates."""
+        self.tracker.lookup(latitude, longitude, f'_{zone or ""}')
+        row = self._fetch('SELECT name, cached_at FROM reverse_geocode_cell '
+                          'WHERE geohash = ? AND zone = ?',
+                          (self.cell(latitude, longitude), zone or ''))
+        return None if row is None else row[0]
+
+    def set_zone(self,
+                 latitude: float,
+                 longitude: float,
+                 zone: Optional[str],
+                 name: str) -> None:
+        """Caches zone name for the coordinates."""
+        try:
+            self.seed_zones([(latitude, longitude, zone, name)])
+        except (OSError, sqlite3.Error):
+            pass
+
+    def seed(self, entries: Iterable[Tuple[str, float, float]]) -> None:
+        """Bulk loads ``(address, latitude, longitude)`` entries."""
+        now = time.time()
+        rows = [(normalize_address(address), float(latitude),
+                 float(longitude), now)
+                for address, latitude, longitude in entries]
+        with self._lock, self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO geocode '
+                                        'VALUES (?, ?, ?, ?)', rows)
+
+    def seed_zones(self,
+                   entries: Iterable[Tuple[float, float, Optional[str], str]]
+                   ) -> None:
+        """Bulk loads ``(latitude, longitude, zone, name)`` entries."""
+        now = time.time()
+        entries = list(entries)
+        rows = [(self.cell(latitude, longitude), zone or '', name, now)
+                for latitude, longitude, zone, name in entries]
+        with self._lock, self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO '
+                                        'reverse_geocode_cell '
+                                        'VALUES (?, ?, ?, ?)', rows)
+        for latitude, longitude, zone, _ in entries:
+            self.tracker.store(latitude, longitude, f'_{zone or ""}')
+
+    def purge(self) -> None:
+        """Deletes the expired lookups from the database."""
+        expiry = time.time() - self.ttl
+        with self._lock, self.connection:
+            self.connection.execute('DELETE FROM geocode '
+                                    'WHERE cached_at < ?', (expiry,))
+            self.connection.execute('DELETE FROM reverse_geocode_cell '
+                                    'WHERE cached_at < ?', (expiry,))
+
+    def close(self) -> None:
+        """Closes the database connection, reopened on the next use."""
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns hit & miss counters of the cache."""
+        total = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0,
+                'precision': self.precision,
+                'by_precision': self.tracker.stats()}
+
+
+# Shared caches used by the ``pyxa.core`` functions.
+forecast_cache = ForecastCache()
+geocode_cache = GeocodeCache()
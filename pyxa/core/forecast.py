@@ -0,0 +1,323 @@
+# Copyright 2020 XAMES3. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ======================================================================
+"""
+The `pyxa.core.forecast` module holds the parsed weather forecast.
+
+The weather API returns the current, hourly & daily forecast in a single
+payload. The classes in this module parse that payload once into array
+backed columns so that any horizon can be queried without refetching.
+"""
+# The following comment should be removed at some point in the future.
+# pylint: disable=import-error
+# pylint: disable=no-name-in-module
+
+import copy
+from datetime import datetime
+from numbers import Real
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from pyxa.core.location import get_part_of_day
+from pyxa.core.places import local_time
+from pyxa.utils.system import resolve_number_of_days
+
+# Units used by the weather API mapped to the formatting suffixes.
+UNIT_SUFFIXES = {'si': ('°C', 'kph'), 'us': ('°F', 'mph')}
+
+# Units the forecasts are fetched & cached in, others are converted.
+CANONICAL_UNITS = 'si'
+
+# Fields of the SI payload mapped to the ``(scale, offset)`` converting
+# them to the US units. Pressure & ozone use the same units in both.
+_TEMPERATURE = (1.8, 32.0)
+SI_TO_US = {
+    'temperature': _TEMPERATURE,
+    'apparentTemperature': _TEMPERATURE,
+    'dewPoint': _TEMPERATURE,
+    'temperatureHigh': _TEMPERATURE,
+    'temperatureLow': _TEMPERATURE,
+    'temperatureMax': _TEMPERATURE,
+    'temperatureMin': _TEMPERATURE,
+    'apparentTemperatureHigh': _TEMPERATURE,
+    'apparentTemperatureLow': _TEMPERATURE,
+    'apparentTemperatureMax': _TEMPERATURE,
+    'apparentTemperatureMin': _TEMPERATURE,
+    # Meters per second to miles per hour.
+    'windSpeed': (2.2369363, 0.0),
+    'windGust': (2.2369363, 0.0),
+    # Kilometers to miles.
+    'visibility': (0.6213712, 0.0),
+    'nearestStormDistance': (0.6213712, 0.0),
+    # Millimeters per hour to inches per hour.
+    'precipIntensity': (0.0393701, 0.0),
+    'precipIntensityMax': (0.0393701, 0.0),
+    'precipIntensityError': (0.0393701, 0.0),
+    # Centimeters to inches.
+    'precipAccumulation': (0.3937008, 0.0),
+}
+
+
+def wind_direction(degree: Union[float, int]) -> str:
+    """Returns direction of the wind."""
+    directions = ['northern', 'northeastern', 'eastern', 'southeastern',
+                  'southern', 'southwestern', 'western', 'northwestern']
+    idx = int((degree + 11.25) / 22.5)
+    return directions[idx % len(directions)]
+
+
+def describe_condition(summary: str) -> str:
+    """Returns the summary rephrased as a spoken weather condition."""
+    condition = f'{summary.lower()[:-1]}'
+
+    if condition.startswith('possible'):
+        old, new = "possible", "possible to have"
+        condition = f'{condition.replace(old, new)} weather'
+
+    if condition.startswith('rain'):
+        condition = condition.replace('rain', 'rainy weather')
+
+    if condition.endswith('cloudy'):
+        condition = condition + ' weather'
+
+    if condition.startswith('light'):
+        old, new = "light", "possible to have light"
+        condition = f'{condition.replace(old, new)} weather'
+
+    if condition.startswith('heavy'):
+        old, new = "heavy", "possible to have heavy"
+        condition = f'{condition.replace(old, new)} weather'
+
+    return condition
+
+
+class Series(object):
+    """Column store for a block of the forecast payload.
+
+    Every numeric field of the rows is stored as a ``float64`` array,
+    missing values being ``NaN``, or as an ``int64`` array if all of
+    its values are integers. Text fields like ``summary`` & ``icon`` are
+    kept as plain lists.
+
+    Args:
+        rows: List of data points, i.e. ``payload['hourly']['data']``.
+
+    Example:
+        >>> series = Series([{'temperature': 2.02, 'summary': 'Rain.'},
+                             {'temperature': 3.1, 'summary': 'Clear.'}])
+        >>> series['temperature']
+        array([2.02, 3.1 ])
+        >>> series.row(1)
+        {'temperature': 3.1, 'summary': 'Clear.'}
+    """
+
+    def __init__(self, rows: List[Dict[str, Any]]) -> None:
+        self._length = len(rows)
+        numeric, text = {}, {}
+
+        for row in rows:
+            for field, value in row.items():
+                if isinstance(value, Real) and not isinstance(value, bool):
+                    numeric[field] = (numeric.get(field, True)
+                                      and isinstance(value, int))
+                elif isinstance(value, str):
+                    text.setdefault(field, None)
+
+        self.columns = {}
+        for field, integral in numeric.items():
+            values = [row.get(field, np.nan) for row in rows]
+            # Fields like ``time`` stay integers unless a value is absent.
+            if integral and not any(value is np.nan for value in values):
+                self.columns[field] = np.array(values, dtype=np.int64)
+            else:
+                self.columns[field] = np.array(values, dtype=np.float64)
+        self.text = {field: [row.get(field) for row in rows]
+                     for field in text}
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __contains__(self, field: str) -> bool:
+        return field in self.columns or field in self.text
+
+    def __getitem__(self, field: str) -> Union[np.ndarray, List[str]]:
+        """Returns the complete series of the field."""
+        if field in self.columns:
+            return self.columns[field]
+        return self.text[field]
+
+    def convert(self, conversions: Dict[str, Tuple[float, float]]
+                ) -> 'Series':
+        """Returns copy with the columns linearly converted.
+
+        Every listed column is converted in a single vectorized
+        operation and rounded to 2 decimals like the API values.
+
+        Args:
+            conversions: Mapping of field to its ``(scale, offset)``.
+        """
+        series = copy.copy(self)
+        series.columns = {
+            field: (np.round(values * conversions[field][0]
+                             + conversions[field][1], 2)
+                    if field in conversions else values)
+            for field, values in self.columns.items()}
+        return series
+
+    def row(self, idx: int) -> Dict[str, Any]:
+        """Returns data point at the index as a dictionary."""
+        row = {field: values[idx] for field, values in self.text.items()}
+        row.update((field, values[idx].item())
+                   for field, values in self.columns.items()
+                   if values.dtype.kind == 'i' or not np.isnan(values[idx]))
+        return row
+
+
+class Forecast(object):
+    """Weather forecast parsed once from the API payload.
+
+    The forecast is fetched once in SI units, ``convert`` turns it into
+    the US units locally. Only the numeric series are converted, the
+    free text summaries stay as the API wrote them.
+
+    Args:
+        payload: JSON payload returned by the weather API.
+        units: Units of the payload, ``si`` or ``us``.
+               Default: si
+        zone: Name of the zone the forecast is for.
+              Default: None
+
+    Example:
+        >>> from pyxa.core.weather import get_forecast
+        >>> london = get_forecast(maps_key, darksky_key, 'London')
+        >>> london.hourly['temperature']
+        array([ 2.02,  2.3 ,  2.71, ...])
+        >>> london.day(3)['apparentTemperatureMax']
+        5.33
+        >>> london.summarize(days=1)
+        ('London', 0, '2.02°C', '-0.46°C', '12.94°C', '5.33°C', '92.0%',
+         ...)
+        >>> london.convert('us').day(3)['apparentTemperatureMax']
+        41.59
+    """
+
+    def __init__(self,
+                 payload: Dict[str, Any],
+                 units: Optional[str] = 'si',
+                 zone: Optional[str] = None) -> None:
+        self.payload = payload
+        self.units = units
+        self.zone = zone
+        self.latitude = payload.get('latitude')
+        self.longitude = payload.get('longitude')
+        self.currently = Series([payload.get('currently', {})])
+        self.hourly = Series(payload.get('hourly', {}).get('data', []))
+        self.daily = Series(payload.get('daily', {}).get('data', []))
+        self.summary = payload.get('daily', {}).get('summary', '')
+
+    def convert(self, units: str) -> 'Forecast':
+        """Returns the forecast converted to ``si`` or ``us`` units."""
+        if units == self.units:
+            return self
+        if (self.units, units) == ('si', 'us'):
+            conversions = SI_TO_US
+        elif (self.units, units) == ('us', 'si'):
+            conversions = {field: (1.0 / scale, -offset / scale)
+                           for field, (scale, offset) in SI_TO_US.items()}
+        else:
+            raise ValueError(f'Cannot convert "{self.units}" forecast to '
+                             f'"{units}".')
+        forecast = copy.copy(self)
+        forecast.units = units
+        forecast.currently = self.currently.convert(conversions)
+        forecast.hourly = self.hourly.convert(conversions)
+        forecast.daily = self.daily.convert(conversions)
+        return forecast
+
+    def local_time(self) -> Optional[datetime]:
+        """Returns current time at the forecast's location, if known."""
+        if self.latitude is None or self.longitude is None:
+            return None
+        return local_time(self.latitude, self.longitude)
+
+    def now(self) -> Dict[str, Any]:
+        """Returns the current conditions."""
+        return self.currently.row(0)
+
+    def hour(self, hours: int) -> Dict[str, Any]:
+        """Returns the forecast ``hours`` from now."""
+        return self.hourly.row(hours)
+
+    def day(self, days: int) -> Dict[str, Any]:
+        """Returns the forecast ``days`` from today."""
+        return self.daily.row(days)
+
+    def _select(self,
+                days: Optional[int] = None,
+                hours: Optional[int] = None
+                ) -> Tuple[Dict[str, Any], int, Dict[str, Any]]:
+        """Returns data point, its index type and the matching day."""
+        if days and days < len(self.daily) and days > 0:
+            return self.day(days), 0, self.day(days)
+        elif hours and hours < len(self.hourly):
+            return self.hour(hours), 1, self.day(0)
+        else:
+            return self.now(), 2, self.day(0)
+
+    def condition(self,
+                  days: Optional[int] = None,
+                  hours: Optional[int] = None) -> str:
+        """Returns spoken weather condition for the horizon."""
+        data, _, _ = self._select(days, hours)
+        return describe_condition(data['summary'])
+
+    def summarize(self,
+                  days: Optional[int] = None,
+                  hours: Optional[int] = None) -> Tuple:
+        """Returns formatted forecast for the horizon.
+
+        The values are formatted only when this is called, hence the
+        same ``Forecast`` can be summarized for any number of horizons.
+        Part of the day & the weekday are resolved in the local time of
+        the forecast's location, looked up offline.
+
+        Returns:
+            Tuple of zone, index type (0: days, 1: hours, 2: current),
+            temperature, apparent temperature, maximum & minimum
+            apparent temperature, humidity, wind speed, summary, sky,
+            wind direction, part of the day, day and its suffix.
+        """
+        degree, per_hr = UNIT_SUFFIXES[self.units]
+        data, idx, value = self._select(days, hours)
+        current = data if idx == 1 else self.now()
+
+        temp = f'{current["temperature"]}{degree}'
+        feel = f'{current["apparentTemperature"]}{degree}'
+        max_temp = f'{value["apparentTemperatureMax"]}{degree}'
+        min_temp = f'{value["apparentTemperatureMin"]}{degree}'
+        humidity = f'{data["humidity"] * 100}%'
+        speed = f'{data["windSpeed"]} {per_hr}'
+        summary = str(self.summary).lower()
+        sky = 'brighter' if data['cloudCover'] < 0.5 else 'darker'
+        direction = wind_direction(data['windBearing'])
+        now = self.local_time()
+        part = get_part_of_day(now)
+        day = resolve_number_of_days(days, now)
+        sub = 'day' if days == 1 else 'days'
+
+        return (self.zone, idx, temp, feel, max_temp, min_temp, humidity,
+                speed, summary, sky, direction, part, day, sub)
@@ -0,0 +1,200 @@
+# Copyright 2020 XAMES3. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ======================================================================
+"""
+The `pyxa.core.geodesy` module computes great-circle distances offline.
+
+The functions in this module use the haversine formula over NumPy arrays
+so complete distance matrices for thousands of coordinates are computed
+in a single vectorized call, without any routed API request.
+"""
+# The following comment should be removed at some point in the future.
+# pylint: disable=import-error
+# pylint: disable=no-name-in-module
+
+from typing import Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from pyxa.constants import EARTH_RADIUS_KM
+
+ArrayLike = Union[Sequence, np.ndarray]
+
+# Number of origins handled at once by ``nearest_k`` to bound memory.
+NEAREST_CHUNK_SIZE = 1024
+
+# Number of cells of the distance matrix whose haversine terms are
+# evaluated at once, bounding the temporary arrays.
+MATRIX_CHUNK_CELLS = 1 << 20
+
+
+def _as_coordinates(coordinates: ArrayLike) -> np.ndarray:
+    """Returns coordinates as (N, 2) array of degrees."""
+    return np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+
+
+def to_unit_vectors(latitudes: ArrayLike,
+                    longitudes: ArrayLike) -> np.ndarray:
+    """Returns 3D unit vectors of the coordinates on a sphere."""
+    latitudes = np.radians(latitudes, dtype=np.float64)
+    longitudes = np.radians(longitudes, dtype=np.float64)
+    cos_lat = np.cos(latitudes)
+    return np.column_stack((cos_lat * np.cos(longitudes),
+                            cos_lat * np.sin(longitudes),
+                            np.sin(latitudes)))
+
+
+def haversine(latitude_1: ArrayLike,
+              longitude_1: ArrayLike,
+              latitude_2: ArrayLike,
+              longitude_2: ArrayLike) -> np.ndarray:
+    """Returns great-circle distance in meters between the coordinates.
+
+    The arguments are broadcasted against each other, hence scalars,
+    vectors and grids of coordinates can be mixed freely.
+
+    Example:
+        >>> from pyxa.core.geodesy import haversine
+        >>> haversine(51.5074, -0.1278, 48.8566, 2.3522)
+        343556.53...
+    """
+    latitude_1, longitude_1, latitude_2, longitude_2 = map(
+        np.radians, (latitude_1, longitude_1, latitude_2, longitude_2))
+    value = (np.sin((latitude_2 - latitude_1) / 2.0) ** 2
+             + np.cos(latitude_1) * np.cos(latitude_2)
+             * np.sin((longitude_2 - longitude_1) / 2.0) ** 2)
+    return 2000.0 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(value, 0, 1)))
+
+
+def distance_matrix(origins: ArrayLike,
+                    destinations: Optional[ArrayLike] = None) -> np.ndarray:
+    """Returns pairwise great-circle distances in meters.
+
+    The haversine formula is evaluated on blocks of origins against all
+    the destinations, working in place on the rows of the result. Unlike
+    the dot product of unit vectors it keeps its precision at short
+    range, identical coordinates are exactly 0 meters apart.
+
+    Args:
+        origins: Array-like of shape (N, 2) of latitude & longitude.
+        destinations: Array-like of shape (M, 2) of latitude &
+                      longitude. Origins are used if ``None`` is passed.
+                      Default: None
+
+    Example:
+        >>> from pyxa.core.geodesy import distance_matrix
+        >>> distance_matrix([[51.5074, -0.1278], [48.8566, 2.3522]])
+        array([[     0.        , 343556.53...],
+               [343556.53...,      0.        ]])
+
+    Returns:
+        Array of shape (N, M) holding the distances.
+    """
+    origins = _as_coordinates(origins)
+    destinations = (origins if destinations is None
+                    else _as_coordinates(destinations))
+    latitude_1, longitude_1 = np.radians(origins).T
+    latitude_2, longitude_2 = np.radians(destinations).T
+    cos_latitude_1, cos_latitude_2 = np.cos(latitude_1), np.cos(latitude_2)
+
+    meters = np.empty((len(origins), len(destinations)), dtype=np.float64)
+    rows = max(1, MATRIX_CHUNK_CELLS // max(1, len(destinations)))
+    for start in range(0, len(origins), rows):
+        stop = start + rows
+        block = meters[start:stop]
+        # sin²(Δlatitude / 2), written straight into the result rows.
+        np.subtract(latitude_2, latitude_1[start:stop, None], out=block)
+        block *= 0.5
+        np.sin(block, out=block)
+        np.square(block, out=block)
+        # cos(latitude_1)·cos(latitude_2)·sin²(Δlongitude / 2)
+        term = np.subtract(longitude_2, longitude_1[start:stop, None])
+        term *= 0.5
+        np.sin(term, out=term)
+        np.square(term, out=term)
+        term *= cos_latitude_2
+        term *= cos_latitude_1[start:stop, None]
+        block += term
+        np.clip(block, 0.0, 1.0, out=block)
+        np.sqrt(block, out=block)
+        np.arcsin(block, out=block)
+        block *= 2000.0 * EARTH_RADIUS_KM
+    return meters
+
+
+def nearest_k(origins: ArrayLike,
+              candidates: ArrayLike,
+              k: Optional[int] = 5) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns ``k`` nearest candidates for every origin.
+
+    Distances are computed in chunks of origins and only partially
+    sorted, hence it scales to thousands of origins & candidates.
+
+    Args:
+        origins: Array-like of shape (N, 2) of latitude & longitude.
+        candidates: Array-like of shape (M, 2) of latitude & longitude.
+        k: Number of nearest candidates to return.
+           Default: 5
+
+    Example:
+        >>> from pyxa.core.geodesy import nearest_k
+        >>> indices, meters = nearest_k([[51.5, -0.12]],
+                                        [[48.85, 2.35], [51.45, -0.97],
+                                         [40.71, -74.0]], k=2)
+        >>> indices
+        array([[1, 0]])
+
+    Returns:
+        Tuple of indices & distances in meters of the nearest
+        candidates, both of shape (N, k) and sorted nearest first.
+    """
+    origins = _as_coordinates(origins)
+    candidates = _as_coordinates(candidates)
+    k = min(k, len(candidates))
+
+    indices = np.empty((len(origins), k), dtype=np.int64)
+    meters = np.empty((len(origins), k), dtype=np.float64)
+
+    for start in range(0, len(origins), NEAREST_CHUNK_SIZE):
+        stop = start + NEAREST_CHUNK_SIZE
+        distances = distance_matrix(origins[start:stop], candidates)
+        if k < len(candidates):
+            nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        else:
+            nearest = np.broadcast_to(np.arange(k), (len(distances), k))
+        nearest_distances = np.take_along_axis(distances, nearest, axis=1)
+        order = np.argsort(nearest_distances, axis=1)
+        indices[start:stop] = np.take_along_axis(nearest, order, axis=1)
+        meters[start:stop] = np.take_along_axis(nearest_distances, order,
+                                                axis=1)
+
+    return indices, meters
+
+
+def format_distance(meters: float, metric: Optional[bool] = True) -> str:
+    """Returns distance as human readable text."""
+    if metric:
+        if meters < 1000:
+            return f'{meters:,.0f} m'
+        if meters < 100000:
+            return f'{meters / 1000:,.1f} km'
+        return f'{meters / 1000:,.0f} km'
+    miles = meters / 1609.344
+    if miles < 0.1:
+        return f'{meters * 3.28084:,.0f} ft'
+    if miles < 100:
+        return f'{miles:,.1f} mi'
+    return f'{miles:,.0f} mi'
@@ -0,0 +1,115 @@
+# Copyright 2020 XAMES3. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ======================================================================
+"""
+The `pyxa.core.geohash` module quantizes coordinates into grid cells.
+
+Coordinates which geocode a few hundred meters apart rarely match
+exactly. The functions in this module map them to geohash cells instead,
+so nearby coordinates share the same key. Every extra character of the
+geohash makes the cell roughly 32 times smaller.
+"""
+# The following comment should be removed at some point in the future.
+# pylint: disable=import-error
+# pylint: disable=no-name-in-module
+
+import math
+from typing import Optional, Tuple
+
+from pyxa.constants import EARTH_RADIUS_KM
+
+# Alphabet of the geohash characters, each one encodes 5 bits.
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+_DECODE = {char: idx for idx, char in enumerate(BASE32)}
+
+
+def _bits(precision: int) -> Tuple[int, int]:
+    """Returns number of latitude & longitude bits of the precision."""
+    bits = 5 * precision
+    return bits // 2, bits - bits // 2
+
+
+def encode(latitude: float, longitude: float, precision: int) -> str:
+    """Returns geohash of the coordinates.
+
+    Args:
+        latitude: Latitude in degrees.
+        longitude: Longitude in degrees.
+        precision: Number of characters of the geohash.
+
+    Example:
+        >>> from pyxa.core.geohash import encode
+        >>> encode(51.5119, -0.0808, 6)
+        'gcpvn1'
+        >>> encode(51.5141, -0.0794, 6)
+        'gcpvn1'
+    """
+    lat_bits, lon_bits = _bits(precision)
+    # Both the axes are quantized to integers first, interleaving their
+    # bits is then the same as the classic interval halving.
+    lat_cell = min(int((latitude + 90.0) / 180.0 * (1 << lat_bits)),
+                   (1 << lat_bits) - 1)
+    lon_cell = min(int((longitude + 180.0) / 360.0 * (1 << lon_bits)),
+                   (1 << lon_bits) - 1)
+
+    value = 0
+    for bit in range(lon_bits - 1, -1, -1):
+        value = (value << 1) | ((lon_cell >> bit) & 1)
+        lat_bit = bit - (lon_bits - lat_bits)
+        if lat_bit >= 0:
+            value = (value << 1) | ((lat_cell >> lat_bit) & 1)
+
+    return ''.join(BASE32[(value >> shift) & 31]
+                   for shift in range(5 * (precision - 1), -1, -5))
+
+
+def decode(geohash: str) -> Tuple[float, float, float, float]:
+    """Returns center of the geohash cell and its half height & width.
+
+    Example:
+        >>> from pyxa.core.geohash import decode
+        >>> decode('gcpvn1')
+        (51.51214599609375, -0.0823974609375, 0.00274658203125, 0.00549...)
+    """
+    value = 0
+    for char in geohash.lower():
+        value = (value << 5) | _DECODE[char]
+
+    lat_bits, lon_bits = _bits(len(geohash))
+    lat_cell = lon_cell = 0
+    for bit in range(lat_bits + lon_bits - 1, -1, -1):
+        # Bits alternate between longitude & latitude, longitude first.
+        if (lat_bits + lon_bits - 1 - bit) % 2 == 0:
+            lon_cell = (lon_cell << 1) | ((value >> bit) & 1)
+        else:
+            lat_cell = (lat_cell << 1) | ((value >> bit) & 1)
+
+    lat_error = 90.0 / (1 << lat_bits)
+    lon_error = 180.0 / (1 << lon_bits)
+    return (-90.0 + (2 * lat_cell + 1) * lat_error,
+            -180.0 + (2 * lon_cell + 1) * lon_error,
+            lat_error,
+            lon_error)
+
+
+def cell_size(precision: int,
+              latitude: Optional[float] = 0.0) -> Tuple[float, float]:
+    """Returns height & width in meters of a cell at the latitude."""
+    lat_bits, lon_bits = _bits(precision)
+    meters_per_degree = math.pi * EARTH_RADIUS_KM * 1000.0 / 180.0
+    return (180.0 / (1 << lat_bits) * meters_per_degree,
+            360.0 / (1 << lon_bits) * meters_per_degree
+            * math.cos(math.radians(latitude)))
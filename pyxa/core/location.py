@@ -23,19 +23,104 @@ The `pyxa.core.location` module helps with the location related queries.
 
 import os
 import random
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import AnyStr, List, Optional, Tuple, Union
+from functools import lru_cache
+from itertools import product
+from typing import (Any, AnyStr, Callable, List, Optional, Sequence, Tuple,
+                    Union)
 
 import geocoder
 import googlemaps
+import numpy as np
+import requests
 
 from pyxa.constants import DARK, DAWN, DUSK, NOON
+from pyxa.core.cache import geocode_cache
+from pyxa.core.geodesy import (distance_matrix, format_distance, haversine,
+                               nearest_k)
+from pyxa.core.places import offline_zone_name
+from pyxa.core.quota import quota_limiter
+from pyxa.core.singleflight import coalesce
+from pyxa.utils.exceptions import CircuitOpen, QuotaExceeded
+from pyxa.utils.network import get_session
+from pyxa.utils.settings import (DEFAULT_MAX_CONCURRENCY,
+                                 DEFAULT_OFFLINE_ZONE_DISTANCE,
+                                 MAPS_MATRIX_MAX_DESTINATIONS,
+                                 MAPS_MATRIX_MAX_ELEMENTS,
+                                 MAPS_MATRIX_MAX_ORIGINS)
+
+
+def is_unreachable(error: BaseException) -> bool:
+    """Returns whether the error means the API couldn't be reached."""
+    if isinstance(error, googlemaps.exceptions.TransportError):
+        error = getattr(error, 'base_exception', None)
+    return isinstance(error, (requests.ConnectionError, requests.Timeout,
+                              googlemaps.exceptions.Timeout))
+
+
+def _maps_request(function: Callable, *args: Any, **kwargs: Any) -> Any:
+    """Calls the ``Google Maps`` client, letting open circuits through.
+
+    The client wraps every error of the session in ``TransportError``,
+    hence the open circuits are unwrapped so the callers can tell them
+    apart from the other failures.
+    """
+    try:
+        return function(*args, **kwargs)
+    except googlemaps.exceptions.TransportError as error:
+        if isinstance(error.base_exception, CircuitOpen):
+            raise error.base_exception from None
+        raise
+
+
+@lru_cache(maxsize=None)
+def maps_client(api_key: str) -> googlemaps.Client:
+    """Returns ``Google Maps`` client shared across the calls."""
+    return googlemaps.Client(key=api_key, timeout=10,
+                             requests_session=get_session())
+
+
+def geocode(api_key: AnyStr,
+            location: Optional[str] = None,
+            client: Optional[googlemaps.Client] = None,
+            use_cache: Optional[bool] = True) -> Tuple[float, float]:
+    """Returns latitude & longitude of the location.
+
+    Addresses are looked up in ``geocode_cache`` first and only sent to
+    ``Google Maps`` on a miss. Current location is always geolocated
+    afresh as it depends on the network the caller is on.
+    """
+    if location and use_cache:
+        coordinates = geocode_cache.get_coordinates(location)
+        if coordinates is not None:
+            return coordinates
 
+    if client is None:
+        client = maps_client(api_key)
+
+    quota_limiter.acquire('maps', api_key)
+    if location:
+        address = _maps_request(client.geocode, location)
+        latitude, longitude = (address[0]['geometry']['location']['lat'],
+                               address[0]['geometry']['location']['lng'])
+        geocode_cache.set_coordinates(location, latitude, longitude)
+    else:
+        current = _maps_request(client.geolocate)
+        latitude, longitude = (current['location']['lat'],
+                               current['location']['lng'])
+
+    return latitude, longitude
+
+
+@coalesce
 def get_coordinates(api_key: AnyStr,
                     location: Optional[str] = None,
-                    zone: Optional[str] = None) -> Tuple[str,
-                                                         str,
-                                                         Union[None, str]]:
+                    zone: Optional[str] = None,
+                    client: Optional[googlemaps.Client] = None,
+                    session: Optional[requests.Session] = None,
+                    use_cache: Optional[bool] = True
+                    ) -> Tuple[str, str, Union[None, str]]:
     """Gets coordinates and zone for particular location.
 
     Fetches current or the address location's latitude and longitude
@@ -47,6 +132,14 @@ def get_coordinates(api_key: AnyStr,
                   Default: None
         zone: Name of the zone. For example: city, country, state etc.
               Default: None
+        client: ``Google Maps`` client to use. The shared client for the
+                API key is used when none is passed.
+                Default: None
+        session: Requests session used for the zone lookup. The shared
+                 pooled session is used when none is passed.
+                 Default: None
+        use_cache: Reuse the lookups stored in ``geocode_cache``.
+                   Default: True
 
     Example:
         >>> import os
@@ -67,28 +160,60 @@ def get_coordinates(api_key: AnyStr,
 
     Raises:
         ValueError: If the function is called without a valid API key.
+        QuotaExceeded: If the ``Google Maps`` budget of the key is spent.
+        CircuitOpen: If ``Google Maps`` is failing & the call is refused.
     """
-    client = googlemaps.Client(key=api_key, timeout=10)
-
-    if location:
-        address = client.geocode(location)
-        latitude, longitude = (address[0]['geometry']['location']['lat'],
-                               address[0]['geometry']['location']['lng'])
-    else:
-        current = client.geolocate()
-        latitude, longitude = (current['location']['lat'],
-                               current['location']['lng'])
-
-    zone = get_zone_name(latitude, longitude, zone)
+    latitude, longitude = geocode(api_key, location, client, use_cache)
+    zone = get_zone_name(latitude, longitude, zone, session, use_cache)
 
     return latitude, longitude, zone
 
 
+@coalesce
 def get_zone_name(latitude: float,
                   longitude: float,
-                  zone: Optional[str] = None) -> Union[None, str]:
-    """Returns ``zone`` for particular location."""
-    zone_obj = geocoder.osm([latitude, longitude], method='reverse')
+                  zone: Optional[str] = None,
+                  session: Optional[requests.Session] = None,
+                  use_cache: Optional[bool] = True,
+                  offline: Optional[bool] = True) -> Union[None, str]:
+    """Returns ``zone`` for particular location.
+
+    The zone is resolved offline from the bundled place index wherever
+    possible. The cached or the ``OSM`` reverse lookup is used for the
+    zones which the index doesn't know about (street, suburb etc.) or
+    when the nearest known place is too far away.
+    """
+    if offline:
+        name = offline_zone_name(latitude, longitude, zone,
+                                 DEFAULT_OFFLINE_ZONE_DISTANCE)
+        if name is not None:
+            return name
+
+    if use_cache:
+        name = geocode_cache.get_zone(latitude, longitude, zone)
+        if name is not None:
+            return name
+
+    try:
+        name = _osm_zone_name(latitude, longitude, zone, session)
+    except (QuotaExceeded, CircuitOpen):
+        # Degrades to the nearest known place, however far it may be.
+        return offline_zone_name(latitude, longitude, zone)
+    if name is not None:
+        geocode_cache.set_zone(latitude, longitude, zone, name)
+
+    return name
+
+
+def _osm_zone_name(latitude: float,
+                   longitude: float,
+                   zone: Optional[str] = None,
+                   session: Optional[requests.Session] = None
+                   ) -> Union[None, str]:
+    """Returns ``zone`` for particular location using OSM lookup."""
+    quota_limiter.acquire('osm', 'nominatim')
+    zone_obj = geocoder.osm([latitude, longitude], method='reverse',
+                            session=session or get_session())
 
     zone_list = ['street', 'road', 'neighbourhood', 'suburb', 'city', 'town',
                  'suburb', 'state', 'region', 'country']
@@ -101,9 +226,16 @@ def get_zone_name(latitude: float,
                 return zone_obj.json[idx]
 
 
-def get_part_of_day() -> str:
-    """Returns the part of the day."""
-    hour = datetime.now().hour
+def get_part_of_day(now: Optional[datetime] = None) -> str:
+    """Returns the part of the day.
+
+    Args:
+        now: Time whose part of the day is returned, i.e. the local time
+             of the queried location. Local time of the system is used
+             if ``None`` is passed.
+             Default: None
+    """
+    hour = (now or datetime.now()).hour
 
     if hour >= DAWN and hour < NOON:
         part_of_day = random.choice(['morning', 'day'])
@@ -117,6 +249,7 @@ def get_part_of_day() -> str:
     return part_of_day
 
 
+@coalesce
 def calculate_distance(api_key: str,
                        destination: str,
                        origin: Optional[str] = None,
@@ -133,9 +266,11 @@ def calculate_distance(api_key: str,
         origin: Origin location. If no origin is passed it'll pick
                 current location as ``origin`` location.
                 Default: None
-        mode: Mode of covering the distance.
+        mode: Mode of covering the distance. ``straight_line`` computes
+              the great-circle distance locally without a routed API
+              call, the time is ``None`` in that case.
               Default: walking [Available: driving, walking, bicycling,
-                                           transit]
+                                           transit, straight_line]
 
     Example:
         >>> import os
@@ -148,25 +283,218 @@ def calculate_distance(api_key: str,
 
     Raises:
         ValueError: If the function is called without a valid API key.
+        QuotaExceeded: If the ``Google Maps`` budget of the key is spent.
+        CircuitOpen: If ``Google Maps`` is failing & the call is refused.
     """
-    client = googlemaps.Client(key=api_key, timeout=10)
+    client = maps_client(api_key)
 
-    if origin is None:
-        origin_lat, origin_lng, _ = get_coordinates(api_key)
-    else:
-        origin_lat, origin_lng, _ = get_coordinates(api_key, location=origin)
+    # Zone names are never used here, hence only the coordinates are
+    # resolved & no reverse lookup is made.
+    origin_coords = geocode(api_key, origin, client)
+    dest_coords = geocode(api_key, destination, client)
 
-    origin_coords = (origin_lat, origin_lng)
-
-    dest_lat, dest_lng, _ = get_coordinates(api_key, destination)
-    dest_coords = (dest_lat, dest_lng)
+    if mode == 'straight_line':
+        meters = float(haversine(*origin_coords, *dest_coords))
+        return format_distance(meters, metric), None
 
     units = 'metric' if metric else 'imperial'
 
-    dist_obj = client.distance_matrix(origin_coords, dest_coords,
-                                      mode=mode, units=units)
+    quota_limiter.acquire('maps', api_key)
+    dist_obj = _maps_request(client.distance_matrix, origin_coords,
+                             dest_coords, mode=mode, units=units)
 
     distance = dist_obj['rows'][0]['elements'][0]['distance']['text']
     time = dist_obj['rows'][0]['elements'][0]['duration']['text']
 
     return distance, time
+
+
+def _matrix_blocks(origins: int, destinations: int) -> Tuple[int, int]:
+    """Returns block size which needs the least matrix requests."""
+    if not origins or not destinations:
+        return 1, 1
+    best = None
+    for rows in range(1, min(origins, MAPS_MATRIX_MAX_ORIGINS) + 1):
+        cols = min(destinations, MAPS_MATRIX_MAX_DESTINATIONS,
+                   MAPS_MATRIX_MAX_ELEMENTS // rows)
+        requests_needed = -(-origins // rows) * -(-destinations // cols)
+        if best is None or requests_needed < best[0]:
+            best = requests_needed, rows, cols
+    return best[1], best[2]
+
+
+def calculate_distances(api_key: str,
+                        origins: Sequence[Optional[str]],
+                        destinations: Sequence[str],
+                        mode: Optional[str] = 'walking',
+                        metric: Optional[bool] = True,
+                        text: Optional[bool] = False,
+                        max_concurrency: Optional[int] = (
+                            DEFAULT_MAX_CONCURRENCY)) -> Tuple:
+    """Calculates the distances between many places.
+
+    Calculates the distance & travel time from every origin to every
+    destination. All the places are deduplicated and geocoded once,
+    the matrix is then split into the fewest ``distance_matrix``
+    requests the API limits allow and these are made concurrently.
+
+    Args:
+        api_key: Google Maps API key.
+        origins: Origin locations. ``None`` stands for the current
+                 location.
+        destinations: Destination locations.
+        mode: Mode of covering the distance. ``straight_line`` computes
+              the great-circle distances locally in a single vectorized
+              call, the times are ``NaN`` in that case.
+              Default: walking [Available: driving, walking, bicycling,
+                                           transit, straight_line]
+        metric: Metric units to be used for the text, Metric or
+                Imperial.
+                Default: True
+        text: Return human readable text instead of the numbers.
+              Default: False
+        max_concurrency: Maximum number of requests made at once.
+                         Default: 16
+
+    Example:
+        >>> import os
+        >>> from pyxa.core.location import calculate_distances
+        >>> meters, seconds = calculate_distances(
+                os.environ.get('MAPS_API_KEY'),
+                ['London', 'Paris'], ['Berlin', 'Rome', 'Madrid'],
+                mode='driving')
+        >>> meters
+        array([[1098531., 1870122., 1726066.],
+               [1054813., 1420332., 1273584.]])
+
+    Returns:
+        Tuple of distance & time matrices of shape (origins,
+        destinations). The matrices hold meters & seconds as floats,
+        ``NaN`` where no route was found, or the text if ``text`` is
+        set.
+
+    Raises:
+        ValueError: If the function is called without a valid API key.
+        QuotaExceeded: If the ``Google Maps`` budget of the key is spent.
+        CircuitOpen: If ``Google Maps`` is failing & the call is refused.
+    """
+    if not len(origins) or not len(destinations):
+        # Nothing to geocode or route, hence no client or pool is made.
+        shape = len(origins), len(destinations)
+        if text:
+            return (np.full(shape, None, dtype=object),
+                    np.full(shape, None, dtype=object))
+        return np.full(shape, np.nan), np.full(shape, np.nan)
+
+    client = maps_client(api_key)
+    units = 'metric' if metric else 'imperial'
+
+    unique_origins = list(dict.fromkeys(origins))
+    unique_destinations = list(dict.fromkeys(destinations))
+    places = list(dict.fromkeys(unique_origins + unique_destinations))
+
+    rows, cols = _matrix_blocks(len(unique_origins), len(unique_destinations))
+    shape = len(unique_origins), len(unique_destinations)
+    meters, seconds = np.full(shape, np.nan), np.full(shape, np.nan)
+    distance_text = np.full(shape, None, dtype=object)
+    duration_text = np.full(shape, None, dtype=object)
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        coordinates = dict(zip(places, executor.map(
+            lambda place: geocode(api_key, place, client), places)))
+
+        if mode == 'straight_line':
+            meters[:] = distance_matrix(
+                [coordinates[place] for place in unique_origins],
+                [coordinates[place] for place in unique_destinations])
+            distance_text[:] = np.vectorize(format_distance, otypes=[object])(
+                meters, metric)
+            blocks = []
+        else:
+            blocks = product(range(0, shape[0], rows),
+                             range(0, shape[1], cols))
+
+        def _each_block(block: Tuple[int, int]) -> None:
+            """Fills the matrices for a single block of the places."""
+            row, col = block
+            quota_limiter.acquire('maps', api_key)
+            dist_obj = _maps_request(
+                client.distance_matrix,
+                [coordinates[place]
+                 for place in unique_origins[row:row + rows]],
+                [coordinates[place]
+                 for place in unique_destinations[col:col + cols]],
+                mode=mode, units=units)
+
+            for idx, element_row in enumerate(dist_obj['rows'], row):
+                for jdx, element in enumerate(element_row['elements'], col):
+                    if element.get('status') != 'OK':
+                        continue
+                    meters[idx, jdx] = element['distance']['value']
+                    seconds[idx, jdx] = element['duration']['value']
+                    distance_text[idx, jdx] = element['distance']['text']
+                    duration_text[idx, jdx] = element['duration']['text']
+
+        list(executor.map(_each_block, blocks))
+
+    origin_idx = {place: idx for idx, place in enumerate(unique_origins)}
+    destination_idx = {place: idx
+                       for idx, place in enumerate(unique_destinations)}
+    selection = np.ix_([origin_idx[place] for place in origins],
+                       [destination_idx[place] for place in destinations])
+
+    if text:
+        return distance_text[selection], duration_text[selection]
+    return meters[selection], seconds[selection]
+
+
+def nearest_places(api_key: str,
+                   origin: Optional[str],
+                   candidates: Sequence[str],
+                   k: Optional[int] = 5,
+                   max_concurrency: Optional[int] = DEFAULT_MAX_CONCURRENCY
+                   ) -> List[Tuple[str, float]]:
+    """Returns ``k`` candidates nearest to the origin.
+
+    Ranks the candidates by the great-circle distance computed locally,
+    hence only the returned shortlist needs to be sent to the routed
+    ``calculate_distances`` for the travel times. The origin & the
+    deduplicated candidates are geocoded concurrently.
+
+    Args:
+        api_key: Google Maps API key.
+        origin: Origin location. ``None`` stands for the current
+                location.
+        candidates: Candidate locations to be ranked.
+        k: Number of the nearest candidates returned.
+           Default: 5
+        max_concurrency: Maximum number of geocode requests made at
+                         once.
+                         Default: 16
+
+    Example:
+        >>> import os
+        >>> from pyxa.core.location import nearest_places
+        >>> nearest_places(os.environ.get('MAPS_API_KEY'), 'London',
+                           ['Paris', 'Reading', 'New York'], k=2)
+        [('Reading', 59131.36...), ('Paris', 343128.35...)]
+
+    Returns:
+        List of candidate & its distance in meters, nearest first.
+    """
+    if not len(candidates):
+        return []
+
+    client = maps_client(api_key)
+    places = list(dict.fromkeys([origin, *candidates]))
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        coordinates = dict(zip(places, executor.map(
+            lambda place: geocode(api_key, place, client), places)))
+
+    origin_coords = coordinates[origin]
+    candidate_coords = [coordinates[place] for place in candidates]
+
+    indices, meters = nearest_k([origin_coords], candidate_coords, k)
+    return [(candidates[idx], distance)
+            for idx, distance in zip(indices[0].tolist(), meters[0].tolist())]
@@ -0,0 +1,426 @@
+# Copyright 2020 XAMES3. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ======================================================================
+"""
+The `pyxa.core.places` module helps with offline reverse geocoding.
+
+The functions in this module resolve latitude & longitude to the nearest
+known place without making any network call. The places are looked up
+in a KD-tree built over the ``GeoNames`` dataset which is bundled with
+the ``reverse-geocode`` package. Time zones are resolved the same way
+from the locations listed in the ``zone.tab`` file of the tz database.
+"""
+# The following comment should be removed at some point in the future.
+# pylint: disable=import-error
+# pylint: disable=no-name-in-module
+
+import os
+from datetime import datetime, timedelta, timezone, tzinfo
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from pyxa.constants import EARTH_RADIUS_KM
+from pyxa.core.geodesy import to_unit_vectors
+
+# Files of the tz database listing a location for every time zone, the
+# first one found in the ``TZPATH`` directories or ``tzdata`` is used.
+ZONE_TABLES = ('zone.tab', 'zone1970.tab')
+TZPATH = ('/usr/share/zoneinfo', '/usr/lib/zoneinfo',
+          '/usr/share/lib/zoneinfo', '/etc/zoneinfo')
+
+# Locations farther than this many kilometers from any known place are
+# considered at sea and get the nautical time zone of their longitude.
+NAUTICAL_DISTANCE = 500.0
+
+# Zones which can be resolved offline mapped to the dataset fields.
+OFFLINE_ZONES = {'city': 'city',
+                 'town': 'city',
+                 'state': 'state',
+                 'region': 'state',
+                 'country': 'country',
+                 'country_code': 'country_code'}
+
+
+class PlaceIndex(object):
+    """Spatial index for nearest place lookups.
+
+    Places are projected on a unit sphere and indexed in a KD-tree,
+    hence the nearest neighbour is exact across the poles and the
+    antimeridian. Each lookup is a tree query, a single coordinate is
+    answered in microseconds and batches are answered in one vectorized
+    call.
+
+    Args:
+        latitudes: Latitudes of the places.
+        longitudes: Longitudes of the places.
+        fields: Mapping of field name to the values for every place.
+                For example: city, state, country & country_code.
+
+    Example:
+        >>> from pyxa.core.places import place_index
+        >>> index = place_index()
+        >>> index.query(51.5119, -0.0808)['city']
+        'City of London'
+        >>> index.zone_names([[51.5119, -0.0808], [48.85, 2.35]], 'country')
+        array(['United Kingdom', 'France'], dtype=object)
+    """
+
+    def __init__(self,
+                 latitudes: Sequence[float],
+                 longitudes: Sequence[float],
+                 fields: Dict[str, Sequence[str]]) -> None:
+        self.latitudes = np.asarray(latitudes, dtype=np.float64)
+        self.longitudes = np.asarray(longitudes, dtype=np.float64)
+        self.fields = {name: np.asarray(values, dtype=object)
+                       for name, values in fields.items()}
+        self._tree = cKDTree(to_unit_vectors(self.latitudes, self.longitudes))
+
+    def __len__(self) -> int:
+        return len(self.latitudes)
+
+    @classmethod
+    def from_reverse_geocode(cls, min_population: Optional[int] = 0
+                             ) -> 'PlaceIndex':
+        """Builds index from the dataset bundled with reverse-geocode."""
+        import reverse_geocode
+
+        data = reverse_geocode.GeocodeData(min_population)
+        # Older releases of reverse-geocode expose these without the
+        # leading underscore.
+        locations = getattr(data, '_locations', None)
+        if locations is None:
+            locations = data.locations
+        countries = getattr(data, '_countries', None) or data.countries
+
+        return cls([place['latitude'] for place in locations],
+                   [place['longitude'] for place in locations],
+                   {'city': [place['city'] for place in locations],
+                    'state': [place.get('state') for place in locations],
+                    'country_code': [place['country_code']
+                                     for place in locations],
+                    'country': [countries.get(place['country_code'])
+                                for place in locations]})
+
+    def nearest(self, coordinates: Union[Sequence, np.ndarray]
+                ) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns distances in km & indices of the nearest places.
+
+        Args:
+            coordinates: Array-like of shape (N, 2) holding latitude &
+                         longitude pairs.
+        """
+        coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+        chords, indices = self._tree.query(
+            to_unit_vectors(coordinates[:, 0], coordinates[:, 1]))
+        distances = 2.0 * EARTH_RADIUS_KM * np.arcsin(
+            np.clip(chords / 2.0, 0.0, 1.0))
+        return distances, indices
+
+    def zone_names(self,
+                   coordinates: Union[Sequence, np.ndarray],
+                   zone: Optional[str] = 'city') -> np.ndarray:
+        """Returns zone names of the nearest places for all coordinates."""
+        _, indices = self.nearest(coordinates)
+        return self.fields[OFFLINE_ZONES[zone or 'city']][indices]
+
+    def query(self, latitude: float, longitude: float) -> Dict:
+        """Returns details of the place nearest to the coordinates."""
+        return self.query_many([(latitude, longitude)])[0]
+
+    def query_many(self, coordinates: Union[Sequence, np.ndarray]
+                   ) -> List[Dict]:
+        """Returns details of the nearest places for all coordinates."""
+        distances, indices = self.nearest(coordinates)
+        places = []
+        for distance, idx in zip(distances.tolist(), indices.tolist()):
+            place = {name: values[idx] for name, values in self.fields.items()}
+            place['latitude'] = float(self.latitudes[idx])
+            place['longitude'] = float(self.longitudes[idx])
+            place['distance'] = distance
+            places.append(place)
+        return places
+
+
+@lru_cache(maxsize=None)
+def place_index(min_population: Optional[int] = 0) -> PlaceIndex:
+    """Returns shared place index, building it on the first call."""
+    return PlaceIndex.from_reverse_geocode(min_population)
+
+
+def offline_zone_name(latitude: float,
+                      longitude: float,
+                      zone: Optional[str] = None,
+                      max_distance: Optional[float] = None) -> Optional[str]:
+    """Returns ``zone`` for particular location without network call.
+
+    Returns ``None`` if the zone cannot be resolved offline, i.e. the
+    zone is not one of ``OFFLINE_ZONES``, the dataset isn't available
+    or the nearest place is farther than ``max_distance`` km.
+    """
+    if (zone or 'city') not in OFFLINE_ZONES:
+        return None
+
+    try:
+        index = place_index()
+    except (ImportError, OSError):
+        return None
+
+    distances, indices = index.nearest([(latitude, longitude)])
+    if max_distance is not None and distances[0] > max_distance:
+        return None
+
+    return index.fields[OFFLINE_ZONES[zone or 'city']][indices[0]] or None
+
+
+def _parse_coordinate(value: str, degrees: int) -> float:
+    """Returns ``±DDMM[SS]`` or ``±DDDMM[SS]`` value in degrees."""
+    sign = -1.0 if value[0] == '-' else 1.0
+    value = value[1:]
+    parts = [value[:degrees], value[degrees:degrees + 2],
+             value[degrees + 2:] or '0']
+    return sign * (int(parts[0]) + int(parts[1]) / 60 + int(parts[2]) / 3600)
+
+
+def nautical_timezone(longitude: Union[float, np.ndarray]
+                      ) -> Union[str, np.ndarray]:
+    """Returns ``Etc/GMT`` time zone of the longitude's 15° band.
+
+    Note:
+        The ``Etc`` zones have their signs inverted, i.e. ``Etc/GMT-5``
+        is 5 hours ahead of UTC.
+    """
+    offsets, inverse = np.unique(
+        np.rint(np.atleast_1d(np.asarray(longitude, np.float64)) / 15.0),
+        return_inverse=True)
+    names = np.array(['Etc/GMT' if offset == 0 else f'Etc/GMT{-offset:+.0f}'
+                      for offset in offsets], dtype=object)[inverse]
+    return names if np.ndim(longitude) else names[0]
+
+
+class TimezoneIndex(object):
+    """Spatial index for offline time zone lookups.
+
+    Every time zone of the tz database is represented by the location of
+    its principal city. A coordinate gets the time zone whose location
+    is nearest, considering only the zones of the country it falls in
+    when the country is known. This keeps the borders right wherever a
+    country has a single time zone, which is most of them.
+
+    Args:
+        latitudes: Latitudes of the time zone locations.
+        longitudes: Longitudes of the time zone locations.
+        zones: Names of the time zones, i.e. ``Europe/London``.
+        country_codes: ISO 3166 codes of the countries of the zones.
+
+    Example:
+        >>> from pyxa.core.places import timezone_index
+        >>> index = timezone_index()
+        >>> index.zones([[51.5119, -0.0808], [40.71, -74.0]], ['GB', 'US'])
+        array(['Europe/London', 'America/New_York'], dtype=object)
+    """
+
+    def __init__(self,
+                 latitudes: Sequence[float],
+                 longitudes: Sequence[float],
+                 zones: Sequence[str],
+                 country_codes: Sequence[str]) -> None:
+        self.latitudes = np.asarray(latitudes, dtype=np.float64)
+        self.longitudes = np.asarray(longitudes, dtype=np.float64)
+        self.zone_names = np.asarray(zones, dtype=object)
+        self.country_codes = np.asarray(country_codes, dtype=object)
+        self._tree = cKDTree(to_unit_vectors(self.latitudes, self.longitudes))
+        self._countries = {}
+
+    def __len__(self) -> int:
+        return len(self.zone_names)
+
+    @classmethod
+    def from_zone_table(cls, path: Optional[str] = None) -> 'TimezoneIndex':
+        """Builds index from the ``zone.tab`` file of the tz database.
+
+        Raises:
+            FileNotFoundError: If no zone table could be found.
+        """
+        path = path or find_zone_table()
+        if path is None:
+            raise FileNotFoundError('Zone table of the tz database not '
+                                    'found.')
+        latitudes, longitudes, zones, country_codes = [], [], [], []
+        with open(path, encoding='utf-8') as file:
+            for line in file:
+                if line.startswith('#') or not line.strip():
+                    continue
+                codes, coordinates, zone = line.split('\t')[:3]
+                split = max(coordinates.rfind('+'), coordinates.rfind('-'))
+                for code in codes.split(','):
+                    latitudes.append(_parse_coordinate(coordinates[:split], 2))
+                    longitudes.append(_parse_coordinate(coordinates[split:],
+                                                        3))
+                    zones.append(zone.strip())
+                    country_codes.append(code)
+        return cls(latitudes, longitudes, zones, country_codes)
+
+    def _country(self, country_code: str) -> Optional[Tuple]:
+        """Returns KD-tree & indices of the zones of the country."""
+        if country_code not in self._countries:
+            indices = np.flatnonzero(self.country_codes == country_code)
+            self._countries[country_code] = (
+                None if not len(indices) else
+                (cKDTree(to_unit_vectors(self.latitudes[indices],
+                                         self.longitudes[indices])),
+                 indices))
+        return self._countries[country_code]
+
+    def zones(self,
+              coordinates: Union[Sequence, np.ndarray],
+              country_codes: Optional[Sequence[Optional[str]]] = None
+              ) -> np.ndarray:
+        """Returns time zone names for all the coordinates.
+
+        Args:
+            coordinates: Array-like of shape (N, 2) holding latitude &
+                         longitude pairs.
+            country_codes: Country codes of the coordinates. Zones of
+                           all the countries are considered for the
+                           coordinates whose code is ``None`` or
+                           unknown.
+                           Default: None
+        """
+        coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+        vectors = to_unit_vectors(coordinates[:, 0], coordinates[:, 1])
+        _, nearest = self._tree.query(vectors)
+        names = self.zone_names[nearest]
+        if country_codes is None:
+            return names
+
+        country_codes = np.asarray(country_codes, dtype=object)
+        for country_code in set(country_codes.tolist()) - {None}:
+            country = self._country(country_code)
+            if country is None:
+                continue
+            tree, indices = country
+            rows = np.flatnonzero(country_codes == country_code)
+            _, nearest = tree.query(vectors[rows])
+            names[rows] = self.zone_names[indices[nearest]]
+        return names
+
+
+def find_zone_table() -> Optional[str]:
+    """Returns path of the tz database's zone table, if available."""
+    directories = list(TZPATH)
+    try:
+        import tzdata
+
+        directories.insert(0, os.path.join(os.path.dirname(tzdata.__file__),
+                                           'zoneinfo'))
+    except ImportError:
+        pass
+    try:
+        import zoneinfo
+
+        directories[:0] = zoneinfo.TZPATH
+    except ImportError:
+        pass
+    for name in ZONE_TABLES:
+        for directory in directories:
+            path = os.path.join(directory, name)
+            if os.path.isfile(path):
+                return path
+    return None
+
+
+@lru_cache(maxsize=None)
+def timezone_index() -> TimezoneIndex:
+    """Returns shared time zone index, building it on the first call."""
+    return TimezoneIndex.from_zone_table()
+
+
+def offline_timezones(coordinates: Union[Sequence, np.ndarray]
+                      ) -> np.ndarray:
+    """Returns time zone names for all coordinates without network call.
+
+    The country of each coordinate is taken from the nearest known
+    place. Coordinates far out at sea, or all of them if the zone table
+    isn't available, get the nautical ``Etc/GMT`` zone of their
+    longitude.
+
+    Example:
+        >>> from pyxa.core.places import offline_timezones
+        >>> offline_timezones([[51.5119, -0.0808], [28.61, 77.21]])
+        array(['Europe/London', 'Asia/Kolkata'], dtype=object)
+    """
+    coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+    names = nautical_timezone(coordinates[:, 1])
+    try:
+        index = timezone_index()
+    except (ImportError, OSError):
+        return names
+
+    try:
+        places = place_index()
+    except (ImportError, OSError):
+        return index.zones(coordinates)
+
+    distances, nearest = places.nearest(coordinates)
+    on_land = distances <= NAUTICAL_DISTANCE
+    if on_land.any():
+        names[on_land] = index.zones(
+            coordinates[on_land],
+            places.fields['country_code'][nearest[on_land]])
+    return names
+
+
+def offline_timezone(latitude: float, longitude: float) -> str:
+    """Returns time zone name of the location without network call."""
+    return offline_timezones([(latitude, longitude)])[0]
+
+
+def _tzinfo(name: str, longitude: float) -> tzinfo:
+    """Returns tzinfo of the zone, a fixed offset if it's unavailable."""
+    try:
+        import zoneinfo
+
+        return zoneinfo.ZoneInfo(name)
+    # ``zoneinfo`` is only available on Python 3.9 and above.
+    except (ImportError, KeyError, ValueError):
+        return timezone(timedelta(hours=float(np.rint(longitude / 15.0))))
+
+
+def local_time(latitude: float,
+               longitude: float,
+               when: Optional[datetime] = None) -> datetime:
+    """Returns current or the passed time at the location.
+
+    Args:
+        latitude: Latitude of the location.
+        longitude: Longitude of the location.
+        when: Time to be converted. Naive times are taken as the local
+              time of the system. Current time is used if ``None`` is
+              passed.
+              Default: None
+
+    Example:
+        >>> from pyxa.core.places import local_time
+        >>> local_time(51.5119, -0.0808)
+        datetime.datetime(2020, 1, 5, 9, 30, 12, ...,
+                          tzinfo=zoneinfo.ZoneInfo(key='Europe/London'))
+    """
+    when = datetime.now(timezone.utc) if when is None else when
+    return when.astimezone(_tzinfo(offline_timezone(latitude, longitude),
+                                   longitude))
@@ -0,0 +1,375 @@
+# Copyright 2020 XAMES3. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ======================================================================
+"""
+The `pyxa.core.quota` module budgets the calls made to upstream APIs.
+
+Every upstream API key gets a per second token bucket along with daily
+and monthly budgets. The budgets are persisted in the project database
+so that they survive restarts. Requests over the per second rate are
+queued by priority, while requests over a spent budget are refused so
+that the callers can fall back to the cached or degraded answers.
+"""
+# The following comment should be removed at some point in the future.
+# pylint: disable=import-error
+# pylint: disable=no-name-in-module
+
+import atexit
+import hashlib
+import heapq
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, Optional
+
+from pyxa.utils.exceptions import QuotaExceeded
+from pyxa.utils.settings import (DATABASE_FILE_PATH, DEFAULT_API_QUOTAS,
+                                 DEFAULT_QUOTA_SAVE_EVERY,
+                                 DEFAULT_QUOTA_SAVE_INTERVAL,
+                                 DEFAULT_QUOTA_TIMEOUT)
+
+# Budgets which are persisted mapped to their period formats (UTC).
+PERIODS = {'daily': '%Y-%m-%d', 'monthly': '%Y-%m'}
+
+# Priorities of the queued requests, higher ones are served first.
+PRIORITY_LOW = -1
+PRIORITY_NORMAL = 0
+PRIORITY_HIGH = 1
+
+
+class TokenBucket(object):
+    """Token bucket refilled at a constant rate.
+
+    Args:
+        rate: Tokens added per second.
+        capacity: Maximum tokens held, i.e. the allowed burst. The rate
+                  rounded up to at least 1 is used if ``None`` is
+                  passed.
+                  Default: None
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None) -> None:
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1.0, self.rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def delay(self) -> float:
+        """Returns seconds until a token is available."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1.0 else (1.0 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        """Takes a token from the bucket."""
+        self.tokens -= 1.0
+
+
+class QuotaLimiter(object):
+    """Rate limiter & budgeter for the upstream API keys.
+
+    Each ``(api, key)`` pair is limited to ``per_second`` requests with
+    a token bucket and to ``daily`` & ``monthly`` requests in UTC
+    calendar periods. The usage is stored against a hash of the key, the
+    key itself is never written to the database.
+
+    Requests which are over the rate wait in a queue ordered by their
+    priority & arrival. Requests which would go over a spent budget, or
+    which wait longer than ``timeout``, raise ``QuotaExceeded``.
+
+    The usage in memory is the source of truth. It is written to the
+    database in batches, once ``save_every`` requests were granted or
+    ``save_interval`` seconds passed since the last write & on exit, and
+    never while the limiter's lock is held. Hence granting a request
+    doesn't wait on the disk.
+
+    Args:
+        quotas: Mapping of API name to its ``per_second``, ``daily`` &
+                ``monthly`` limits. ``None`` leaves a limit unlimited.
+                Default: DEFAULT_API_QUOTAS
+        path: Path of the SQLite database file. Budgets are only kept
+              in memory if ``None`` is passed.
+              Default: DATABASE_FILE_PATH
+        timeout: Seconds a queued request waits for its slot.
+                 Default: 30.0
+        save_every: Granted requests after which the usage is written.
+                    Default: 50
+        save_interval: Seconds after which the usage is written.
+                       Default: 5.0
+
+    Example:
+        >>> from pyxa.core.quota import quota_limiter
+        >>> quota_limiter.acquire('darksky', darksky_key)
+        >>> quota_limiter.remaining('darksky', darksky_key)
+        {'daily': None, 'monthly': 999}
+        >>> quota_limiter.stats()
+        {'granted': 1, 'queued': 0, 'rejected': 0, 'waiting': 0, ...}
+    """
+
+    def __init__(self,
+                 quotas: Optional[Dict[str, Dict[str, Any]]] = None,
+                 path: Optional[str] = DATABASE_FILE_PATH,
+                 timeout: Optional[float] = DEFAULT_QUOTA_TIMEOUT,
+                 save_every: Optional[int] = DEFAULT_QUOTA_SAVE_EVERY,
+                 save_interval: Optional[float] = (
+                     DEFAULT_QUOTA_SAVE_INTERVAL)) -> None:
+        self.quotas = {api: dict(limits) for api, limits in
+                       (quotas or DEFAULT_API_QUOTAS).items()}
+        self.path = path
+        self.timeout = timeout
+        self.save_every = save_every
+        self.save_interval = save_interval
+        # The connection is shared by the loads & the writes, hence it
+        # is opened & used only while holding its own lock.
+        self._connection = None
+        self._connection_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._dirty = set()
+        self._unsaved = 0
+        self._saved_at = time.monotonic()
+        self._ready = threading.Condition(self._lock)
+        self._buckets = {}
+        self._usage = {}
+        self._queues = {}
+        self._sequence = itertools.count()
+        self.granted = self.queued = self.rejected = 0
+        self.granted_by_api = Counter()
+        atexit.register(self.flush)
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """Returns connection to the database, opening it if needed.
+
+        The caller must hold ``_connection_lock``.
+        """
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._connection = sqlite3.connect(self.path,
+                                               check_same_thread=False)
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS api_quota ('
+                '    api TEXT NOT NULL,'
+                '    key TEXT NOT NULL,'
+                '    budget TEXT NOT NULL,'
+                '    period TEXT NOT NULL,'
+                '    used INTEGER NOT NULL,'
+                '    PRIMARY KEY (api, key, budget))')
+        return self._connection
+
+    def configure(self, api: str, **limits: Optional[float]) -> None:
+        """Updates ``per_second``, ``daily`` or ``monthly`` of the API."""
+        with self._lock:
+            for name in limits:
+                if name not in ('per_second', *PERIODS):
+                    raise TypeError(f'Unknown quota limit "{name}".')
+            self.quotas.setdefault(api, {}).update(limits)
+            for bucket_key in [bucket_key for bucket_key in self._buckets
+                               if bucket_key[0] == api]:
+                del self._buckets[bucket_key]
+            self._ready.notify_all()
+
+    @staticmethod
+    def _hash(key: str) -> str:
+        """Returns the digest under which the key's usage is stored."""
+        return hashlib.sha256(str(key).encode()).hexdigest()[:16]
+
+    def _load(self, api: str, key: str) -> Dict[str, list]:
+        """Returns current period & usage of every budget of the key."""
+        usage_key = api, key
+        if usage_key not in self._usage:
+            usage = {budget: [None, 0] for budget in PERIODS}
+            if self.path is not None:
+                try:
+                    with self._connection_lock:
+                        rows = self.connection.execute(
+                            'SELECT budget, period, used FROM api_quota '
+                            'WHERE api = ? AND key = ?', usage_key).fetchall()
+                except (OSError, sqlite3.Error):
+                    rows = []
+                for budget, period, used in rows:
+                    if budget in usage:
+                        usage[budget] = [period, used]
+            self._usage[usage_key] = usage
+        usage = self._usage[usage_key]
+        now = time.gmtime()
+        for budget, fmt in PERIODS.items():
+            period = time.strftime(fmt, now)
+            if usage[budget][0] != period:
+                usage[budget] = [period, 0]
+        return usage
+
+    def flush(self, blocking: Optional[bool] = True) -> bool:
+        """Persists usage of the keys granted since the last write.
+
+        The usage is copied under the limiter's lock & written after
+        releasing it. Keys which couldn't be written are kept for the
+        next write.
+
+        Args:
+            blocking: Boolean, if an ongoing write should be waited for
+                      instead of leaving the usage to it & the next one.
+                      Default: True
+
+        Returns:
+            Boolean, if the usage was written.
+        """
+        if not self._save_lock.acquire(blocking):
+            return False
+        try:
+            with self._lock:
+                dirty, self._dirty = self._dirty, set()
+                self._unsaved = 0
+                self._saved_at = time.monotonic()
+                rows = [(api, key, budget, period, used)
+                        for api, key in dirty
+                        for budget, (period, used)
+                        in self._usage[(api, key)].items()]
+            if self.path is None or not rows:
+                return True
+            try:
+                with self._connection_lock, self.connection:
+                    self.connection.executemany(
+                        'INSERT OR REPLACE INTO api_quota (api, key, '
+                        'budget, period, used) VALUES (?, ?, ?, ?, ?)', rows)
+            except (OSError, sqlite3.Error):
+                with self._lock:
+                    self._dirty |= dirty
+                return False
+            return True
+        finally:
+            self._save_lock.release()
+
+    def _spent(self, api: str, usage: Dict[str, list]) -> Optional[str]:
+        """Returns the name of the spent budget, if any."""
+        limits = self.quotas.get(api, {})
+        for budget in PERIODS:
+            limit = limits.get(budget)
+            if limit is not None and usage[budget][1] >= limit:
+                return budget
+        return None
+
+    def _bucket(self, api: str, key: str) -> Optional[TokenBucket]:
+        """Returns token bucket of the key or ``None`` if unlimited."""
+        rate = self.quotas.get(api, {}).get('per_second')
+        if rate is None:
+            return None
+        if (api, key) not in self._buckets:
+            self._buckets[(api, key)] = TokenBucket(rate)
+        return self._buckets[(api, key)]
+
+    def acquire(self,
+                api: str,
+                key: str,
+                priority: Optional[int] = PRIORITY_NORMAL,
+                timeout: Optional[float] = None) -> None:
+        """Waits for a slot of the API key & charges it to the budgets.
+
+        Args:
+            api: Name of the upstream API, i.e. ``darksky`` or ``maps``.
+            key: API key the request is made with.
+            priority: Priority of the request in the queue. Background
+                      refreshes use ``PRIORITY_LOW``.
+                      Default: 0
+            timeout: Seconds to wait for the slot. The limiter's timeout
+                     is used if ``None`` is passed.
+                     Default: None
+
+        Raises:
+            QuotaExceeded: If a budget of the key is spent or no slot
+                           was available before the timeout.
+        """
+        key = self._hash(key)
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        queue_key = api, key
+        entry = (-priority, next(self._sequence))
+
+        with self._ready:
+            queue = self._queues.setdefault(queue_key, [])
+            heapq.heappush(queue, entry)
+            waited = False
+            try:
+                while True:
+                    usage = self._load(api, key)
+                    budget = self._spent(api, usage)
+                    if budget is not None:
+                        self.rejected += 1
+                        raise QuotaExceeded(f'{budget.capitalize()} budget '
+                                            f'of "{api}" is spent.')
+                    bucket = self._bucket(api, key)
+                    delay = 0.0 if bucket is None else bucket.delay()
+                    if queue[0] == entry and delay <= 0.0:
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0.0:
+                        self.rejected += 1
+                        raise QuotaExceeded(f'No slot of "{api}" available '
+                                            f'within {timeout} seconds.')
+                    if not waited:
+                        waited = True
+                        self.queued += 1
+                    # Requests behind the head of the queue are woken up
+                    # when it is served, the head wakes up on its own.
+                    self._ready.wait(min(delay or remaining, remaining))
+            finally:
+                queue.remove(entry)
+                heapq.heapify(queue)
+                self._ready.notify_all()
+
+            if bucket is not None:
+                bucket.take()
+            for budget in PERIODS:
+                usage[budget][1] += 1
+            self.granted += 1
+            self.granted_by_api[api] += 1
+            self._dirty.add(queue_key)
+            self._unsaved += 1
+            due = (self._unsaved >= self.save_every or time.monotonic()
+                   - self._saved_at >= self.save_interval)
+
+        # Written outside the lock, a write already underway is left to
+        # pick these up with the next batch.
+        if due:
+            self.flush(blocking=False)
+
+    def remaining(self, api: str, key: str) -> Dict[str, Optional[int]]:
+        """Returns requests left in the daily & monthly budgets."""
+        with self._lock:
+            usage = self._load(api, self._hash(key))
+            limits = self.quotas.get(api, {})
+            return {budget: (None if limits.get(budget) is None
+                             else max(0, limits[budget] - usage[budget][1]))
+                    for budget in PERIODS}
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns number of granted, queued & rejected requests."""
+        return {'granted': self.granted,
+                'queued': self.queued,
+                'rejected': self.rejected,
+                'waiting': sum(map(len, self._queues.values())),
+                'by_api': dict(self.granted_by_api)}
+
+
+# Shared limiter for all the upstream API keys.
+quota_limiter = QuotaLimiter()
@@ -0,0 +1,137 @@
+# Copyright 2020 XAMES3. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ======================================================================
+"""
+The `pyxa.core.singleflight` module coalesces identical in-flight calls.
+
+When many threads ask for the same thing at the same time, only the
+first one makes the upstream request. The others wait for it and share
+its result (or its exception) instead of repeating the request.
+"""
+# The following comment should be removed at some point in the future.
+# pylint: disable=import-error
+# pylint: disable=no-name-in-module
+
+import functools
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, Hashable
+
+
+class _Call(object):
+    """In-flight call shared by the coalesced callers."""
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """Group of calls which are deduplicated while in flight.
+
+    Example:
+        >>> from pyxa.core.singleflight import SingleFlight
+        >>> group = SingleFlight()
+        >>> group.do(('forecast', 'London'), forecast, maps_key,
+                     darksky_key, 'London')
+        >>> group.stats()
+        {'calls': 1, 'coalesced': 0, 'in_flight': 0, 'by_name': {}}
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.calls = self.coalesced = 0
+        self.coalesced_by_name = Counter()
+
+    def do(self,
+           key: Hashable,
+           function: Callable,
+           *args: Any,
+           **kwargs: Any) -> Any:
+        """Calls function unless an identical call is already running.
+
+        Args:
+            key: Key identifying identical calls.
+            function: Function to be called by the first caller.
+
+        Returns:
+            Result of the function, shared by all the coalesced callers.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+                self.coalesced_by_name[getattr(function, '__name__',
+                                               str(function))] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function(*args, **kwargs)
+            return call.result
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns number of upstream & coalesced calls."""
+        return {'calls': self.calls,
+                'coalesced': self.coalesced,
+                'in_flight': len(self._calls),
+                'by_name': dict(self.coalesced_by_name)}
+
+
+# Shared group used by the ``pyxa.core`` functions.
+flight = SingleFlight()
+
+
+def coalesce(function: Callable) -> Callable:
+    """Single-flight decorator.
+
+    Decorator function which coalesces concurrent calls to the decorated
+    function made with identical arguments into one call through the
+    shared ``flight`` group. Calls with unhashable arguments are simply
+    passed through.
+
+    Returns:
+        ``inner`` function object which shares in-flight results.
+    """
+
+    @functools.wraps(function)
+    def inner(*args: Any, **kwargs: Any) -> Any:
+        """Inner decorator function."""
+        key = (function.__module__, function.__qualname__,
+               args, tuple(sorted(kwargs.items())))
+        try:
+            hash(key)
+        except TypeError:
+            return function(*args, **kwargs)
+        return flight.do(key, function, *args, **kwargs)
+    return inner
@@ -24,30 +24,61 @@ with relative ease.
 # pylint: disable=import-error
 # pylint: disable=no-name-in-module
 
-from typing import Optional, Tuple, Union
+import asyncio
+import copy
+import logging
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
 
 import requests
 
-from pyxa.core.location import get_coordinates, get_part_of_day
-from pyxa.utils.settings import DEFAULT_WEATHER_URL
-from pyxa.utils.system import check_internet, resolve_number_of_days
+from pyxa.core.archive import forecast_archive
+from pyxa.core.cache import forecast_cache
+from pyxa.core.forecast import CANONICAL_UNITS, Forecast, wind_direction
+from pyxa.core.location import geocode, get_zone_name, is_unreachable
+from pyxa.core.places import offline_zone_name
+from pyxa.core.quota import PRIORITY_LOW, PRIORITY_NORMAL, quota_limiter
+from pyxa.core.singleflight import coalesce, flight
+from pyxa.utils.exceptions import (CircuitOpen, DeadlineExceeded,
+                                   QuotaExceeded)
+from pyxa.utils.network import session_manager
+from pyxa.utils.settings import (DEFAULT_CHARSET, DEFAULT_MAX_CONCURRENCY,
+                                 DEFAULT_PREFETCH_INTERVAL,
+                                 DEFAULT_PREFETCH_REFRESH_AHEAD,
+                                 DEFAULT_WEATHER_URL, USER_PROFILE_PATH)
+from pyxa.utils.system import connectivity
 
+logger = logging.getLogger(__name__)
+
+# Running prefetchers, consulted for serving stale warm forecasts.
+_prefetchers = weakref.WeakSet()
+
+# Workers running the overlapped stages of a single forecast.
+_pipeline = ThreadPoolExecutor(max_workers=DEFAULT_MAX_CONCURRENCY,
+                               thread_name_prefix='pyxa-forecast')
+
+# Parsed & converted forecasts of the payloads held by the in-memory
+# tier of ``forecast_cache``, keyed on the payload & the units.
+_parsed = OrderedDict()
+_parsed_lock = threading.Lock()
 
-def wind_direction(degree: Union[float, int]) -> str:
-    """Returns direction of the wind."""
-    directions = ['northern', 'northeastern', 'eastern', 'southeastern',
-                  'southern', 'southwestern', 'western', 'northwestern']
-    idx = int((degree + 11.25) / 22.5)
-    return directions[idx % len(directions)]
 
 # This function will no longer be usuable since DarkSky has been bought
 # by Apple.
+@coalesce
 def forecast(maps_key: str,
              darksky_key: str,
              location: Optional[str] = None,
              days: Optional[int] = None,
              hours: Optional[int] = None,
-             metric: Optional[bool] = True) -> Union[None, Tuple]:
+             metric: Optional[bool] = True,
+             use_cache: Optional[bool] = True,
+             deadline: Optional[float] = None) -> Union[None, Tuple]:
     """Provides weather forecast.
 
     Fetches the weather forecast for current or particular location on
@@ -66,6 +97,12 @@ def forecast(maps_key: str,
                Default: None
         metric: Metric units to be used, Metric or Imperial.
                 Default: True
+        use_cache: Reuse a recently fetched forecast for the location
+                   from ``forecast_cache`` instead of calling the API.
+                   Default: True
+        deadline: Seconds the whole call may take, across the geocode,
+                  the zone lookup & the weather fetch.
+                  Default: None
 
     Example:
         >>> import os
@@ -88,71 +125,544 @@ def forecast(maps_key: str,
 
     Raises:
         ValueError: If the function is called without a valid API key.
+        QuotaExceeded: If the weather API budget is spent and there is
+                       no earlier forecast for the location to fall
+                       back to.
+        CircuitOpen: If the weather API is failing and there is no
+                     earlier forecast for the location to fall back to.
+        HTTPError: If the weather API responds with an error and there
+                   is no earlier forecast for the location.
+        DeadlineExceeded: If the forecast isn't ready within the
+                          deadline.
     """
-    if check_internet():
-        latitude, longitude, zone = get_coordinates(maps_key, location, 'city')
+    return _unless_offline(_forecast, maps_key, darksky_key, location, days,
+                           hours, metric, use_cache, deadline)
 
-        if metric:
-            units, degree, per_hr = 'si', '°C', 'kph'
-        else:
-            units, degree, per_hr = 'us', '°F', 'mph'
-
-        url = (f'{DEFAULT_WEATHER_URL}{darksky_key}/{latitude},{longitude}?'
-               f'units={units}')
-        weather_obj = requests.get(url).json()
-
-        if days and days <= 7 and days > 0:
-            data, idx = weather_obj['daily']['data'][days], 0
-            temp = f'{weather_obj["currently"]["temperature"]}{degree}'
-            feel = f'{weather_obj["currently"]["apparentTemperature"]}{degree}'
-            max_temp = f'{data["apparentTemperatureMax"]}{degree}'
-            min_temp = f'{data["apparentTemperatureMin"]}{degree}'
-        elif hours and hours <= 48:
-            data, idx = weather_obj['hourly']['data'][hours], 1
-            value = weather_obj['daily']['data'][0]
-            temp = f'{data["currently"]["temperature"]}{degree}'
-            feel = f'{data["currently"]["apparentTemperature"]}{degree}'
-            max_temp = f'{value["apparentTemperatureMax"]}{degree}'
-            min_temp = f'{value["apparentTemperatureMin"]}{degree}'
-        else:
-            data, idx = weather_obj['currently'], 2
-            value = weather_obj['daily']['data'][0]
-            temp = f'{weather_obj["currently"]["temperature"]}{degree}'
-            feel = f'{weather_obj["currently"]["apparentTemperature"]}{degree}'
-            max_temp = f'{value["apparentTemperatureMax"]}{degree}'
-            min_temp = f'{value["apparentTemperatureMin"]}{degree}'
-
-        condition = f'{(data["summary"]).lower()[:-1]}'
-
-        if condition.startswith('possible'):
-            old, new = "possible", "possible to have"
-            condition = f'{condition.replace(old, new)} weather'
-
-        if condition.startswith('rain'):
-            condition = condition.replace('rain', 'rainy weather')
-
-        if condition.endswith('cloudy'):
-            condition = condition + ' weather'
-
-        if condition.startswith('light'):
-            old, new = "light", "possible to have light"
-            condition = f'{condition.replace(old, new)} weather'
-
-        if condition.startswith('heavy'):
-            old, new = "heavy", "possible to have heavy"
-            condition = f'{condition.replace(old, new)} weather'
-
-        humidity = f'{data["humidity"] * 100}%'
-        speed = f'{data["windSpeed"]} {per_hr}'
-        summary = str(weather_obj['daily']['summary']).lower()
-        cloud = data['cloudCover']
-        sky = 'brighter' if cloud < 0.5 else 'darker'
-        direction = wind_direction(data['windBearing'])
-        part = get_part_of_day()
-        day = resolve_number_of_days(days)
-        sub = 'day' if days == 1 else 'days'
-
-        return (zone, idx, temp, feel, max_temp, min_temp, humidity, speed,
-                summary, sky, direction, part, day, sub)
-    else:
+
+@coalesce
+def get_forecast(maps_key: str,
+                 darksky_key: str,
+                 location: Optional[str] = None,
+                 metric: Optional[bool] = True,
+                 use_cache: Optional[bool] = True,
+                 deadline: Optional[float] = None) -> Optional[Forecast]:
+    """Provides complete weather forecast.
+
+    Fetches the weather forecast same as ``forecast`` but returns the
+    parsed ``Forecast`` object holding the current, hourly & daily
+    series. Any horizon can then be queried or summarized from it
+    without making another API call.
+
+    Example:
+        >>> import os
+        >>> from pyxa.core.weather import get_forecast
+        >>> maps_key = os.environ.get('MAPS_API_KEY')
+        >>> darksky_key = os.environ.get('DARKSKY_API_KEY')
+        >>> london = get_forecast(maps_key, darksky_key, 'London')
+        >>> london.daily['apparentTemperatureMax']
+        array([12.94, 11.2 , 10.87, 9.05, 8.11, 9.93, 10.4 , 11.02])
+        >>> london.summarize(hours=5)
+        ('London', 1, '3.11°C', '0.42°C', '12.94°C', '5.33°C', ...)
+
+    Returns:
+        Forecast object for the location or ``None`` if there is no
+        internet connection.
+    """
+    return _unless_offline(_fetch_forecast, maps_key, darksky_key, location,
+                           metric, use_cache, deadline)
+
+
+def _unless_offline(function: Callable, *args: Any) -> Any:
+    """Calls function, returning ``None`` if the APIs are unreachable.
+
+    The internet isn't probed before the call. The connectivity is
+    learnt from the call's own requests instead, and only a fresh
+    offline state known from earlier failures skips the call.
+    """
+    if connectivity.known_offline():
+        return None
+    try:
+        return function(*args)
+    except Exception as error:
+        if not is_unreachable(error):
+            raise
+        connectivity.update(False)
         return None
+
+
+def _remaining(expires_at: Optional[float]) -> Optional[float]:
+    """Returns seconds left till the deadline, raising once it's over."""
+    if expires_at is None:
+        return None
+    remaining = expires_at - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceeded('Forecast could not be completed within '
+                               'its deadline.')
+    return remaining
+
+
+def _stage(expires_at: Optional[float],
+           name: str,
+           function: Callable,
+           *args: Any) -> Any:
+    """Runs stage of the forecast, giving up on it at the deadline."""
+    if expires_at is None:
+        return function(*args)
+    try:
+        return _pipeline.submit(function, *args).result(
+            _remaining(expires_at))
+    except FutureTimeoutError:
+        raise DeadlineExceeded(f'{name} could not be completed within the '
+                               'deadline.') from None
+    except requests.RequestException:
+        # Requests cut short by the deadline are retried & reported as
+        # connection errors, they don't mean being offline.
+        if time.monotonic() >= expires_at:
+            raise DeadlineExceeded(f'{name} could not be completed within '
+                                   'the deadline.') from None
+        raise
+
+
+def _fetch_forecast(maps_key: str,
+                    darksky_key: str,
+                    location: Optional[str] = None,
+                    metric: Optional[bool] = True,
+                    use_cache: Optional[bool] = True,
+                    deadline: Optional[float] = None) -> Forecast:
+    """Fetches and parses the forecast without the internet check.
+
+    The weather fetch needs only the coordinates, hence it overlaps with
+    the zone lookup instead of waiting for it. If the zone isn't ready
+    by the deadline, the nearest offline place is used for it.
+
+    The forecast is always fetched & cached in the canonical SI units
+    and converted locally, hence metric & imperial callers share the
+    same upstream call and cache entry.
+    """
+    expires_at = None if deadline is None else time.monotonic() + deadline
+
+    latitude, longitude = _stage(expires_at, 'Geocode', geocode, maps_key,
+                                 location)
+    zone_lookup = _pipeline.submit(get_zone_name, latitude, longitude, 'city')
+
+    weather_obj = None
+    if use_cache:
+        weather_obj = forecast_cache.get(latitude, longitude, CANONICAL_UNITS)
+        if weather_obj is None:
+            weather_obj = _serve_stale(latitude, longitude)
+
+    if weather_obj is None:
+        try:
+            weather_obj = _stage(expires_at, 'Weather fetch', _fetch_payload,
+                                 darksky_key, latitude, longitude,
+                                 PRIORITY_NORMAL, _remaining(expires_at))
+        except (QuotaExceeded, CircuitOpen, requests.HTTPError) as error:
+            # Once the budget is spent or the weather API is failing, an
+            # expired forecast is still a better answer than none at all.
+            entry = forecast_cache.lookup(latitude, longitude,
+                                          CANONICAL_UNITS)
+            if entry is None:
+                raise
+            reason = ('weather API budget is spent'
+                      if isinstance(error, QuotaExceeded)
+                      else 'weather API is failing')
+            logger.warning(f'Serving forecast fetched at {entry[0]} as the '
+                           f'{reason}.')
+            weather_obj = entry[1]
+
+    try:
+        zone = zone_lookup.result(
+            None if expires_at is None
+            else max(0.0, expires_at - time.monotonic()))
+    except FutureTimeoutError:
+        zone = offline_zone_name(latitude, longitude, 'city')
+    except Exception as error:
+        if not is_unreachable(error):
+            raise
+        zone = offline_zone_name(latitude, longitude, 'city')
+
+    return _parse(weather_obj, 'si' if metric else 'us', zone)
+
+
+def _parse(payload: Dict, units: str, zone: Optional[str]) -> Forecast:
+    """Returns the payload parsed & converted, reusing earlier parses.
+
+    Cache hits return the very payload object which was stored, hence
+    it is parsed & converted only once while it stays in memory. The
+    payload is kept alongside, so that its id can't be reused.
+    """
+    key = id(payload), units
+    with _parsed_lock:
+        entry = _parsed.get(key)
+        if entry is not None and entry[0] is payload:
+            _parsed.move_to_end(key)
+            forecast = entry[1]
+        else:
+            forecast = None
+
+    if forecast is None:
+        forecast = Forecast(payload, CANONICAL_UNITS).convert(units)
+        with _parsed_lock:
+            _parsed[key] = payload, forecast
+            # Both the units of every payload in the in-memory tier.
+            while len(_parsed) > 2 * forecast_cache.max_entries:
+                _parsed.popitem(last=False)
+
+    # The zone differs between the locations sharing a cache cell.
+    forecast = copy.copy(forecast)
+    forecast.zone = zone
+    return forecast
+
+
+def _fetch_payload(darksky_key: str,
+                   latitude: float,
+                   longitude: float,
+                   priority: Optional[int] = PRIORITY_NORMAL,
+                   timeout: Optional[float] = None) -> Dict:
+    """Fetches the SI forecast payload from the API and caches it.
+
+    Concurrent fetches for the same cache cell share one upstream call.
+    """
+    key = forecast_cache.key(latitude, longitude, CANONICAL_UNITS)
+    return flight.do(('forecast_payload', darksky_key, key), _request_payload,
+                     darksky_key, latitude, longitude, priority, timeout)
+
+
+def _request_payload(darksky_key: str,
+                     latitude: float,
+                     longitude: float,
+                     priority: int,
+                     timeout: Optional[float] = None) -> Dict:
+    """Requests the SI forecast payload from the API and caches it."""
+    quota_limiter.acquire('darksky', darksky_key, priority, timeout)
+    url = (f'{DEFAULT_WEATHER_URL}{darksky_key}/{latitude},{longitude}?'
+           f'units={CANONICAL_UNITS}')
+    response = session_manager.get(url, timeout=timeout)
+    # Error payloads must never be cached in place of a forecast.
+    response.raise_for_status()
+    weather_obj = response.json()
+    forecast_cache.set(latitude, longitude, CANONICAL_UNITS, weather_obj)
+    try:
+        forecast_archive.record(weather_obj)
+    except OSError as error:
+        logger.warning(f'Could not archive forecast: {error}')
+    return weather_obj
+
+
+def _serve_stale(latitude: float, longitude: float) -> Optional[Dict]:
+    """Returns stale payload of a warm location, refreshing it."""
+    key = forecast_cache.key(latitude, longitude, CANONICAL_UNITS)
+    for prefetcher in list(_prefetchers):
+        if prefetcher.is_warm(key):
+            return prefetcher.serve_stale(key)
+    return None
+
+
+def _forecast(maps_key: str,
+              darksky_key: str,
+              location: Optional[str] = None,
+              days: Optional[int] = None,
+              hours: Optional[int] = None,
+              metric: Optional[bool] = True,
+              use_cache: Optional[bool] = True,
+              deadline: Optional[float] = None) -> Tuple:
+    """Fetches and formats the forecast without the internet check."""
+    return _fetch_forecast(maps_key, darksky_key, location, metric,
+                           use_cache, deadline).summarize(days, hours)
+
+
+def forecast_many(maps_key: str,
+                  darksky_key: str,
+                  locations: Sequence[Optional[str]],
+                  days: Optional[int] = None,
+                  hours: Optional[int] = None,
+                  metric: Optional[bool] = True,
+                  use_cache: Optional[bool] = True,
+                  max_concurrency: Optional[int] = DEFAULT_MAX_CONCURRENCY
+                  ) -> List[Union[None, Tuple, Exception]]:
+    """Provides weather forecast for multiple locations.
+
+    Fetches the weather forecast for all the locations concurrently.
+    Geocoding and weather calls are fanned out over a bounded pool of
+    worker threads which share the pooled session of
+    ``pyxa.utils.network``. Repeated locations are fetched only once.
+
+    Args:
+        locations: Sequence of locations to find the weather forecast
+                   for. ``None`` stands for the current location.
+        days: Number of days for which the forecast is needed.
+              Default: None
+        hours: Number of hours for which the forecast is needed.
+               Default: None
+        metric: Metric units to be used, Metric or Imperial.
+                Default: True
+        use_cache: Reuse recently fetched forecasts from the cache.
+                   Default: True
+        max_concurrency: Maximum number of locations resolved at once.
+                         Default: 16
+
+    Example:
+        >>> import os
+        >>> from pyxa.core.weather import forecast_many
+        >>> maps_key = os.environ.get('MAPS_API_KEY')
+        >>> darksky_key = os.environ.get('DARKSKY_API_KEY')
+        >>> results = forecast_many(maps_key, darksky_key,
+                                    ['London', 'Paris', 'Mumbai'])
+
+    Returns:
+        List with one entry per location in the input order. Each entry
+        is either the forecast tuple returned by ``forecast`` or the
+        exception raised while resolving that location. Like
+        ``forecast``, an entry is ``None`` if the APIs are unreachable
+        for that location.
+    """
+    unique = list(dict.fromkeys(locations))
+
+    def _each_location(location: Optional[str]) -> Union[Tuple, Exception]:
+        """Resolves forecast for a single location of the batch."""
+        try:
+            return _unless_offline(_forecast, maps_key, darksky_key,
+                                   location, days, hours, metric, use_cache)
+        except Exception as error:
+            return error
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        resolved = dict(zip(unique, executor.map(_each_location, unique)))
+
+    return [resolved[location] for location in locations]
+
+
+async def forecast_many_async(maps_key: str,
+                              darksky_key: str,
+                              locations: Sequence[Optional[str]],
+                              days: Optional[int] = None,
+                              hours: Optional[int] = None,
+                              metric: Optional[bool] = True,
+                              use_cache: Optional[bool] = True,
+                              max_concurrency: Optional[int] = (
+                                  DEFAULT_MAX_CONCURRENCY)
+                              ) -> List[Union[None, Tuple, Exception]]:
+    """Provides weather forecast for multiple locations asynchronously.
+
+    Asyncio variant of ``forecast_many``. The blocking upstream calls
+    run in a dedicated executor while a semaphore bounds how many
+    locations are in flight at once.
+
+    Example:
+        >>> import asyncio
+        >>> from pyxa.core.weather import forecast_many_async
+        >>> results = asyncio.run(forecast_many_async(maps_key,
+                                                      darksky_key,
+                                                      ['London', 'Paris']))
+
+    Returns:
+        List with one entry per location in the input order, same as
+        ``forecast_many``.
+    """
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=max_concurrency)
+
+    try:
+        unique = list(dict.fromkeys(locations))
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def _each_location(location: Optional[str]
+                                 ) -> Union[Tuple, Exception]:
+            """Resolves forecast for a single location of the batch."""
+            async with semaphore:
+                try:
+                    return await loop.run_in_executor(
+                        executor,
+                        lambda: _unless_offline(_forecast, maps_key,
+                                                darksky_key, location, days,
+                                                hours, metric, use_cache))
+                except Exception as error:
+                    return error
+
+        results = await asyncio.gather(*map(_each_location, unique))
+    finally:
+        executor.shutdown(wait=False)
+
+    resolved = dict(zip(unique, results))
+    return [resolved[location] for location in locations]
+
+
+def load_prefetch_locations(path: Optional[str] = USER_PROFILE_PATH
+                            ) -> List[str]:
+    """Returns the locations listed under ``weather`` in the profile."""
+    import yaml
+
+    with open(path, encoding=DEFAULT_CHARSET) as file:
+        profile = yaml.safe_load(file) or {}
+
+    return list((profile.get('weather') or {}).get('locations') or [])
+
+
+class ForecastPrefetcher(object):
+    """Background scheduler keeping forecasts of hot locations warm.
+
+    A daemon thread checks the cached forecast of every configured
+    location and refreshes the ones which have used up ``refresh_ahead``
+    of their TTL, before they actually expire. If a forecast does
+    expire, ``forecast`` keeps serving the stale one from the cache
+    while a refresh is in flight (stale-while-revalidate).
+
+    Args:
+        maps_key: Google Maps API key.
+        darksky_key: DarkSky API key.
+        locations: Locations to be kept warm. Locations listed in the
+                   user profile are used if ``None`` is passed.
+                   Default: None
+        refresh_ahead: Fraction of the TTL after which a forecast is
+                       refreshed.
+                       Default: 0.8
+        interval: Seconds between the checks.
+                  Default: 30.0
+        max_concurrency: Maximum number of refreshes made at once.
+                         Default: 16
+
+    Example:
+        >>> from pyxa.core.weather import ForecastPrefetcher, forecast
+        >>> prefetcher = ForecastPrefetcher(maps_key, darksky_key,
+                                            ['London', 'Mumbai'])
+        >>> prefetcher.start()
+        >>> forecast(maps_key, darksky_key, 'London')  # From memory.
+        >>> prefetcher.stats()
+        {'locations': 2, 'refreshes': 2, 'stale_served': 0, 'errors': 0}
+    """
+
+    def __init__(self,
+                 maps_key: str,
+                 darksky_key: str,
+                 locations: Optional[Sequence[str]] = None,
+                 refresh_ahead: Optional[float] = (
+                     DEFAULT_PREFETCH_REFRESH_AHEAD),
+                 interval: Optional[float] = DEFAULT_PREFETCH_INTERVAL,
+                 max_concurrency: Optional[int] = DEFAULT_MAX_CONCURRENCY
+                 ) -> None:
+        self.maps_key = maps_key
+        self.darksky_key = darksky_key
+        self.locations = list(locations if locations is not None
+                              else load_prefetch_locations())
+        self.refresh_ahead = refresh_ahead
+        self.interval = interval
+        self.max_concurrency = max_concurrency
+        self._coordinates = {}
+        self._keys = {}
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._executor = None
+        self.refreshes = self.stale_served = self.errors = 0
+
+    def _resolve(self, location: str) -> Tuple[float, float]:
+        """Returns coordinates of the location, resolving them once."""
+        with self._lock:
+            coordinates = self._coordinates.get(location)
+        if coordinates is None:
+            # Only the coordinates are needed, the zone is never looked
+            # up for a prefetch.
+            coordinates = tuple(geocode(self.maps_key, location))
+            key = forecast_cache.key(*coordinates, CANONICAL_UNITS)
+            with self._lock:
+                self._coordinates[location] = coordinates
+                self._keys[key] = coordinates
+        return coordinates
+
+    def is_warm(self, key: str) -> bool:
+        """Returns whether the cache key is kept warm by this one."""
+        return self._thread is not None and key in self._keys
+
+    def serve_stale(self, key: str) -> Optional[Dict]:
+        """Returns stale payload of the key and triggers its refresh."""
+        coordinates = self._keys.get(key)
+        if coordinates is None:
+            return None
+        entry = forecast_cache.lookup(*coordinates, CANONICAL_UNITS)
+        self._schedule(coordinates)
+        if entry is None:
+            return None
+        with self._lock:
+            self.stale_served += 1
+        return entry[1]
+
+    def _schedule(self, coordinates: Tuple[float, float]) -> None:
+        """Submits refresh of the coordinates unless already running."""
+        with self._lock:
+            if coordinates in self._in_flight or self._executor is None:
+                return
+            self._in_flight.add(coordinates)
+            self._executor.submit(self._refresh, coordinates)
+
+    def _refresh(self, coordinates: Tuple[float, float]) -> None:
+        """Refreshes the forecast of the coordinates."""
+        try:
+            _fetch_payload(self.darksky_key, *coordinates, PRIORITY_LOW)
+            with self._lock:
+                self.refreshes += 1
+        except Exception as error:
+            with self._lock:
+                self.errors += 1
+            logger.warning(f'Could not refresh forecast for {coordinates}: '
+                           f'{error}')
+        finally:
+            with self._lock:
+                self._in_flight.discard(coordinates)
+
+    def refresh_due(self) -> None:
+        """Refreshes forecasts which are missing or close to expiry."""
+        for location in self.locations:
+            try:
+                coordinates = self._resolve(location)
+            except Exception as error:
+                with self._lock:
+                    self.errors += 1
+                logger.warning(f'Could not resolve "{location}": {error}')
+                continue
+            entry = forecast_cache.lookup(*coordinates, CANONICAL_UNITS)
+            if (entry is None or time.time() - entry[0]
+                    >= self.refresh_ahead * forecast_cache.ttl):
+                self._schedule(coordinates)
+
+    def _run(self) -> None:
+        """Refreshes due forecasts until stopped."""
+        while True:
+            self.refresh_due()
+            if self._stop.wait(self.interval):
+                break
+
+    def start(self) -> None:
+        """Starts the background scheduler."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrency,
+            thread_name_prefix='pyxa-prefetch')
+        self._thread = threading.Thread(target=self._run,
+                                        name='pyxa-prefetcher',
+                                        daemon=True)
+        self._thread.start()
+        _prefetchers.add(self)
+
+    def stop(self) -> None:
+        """Stops the background scheduler."""
+        _prefetchers.discard(self)
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns refresh counters of the prefetcher."""
+        with self._lock:
+            return {'locations': len(self.locations),
+                    'refreshes': self.refreshes,
+                    'stale_served': self.stale_served,
+                    'errors': self.errors,
+                    'in_flight': len(self._in_flight)}
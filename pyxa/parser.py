@@ -36,7 +36,7 @@ import argparse
 
 from pyxa.cli import strings
 from pyxa.cli.arguments import add_logging_options
-from pyxa.cli.commands import create
+from pyxa.cli.commands import create, geocode
 from pyxa.cli.formatter import PyXAHelpFormatter as HelpFormatter
 from pyxa.utils.common import check_version, set_log_level
 from pyxa.utils.settings import PACKAGE_NAME
@@ -88,6 +88,7 @@ def global_parser() -> argparse.ArgumentParser:
 
     subparsers = parser.add_subparsers(prog=prog)
     create.subparser(subparsers, parents=parent_parsers)
+    geocode.subparser(subparsers, parents=parent_parsers)
 
     return parser
 
@@ -107,6 +108,7 @@ def main() -> None:
 
         Commands:
             create       Create project directory structure for the ...
+            geocode      Geocode addresses of a CSV file into latitudes ...
 
         Extra Options:
         -h, --help     Show help.
@@ -0,0 +1,322 @@
+# Copyright 2020 XAMES3. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ======================================================================
+"""
+The `pyxa.utils.benchmark` module measures latency & throughput.
+
+The suite in this module runs the weather & location functions against
+the local replay server of `pyxa.utils.replay`, hence the numbers don't
+depend on the live APIs and regressions show up run over run. It can be
+run from the command line as ``python -m pyxa.utils.benchmark``, with
+``--fuzzy`` running the fuzzy matching suite instead.
+"""
+# The following comment should be removed at some point in the future.
+# pylint: disable=import-error
+# pylint: disable=no-name-in-module
+
+import argparse
+import contextlib
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, Optional, Sequence
+
+import numpy as np
+
+from pyxa.utils.settings import (DEFAULT_TRIGRAM_OVERLAP,
+                                 DEFAULT_TRIGRAM_SHORTLIST)
+
+# Keys accepted by the clients, they never leave the replay server.
+REPLAY_MAPS_KEY = 'AIzaReplayKey'
+REPLAY_DARKSKY_KEY = 'replay'
+
+
+def measure(function: Callable[[int], Any],
+            calls: Optional[int] = 100,
+            concurrency: Optional[int] = 1,
+            warmup: Optional[int] = 1) -> Dict[str, float]:
+    """Measures latency & throughput of the function.
+
+    Args:
+        function: Function to be measured. It is passed the number of
+                  the call, hence every call can use different inputs.
+        calls: Number of measured calls.
+               Default: 100
+        concurrency: Number of calls made at once.
+                     Default: 1
+        warmup: Number of unmeasured calls made first.
+                Default: 1
+
+    Example:
+        >>> from pyxa.utils.benchmark import measure
+        >>> measure(lambda idx: sum(range(idx)), calls=1000)
+        {'calls': 1000, 'errors': 0, 'p50': 0.01, 'p99': 0.04, ...}
+
+    Returns:
+        Dictionary of calls & errors along with the p50, p99 & mean
+        latency in milliseconds and the throughput in calls per second.
+    """
+    for idx in range(warmup):
+        function(-idx - 1)
+
+    def _each_call(idx: int) -> float:
+        """Returns latency of a single call, ``NaN`` if it failed."""
+        start = time.perf_counter()
+        try:
+            function(idx)
+        except Exception:
+            return np.nan
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = np.fromiter(executor.map(_each_call, range(calls)),
+                                dtype=np.float64, count=calls)
+    elapsed = time.perf_counter() - start
+
+    succeeded = latencies[~np.isnan(latencies)] * 1000
+    if not len(succeeded):
+        succeeded = np.array([np.nan])
+    return {'calls': calls,
+            'errors': int(np.isnan(latencies).sum()),
+            'p50': float(np.percentile(succeeded, 50)),
+            'p99': float(np.percentile(succeeded, 99)),
+            'mean': float(np.mean(succeeded)),
+            'throughput': calls / elapsed}
+
+
+@contextlib.contextmanager
+def _isolated() -> Iterator[None]:
+    """Keeps the caches & budgets of the suite away from the real ones."""
+    from pyxa.core.cache import forecast_cache, geocode_cache
+    from pyxa.core.quota import quota_limiter
+
+    directory, geocode_path = forecast_cache.directory, geocode_cache.path
+    quota_path, quotas = quota_limiter.path, quota_limiter.quotas
+    with tempfile.TemporaryDirectory() as temp_dir:
+        forecast_cache.directory = None
+        forecast_cache.clear()
+        geocode_cache.close()
+        geocode_cache.path = os.path.join(temp_dir, 'benchmark.db')
+        # Pending usage goes to the real database before the swap & the
+        # suite's usage is dropped before the swap back.
+        quota_limiter.flush()
+        quota_limiter.path = None
+        quota_limiter.quotas = {}
+        try:
+            yield
+        finally:
+            forecast_cache.clear()
+            forecast_cache.directory = directory
+            geocode_cache.close()
+            geocode_cache.path = geocode_path
+            quota_limiter.flush()
+            quota_limiter.path, quota_limiter.quotas = quota_path, quotas
+
+
+def run_suite(calls: Optional[int] = 100,
+              concurrency: Optional[int] = 8,
+              latency: Optional[float] = 0.02,
+              jitter: Optional[float] = 0.005,
+              error_rate: Optional[float] = 0.0,
+              recordings: Optional[str] = None
+              ) -> Dict[str, Dict[str, float]]:
+    """Runs the benchmark suite against the replay server.
+
+    Measures the single, batched & cached paths of ``forecast``,
+    ``get_coordinates``, ``calculate_distance`` and
+    ``calculate_distances``. The caches, the geocode database & the API
+    budgets are swapped for throwaway ones while the suite runs.
+
+    Args:
+        calls: Number of measured calls per benchmark.
+               Default: 100
+        concurrency: Number of calls made at once.
+                     Default: 8
+        latency: Seconds the replay server delays every response by.
+                 Default: 0.02
+        jitter: Maximum random seconds added to the latency.
+                Default: 0.005
+        error_rate: Fraction of the replayed requests which fail.
+                    Default: 0.0
+        recordings: Directory of the recorded payloads to be replayed.
+                    Default: None
+
+    Example:
+        >>> from pyxa.utils.benchmark import run_suite
+        >>> results = run_suite(calls=50)
+        >>> results['forecast (cached)']['p50']
+        0.09
+
+    Returns:
+        Dictionary of benchmark name to its ``measure`` results.
+    """
+    from pyxa.core.location import (calculate_distance, calculate_distances,
+                                    get_coordinates)
+    from pyxa.core.weather import forecast, forecast_many
+    from pyxa.utils.replay import ReplayServer
+
+    maps_key, darksky_key = REPLAY_MAPS_KEY, REPLAY_DARKSKY_KEY
+    places = [f'Replay Place {idx}' for idx in range(10)]
+    cases = {
+        'forecast (single)': lambda idx: forecast(
+            maps_key, darksky_key, places[idx % 10], use_cache=False),
+        'forecast (cached)': lambda idx: forecast(
+            maps_key, darksky_key, places[idx % 10]),
+        'forecast_many (10 places)': lambda idx: forecast_many(
+            maps_key, darksky_key, places, use_cache=False),
+        'get_coordinates': lambda idx: get_coordinates(
+            maps_key, f'Replay Address {idx}', 'city', use_cache=False),
+        'calculate_distance': lambda idx: calculate_distance(
+            maps_key, places[idx % 10], places[(idx + 1) % 10], 'driving'),
+        'calculate_distances (10x10)': lambda idx: calculate_distances(
+            maps_key, places, places, 'driving'),
+    }
+
+    results = {}
+    with _isolated(), ReplayServer(recordings, latency, jitter, error_rate,
+                                   seed=0):
+        for name, function in cases.items():
+            results[name] = measure(function, calls, concurrency)
+    return results
+
+
+def run_fuzzy_suite(sizes: Optional[Sequence[int]] = (1000000, 10000000),
+                    calls: Optional[int] = 100,
+                    scan_calls: Optional[int] = 5,
+                    overlap: Optional[float] = DEFAULT_TRIGRAM_OVERLAP,
+                    shortlist: Optional[int] = DEFAULT_TRIGRAM_SHORTLIST,
+                    seed: Optional[int] = 0) -> Dict[str, Dict[str, float]]:
+    """Runs the fuzzy matching suite over synthetic titles.
+
+    Builds a ``FuzzyIndex`` over random titles of three to five words
+    for each size and measures the trigram shortlisted lookups against
+    full scans of all the titles. Every query is a fragment of a title
+    with a typo. The recall is the fraction of the full scan queries
+    for which the shortlist found an equally good match.
+
+    Args:
+        sizes: Number of titles of each run.
+               Default: (1000000, 10000000)
+        calls: Number of measured shortlisted lookups.
+               Default: 100
+        scan_calls: Number of measured full scans, these take seconds
+                    each over millions of titles.
+                    Default: 5
+        overlap: Fraction of the query trigrams a title needs to share.
+                 Default: 0.5
+        shortlist: Maximum number of titles scored per query.
+                   Default: 2000
+        seed: Seed of the random titles & queries.
+              Default: 0
+
+    Example:
+        >>> from pyxa.utils.benchmark import run_fuzzy_suite
+        >>> results = run_fuzzy_suite(sizes=[1000000])
+        >>> results['fuzzy trigram (1000000)']['speedup']
+        412.7
+
+    Returns:
+        Dictionary of benchmark name to its ``measure`` results. The
+        shortlisted runs also hold the build seconds, the speedup of
+        the p50 latency & the recall.
+    """
+    from pyxa.utils.fuzzy import FuzzyIndex
+
+    rng = np.random.default_rng(seed)
+    letters = np.array(list('abcdefghijklmnopqrstuvwxyz'))
+    words = [''.join(rng.choice(letters, size))
+             for size in rng.integers(3, 10, 20000)]
+    results = {}
+    for size in sizes:
+        rows = rng.integers(0, len(words), (size, 5)).tolist()
+        lengths = rng.integers(3, 6, size).tolist()
+        titles = [' '.join([words[idx] for idx in row[:length]])
+                  for row, length in zip(rows, lengths)]
+        del rows, lengths
+        queries = []
+        for idx in rng.integers(0, size, calls + 1):
+            title = titles[idx]
+            start = int(rng.integers(0, max(1, len(title) // 3)))
+            query = list(title[start:start + 16])
+            query[len(query) // 2] = str(rng.choice(letters))
+            queries.append(''.join(query))
+
+        start = time.perf_counter()
+        index = FuzzyIndex(titles, prefilter=True, overlap=overlap,
+                           shortlist=shortlist)
+        built = time.perf_counter() - start
+        full = FuzzyIndex(index.choices, keys=index.keys, prefilter=False)
+        del titles
+
+        shortlisted = measure(lambda idx: index.match(queries[idx + 1], 0),
+                              calls)
+        scanned = measure(lambda idx: full.match(queries[idx + 1], 0),
+                          scan_calls)
+        found = [(index.match(query, 0), full.match(query, 0))
+                 for query in queries[1:scan_calls + 1]]
+        shortlisted.update(
+            build_seconds=built,
+            speedup=scanned['p50'] / shortlisted['p50'],
+            recall=float(np.mean([fast is not None and fast[1] >= slow[1]
+                                  for fast, slow in found])))
+        results[f'fuzzy full scan ({size})'] = scanned
+        results[f'fuzzy trigram ({size})'] = shortlisted
+        del index, full
+    return results
+
+
+def format_results(results: Dict[str, Dict[str, float]]) -> str:
+    """Returns benchmark results as a plain text table."""
+    lines = [f'{"benchmark":<30}{"p50 ms":>10}{"p99 ms":>10}'
+             f'{"calls/s":>10}{"errors":>8}']
+    for name, result in results.items():
+        lines.append(f'{name:<30}{result["p50"]:>10.2f}'
+                     f'{result["p99"]:>10.2f}{result["throughput"]:>10.1f}'
+                     f'{result["errors"]:>8}')
+    for name, result in results.items():
+        if 'recall' in result:
+            lines.append(f'{name}: built in {result["build_seconds"]:.1f}s, '
+                         f'{result["speedup"]:.1f}x faster, recall '
+                         f'{result["recall"]:.1%}')
+    return '\n'.join(lines)
+
+
+def main() -> None:
+    """Runs the suite with the command line options & prints it."""
+    parser = argparse.ArgumentParser(description='Benchmarks the weather & '
+                                                 'location functions.')
+    parser.add_argument('--calls', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--jitter', type=float, default=0.005)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--recordings', default=None)
+    parser.add_argument('--fuzzy', action='store_true')
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[1000000, 10000000])
+    args = parser.parse_args()
+    if args.fuzzy:
+        print(format_results(run_fuzzy_suite(args.sizes, args.calls)))
+        return
+    print(format_results(run_suite(args.calls, args.concurrency,
+                                   args.latency, args.jitter,
+                                   args.error_rate, args.recordings)))
+
+
+if __name__ == '__main__':
+    main()
@@ -29,7 +29,7 @@ import logging
 import os
 import subprocess
 import sys
-from typing import List, Optional, Union
+from typing import List, Optional, Sequence, Union
 
 from pyxa.utils.settings import DEFAULT_LOG_LEVEL, ENV_LOG_LEVEL_NAME
 
@@ -101,7 +101,8 @@ def find_string(string: str,
 
     Finds the matching string in the list and works similar to
     ``.find()`` but uses fuzzy logic for guessing text from any valid
-    list
+    list. The list is preprocessed into a ``FuzzyIndex`` which is reused
+    while the list stays the same.
 
     Args:
         string: Approximate or Exact string to find from the list.
@@ -115,15 +116,34 @@ def find_string(string: str,
     Raises:
         ValueError: If the string couldn't be found in the passed list.
     """
-    from rapidfuzz.fuzz import partial_ratio
-    from rapidfuzz.process import extract
-
-    # This will give us list of 3 best matches for our search query.
-    guessed = extract(string, string_list, limit=3, scorer=partial_ratio)
-
-    for best_guess in guessed:
-        current_score = partial_ratio(string, best_guess)
-        if current_score > min_score and current_score > 0:
-            return best_guess[0]
-        else:
-            raise ValueError(f'Couldn\'t find "{string}" in the given list.')
+    from pyxa.utils.fuzzy import fuzzy_index
+
+    match = fuzzy_index(string_list).match(string, min_score)
+    if match is None:
+        raise ValueError(f'Couldn\'t find "{string}" in the given list.')
+    return match[0]
+
+
+def find_strings(strings: Sequence[str],
+                 string_list: List,
+                 min_score: Optional[int] = 70) -> List[Optional[str]]:
+    """Finds a batch of strings in a list.
+
+    Works like ``find_string`` for every string, but scores the whole
+    batch at once across all the cores.
+
+    Args:
+        strings: Approximate or Exact strings to find from the list.
+        string_list: List in which the strings need to be searched in.
+        min_score: Minimum score needed to make an approximate guess.
+                   Default: 70
+
+    Returns:
+        List of the found strings, ``None`` for the strings which
+        couldn't be found.
+    """
+    from pyxa.utils.fuzzy import fuzzy_index
+
+    return [None if match is None else match[0]
+            for match in fuzzy_index(string_list).match_many(strings,
+                                                             min_score)]
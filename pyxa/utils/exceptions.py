@@ -27,3 +27,31 @@ class PyXAException(Exception):
     handling.
     """
     pass
+
+
+class QuotaExceeded(PyXAException):
+    """Exception class to raise when an API budget is spent.
+
+    This class is raised when a request would go over the daily or the
+    monthly budget of an upstream API, or when it couldn't get a rate
+    limit slot in time.
+    """
+    pass
+
+
+class DeadlineExceeded(PyXAException):
+    """Exception class to raise when a call runs out of its deadline.
+
+    This class is raised when the stages of a call could not complete
+    within the total time budget given to it.
+    """
+    pass
+
+
+class CircuitOpen(PyXAException):
+    """Exception class to raise when the circuit of a host is open.
+
+    This class is raised instead of sending a request to a host which
+    recently failed or responded too slowly, so the callers fail fast.
+    """
+    pass
@@ -0,0 +1,297 @@
+# Copyright 2020 XAMES3. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ======================================================================
+"""
+The `pyxa.utils.filesystem` module indexes the file names of directories.
+
+Listing & fuzzy matching a large directory tree on every lookup takes
+seconds. The index in this module is built once with ``os.scandir``,
+persisted in the cache directory and refreshed incrementally. Only the
+directories whose modification time changed are scanned again.
+"""
+# The following comment should be removed at some point in the future.
+# pylint: disable=import-error
+# pylint: disable=no-name-in-module
+
+import hashlib
+import os
+import pickle
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from pyxa.utils.fuzzy import FuzzyIndex
+from pyxa.utils.settings import DEFAULT_FILE_INDEX_REFRESH, FILE_INDEX_PATH
+
+# Version of the persisted index, older indexes are rebuilt.
+INDEX_VERSION = 1
+
+# Directories modified this close to their scan are scanned again on
+# the next refresh, as a later change could share the same mtime.
+RACY_SECONDS = 2.0
+
+
+class FileIndex(object):
+    """Persistent recursive index of the file names in a directory.
+
+    Every directory of the tree is stored with its modification time,
+    its files, its subdirectories & the preprocessed fuzzy match keys of
+    the files. A refresh walks the stored tree & only scans the
+    directories whose modification time changed, since adding, removing
+    or renaming an entry updates the modification time of its parent.
+    Symbolic links to directories aren't followed.
+
+    Lookups refresh the index at most once every ``refresh_interval``
+    seconds. Exact names are answered from a dictionary and the rest
+    through a ``FuzzyIndex`` over the keys, whose recent results are
+    cached until the index changes. Hence repeated lookups take
+    microseconds. Files added or removed by a refresh are applied to
+    the ``FuzzyIndex`` in place instead of building it again.
+
+    Args:
+        directory: Root directory of the index.
+        path: Directory in which the index is persisted. The index is
+              only kept in memory if ``None`` is passed.
+              Default: FILE_INDEX_PATH
+        refresh_interval: Seconds for which the index is trusted before
+                          a lookup refreshes it.
+                          Default: 5.0
+
+    Example:
+        >>> from pyxa.utils.filesystem import FileIndex
+        >>> index = FileIndex('D:/Music/')
+        >>> index.find('Okami')
+        'Okami/Okami - Kamiki Village.mp3'
+        >>> index.stats()
+        {'files': 214876, 'directories': 9120, 'rescanned': 0, ...}
+    """
+
+    def __init__(self,
+                 directory: str,
+                 path: Optional[str] = FILE_INDEX_PATH,
+                 refresh_interval: Optional[float] = (
+                     DEFAULT_FILE_INDEX_REFRESH)) -> None:
+        self.directory = os.path.abspath(directory)
+        digest = hashlib.sha1(self.directory.encode()).hexdigest()[:16]
+        self.path = (None if path is None
+                     else os.path.join(path, f'{digest}.pickle'))
+        self.refresh_interval = refresh_interval
+        self._dirs = {}
+        self._ids = {}
+        self._exact = {}
+        self._fuzzy = None
+        self._refreshed_at = None
+        self._lock = threading.RLock()
+        self.rescanned = self.refreshes = 0
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def _load(self) -> None:
+        """Loads the persisted index, ignoring a stale or broken one."""
+        if self.path is None:
+            return
+        try:
+            with open(self.path, 'rb') as file:
+                state = pickle.load(file)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError):
+            return
+        if (state.get('version') == INDEX_VERSION
+                and state.get('directory') == self.directory):
+            self._dirs = state['dirs']
+            self._rebuild()
+
+    def _save(self) -> None:
+        """Persists the index, keeping it in memory on failure."""
+        if self.path is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(f'{self.path}.tmp', 'wb') as file:
+                pickle.dump({'version': INDEX_VERSION,
+                             'directory': self.directory,
+                             'dirs': self._dirs},
+                            file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(f'{self.path}.tmp', self.path)
+        except OSError:
+            pass
+
+    @staticmethod
+    def _scan(directory: str, mtime: int) -> Tuple:
+        """Returns mtime, files, subdirectories & keys of a directory."""
+        from rapidfuzz.utils import default_process
+
+        files, subdirs = [], []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    (subdirs if is_dir else files).append(entry.name)
+        except OSError:
+            pass
+        files.sort()
+        if time.time() - mtime / 1e9 < RACY_SECONDS:
+            mtime = -1
+        return mtime, files, subdirs, [default_process(name)
+                                       for name in files]
+
+    def refresh(self) -> int:
+        """Rescans the changed directories.
+
+        Returns:
+            Number of directories scanned.
+        """
+        with self._lock:
+            dirs, rescanned = {}, 0
+            stack = ['']
+            while stack:
+                relative = stack.pop()
+                directory = os.path.join(self.directory, relative)
+                try:
+                    mtime = os.stat(directory).st_mtime_ns
+                except OSError:
+                    continue
+                entry = self._dirs.get(relative)
+                if entry is None or entry[0] != mtime:
+                    entry = self._scan(directory, mtime)
+                    rescanned += 1
+                dirs[relative] = entry
+                stack.extend(os.path.join(relative, subdir)
+                             for subdir in entry[2])
+
+            changed = rescanned or dirs.keys() != self._dirs.keys()
+            previous, self._dirs = self._dirs, dirs
+            self._refreshed_at = time.monotonic()
+            self.refreshes += 1
+            self.rescanned += rescanned
+            if changed:
+                self._update(previous)
+                self._save()
+            return rescanned
+
+    def _rebuild(self) -> None:
+        """Flattens the directories into the paths & the match keys."""
+        paths, keys, exact = [], [], {}
+        for relative in sorted(self._dirs):
+            _, files, _, file_keys = self._dirs[relative]
+            for name, key in zip(files, file_keys):
+                path = os.path.join(relative, name)
+                paths.append(path)
+                keys.append(key)
+                exact.setdefault(key, path)
+        self._ids = {path: idx for idx, path in enumerate(paths)}
+        self._exact = exact
+        self._fuzzy = FuzzyIndex(paths, keys=keys)
+
+    def _update(self, previous: Dict[str, Tuple]) -> None:
+        """Applies the files added & removed since the previous tree."""
+        if self._fuzzy is None:
+            self._rebuild()
+            return
+        removed, added, keys = [], [], []
+        for relative in previous.keys() | self._dirs.keys():
+            old, new = previous.get(relative), self._dirs.get(relative)
+            if old is new:
+                continue
+            old_files = set(old[1]) if old else set()
+            new_files = set(new[1]) if new else set()
+            removed.extend(os.path.join(relative, name)
+                           for name in old_files - new_files)
+            if new is None:
+                continue
+            for name, key in zip(new[1], new[3]):
+                if name not in old_files:
+                    added.append(os.path.join(relative, name))
+                    keys.append(key)
+
+        ids = [self._ids.pop(path) for path in removed]
+        for path, idx in zip(removed, ids):
+            key = self._fuzzy.keys[idx]
+            if self._exact.get(key) == path:
+                del self._exact[key]
+        self._fuzzy.remove(ids)
+        self._ids.update(zip(added, self._fuzzy.add(added, keys)))
+        for path, key in zip(added, keys):
+            self._exact.setdefault(key, path)
+        # Removed files leave holes in the fuzzy index, it is built again
+        # once they outnumber the indexed files.
+        if len(self._fuzzy.choices) > 2 * len(self._ids):
+            self._rebuild()
+
+    def _maybe_refresh(self) -> None:
+        """Refreshes the index if it's older than the refresh interval."""
+        if (self._refreshed_at is None or time.monotonic()
+                - self._refreshed_at >= self.refresh_interval):
+            self.refresh()
+
+    def find(self, name: str, min_score: Optional[int] = 70
+             ) -> Optional[str]:
+        """Returns path of the best matching file relative to the root.
+
+        Args:
+            name: Approximate or exact file name to be searched.
+            min_score: Score a fuzzy match needs to exceed.
+                       Default: 70
+        """
+        with self._lock:
+            self._maybe_refresh()
+            if self._fuzzy is None:
+                return None
+            path = self._exact.get(self._fuzzy.processor(name))
+            if path is None:
+                match = self._fuzzy.match(name, min_score)
+                path = None if match is None else match[0]
+            return path
+
+    def find_many(self,
+                  names: List[str],
+                  min_score: Optional[int] = 70) -> List[Optional[str]]:
+        """Returns paths of the best matching files for all the names."""
+        with self._lock:
+            self._maybe_refresh()
+            if self._fuzzy is None:
+                return [None] * len(names)
+            return [None if match is None else match[0]
+                    for match in self._fuzzy.match_many(names, min_score)]
+
+    def files(self) -> List[str]:
+        """Returns paths of all the indexed files relative to the root."""
+        with self._lock:
+            self._maybe_refresh()
+            return sorted(self._ids)
+
+    def stats(self) -> Dict[str, int]:
+        """Returns size of the index, refreshes & directories scanned."""
+        return {'files': len(self._ids),
+                'directories': len(self._dirs),
+                'refreshes': self.refreshes,
+                'rescanned': self.rescanned}
+
+
+@lru_cache(maxsize=None)
+def _file_index(directory: str) -> FileIndex:
+    """Returns shared index of the absolute directory path."""
+    return FileIndex(directory)
+
+
+def file_index(directory: str) -> FileIndex:
+    """Returns shared index of the directory, creating it if needed."""
+    return _file_index(os.path.abspath(directory))
@@ -0,0 +1,546 @@
+# Copyright 2020 XAMES3. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ======================================================================
+"""
+The `pyxa.utils.fuzzy` module matches strings against a list of choices.
+
+The choices are preprocessed once into an index which is reused across
+the queries. Batches of queries are scored as a single matrix spread
+across all the cores, and the recent results are cached against a
+fingerprint of the choices. Long lists of choices are shortlisted
+through a trigram inverted index before being scored.
+"""
+# The following comment should be removed at some point in the future.
+# pylint: disable=import-error
+# pylint: disable=no-name-in-module
+
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from pyxa.utils.settings import (DEFAULT_FUZZY_INDEXES, DEFAULT_FUZZY_RESULTS,
+                                 DEFAULT_FUZZY_WORKERS,
+                                 DEFAULT_TRIGRAM_MIN_CHOICES,
+                                 DEFAULT_TRIGRAM_OVERLAP,
+                                 DEFAULT_TRIGRAM_SEGMENT,
+                                 DEFAULT_TRIGRAM_SHORTLIST,
+                                 FUZZY_MATRIX_MAX_CELLS, TRIGRAM_MAX_SEGMENTS)
+
+
+class _LRU(object):
+    """Thread-safe LRU mapping with a bounded size."""
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        """Returns value of the key, marking it as recently used."""
+        with self._lock:
+            if key not in self._data:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key: Any, value: Any) -> None:
+        """Stores value of the key, evicting the least recent one."""
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+# Recent results of all the indexes, keyed on their fingerprints.
+_results = _LRU(DEFAULT_FUZZY_RESULTS)
+
+# Recently built indexes, keyed on the fingerprints of their choices.
+_indexes = _LRU(DEFAULT_FUZZY_INDEXES)
+
+
+def fingerprint(choices: Sequence[str]) -> int:
+    """Returns fingerprint identifying the list of choices.
+
+    The fingerprint is built from the cached hashes of the strings,
+    hence it's cheap even for long lists. It is only meaningful within
+    the running process.
+    """
+    return hash(tuple(choices))
+
+
+def trigrams(keys: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns unique trigram codes of the keys & the key of each code.
+
+    The keys are joined into a single array of code points, hence the
+    trigrams of all the keys are found at once. Every trigram is packed
+    into 30 bits from the lower 10 bits of its characters, so distinct
+    non-Latin trigrams may share a code. That only lets a few more
+    candidates through the filter.
+
+    Returns:
+        Tuple of the sorted codes & the position of their keys.
+    """
+    lengths = np.fromiter(map(len, keys), np.int64, len(keys))
+    text = np.frombuffer('\0'.join(keys).encode('utf-32-le'), np.uint32)
+    if len(text) < 3:
+        return np.empty(0, np.uint32), np.empty(0, np.int64)
+    chars = text & 0x3FF
+    codes = (chars[:-2] << 20) | (chars[1:-1] << 10) | chars[2:]
+    owners = np.repeat(np.arange(len(keys), dtype=np.uint64),
+                       lengths + 1)[:len(codes)]
+    # Trigrams spanning the separator of two keys are dropped.
+    valid = (text[:-2] != 0) & (text[1:-1] != 0) & (text[2:] != 0)
+    packed = np.sort((codes[valid].astype(np.uint64) << np.uint64(32))
+                     | owners[valid])
+    if len(packed):
+        packed = packed[np.r_[True, packed[1:] != packed[:-1]]]
+    return ((packed >> np.uint64(32)).astype(np.uint32),
+            (packed & np.uint64(0xFFFFFFFF)).astype(np.int64))
+
+
+class _Segment(object):
+    """Immutable inverted index of the trigrams of a run of keys."""
+
+    def __init__(self, ids: np.ndarray, keys: Sequence[str]) -> None:
+        codes, owners = trigrams(keys)
+        bounds = np.flatnonzero(codes[1:] != codes[:-1]) + 1
+        self.ids = ids
+        self.codes = codes[np.r_[0, bounds]] if len(codes) else codes
+        self.offsets = np.r_[0, bounds, len(codes)].astype(np.int64)
+        self.postings = ids[owners].astype(np.int32)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def postings_of(self, codes: np.ndarray) -> List[np.ndarray]:
+        """Returns sorted ids of the keys having each of the codes."""
+        if not len(self.codes):
+            return []
+        pos = np.minimum(np.searchsorted(self.codes, codes),
+                         len(self.codes) - 1)
+        pos = pos[self.codes[pos] == codes]
+        return [self.postings[self.offsets[idx]:self.offsets[idx + 1]]
+                for idx in pos]
+
+
+class TrigramIndex(object):
+    """Inverted index shortlisting the keys sharing trigrams of a query.
+
+    Scoring a query against millions of keys takes seconds even with
+    ``rapidfuzz``. The index maps every trigram to the sorted ids of the
+    keys having it, hence only the keys sharing enough trigrams with the
+    query are scored. A key containing the query has all of its
+    trigrams, typos knock out up to three trigrams each.
+
+    The keys are indexed in immutable segments. Added keys get a new
+    segment & the small segments are merged once there are more than
+    ``TRIGRAM_MAX_SEGMENTS``. Removed keys are masked out until the
+    index is compacted, which happens once they outnumber the live ones.
+    The ids of the keys never change.
+
+    Args:
+        keys: Processed strings to be indexed, ``None`` for removed ones.
+              Default: ()
+        segment_size: Maximum number of keys per segment.
+                      Default: 1048576
+
+    Example:
+        >>> from pyxa.utils.fuzzy import TrigramIndex
+        >>> index = TrigramIndex(['google chrome', 'visual studio code'])
+        >>> index.candidates('chrom')
+        array([0])
+        >>> index.add(['chromium'])
+        range(2, 3)
+        >>> index.candidates('chrom')
+        array([0, 2])
+    """
+
+    def __init__(self,
+                 keys: Sequence[Optional[str]] = (),
+                 segment_size: Optional[int] = DEFAULT_TRIGRAM_SEGMENT
+                 ) -> None:
+        self.segment_size = segment_size
+        self._keys = list(keys)
+        self._alive = np.fromiter((key is not None for key in self._keys),
+                                  np.bool_, len(self._keys))
+        self._segments = []
+        self._lock = threading.Lock()
+        self._index(np.flatnonzero(self._alive))
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self._alive))
+
+    def _index(self, ids: np.ndarray) -> None:
+        """Indexes the keys of the ids into new segments."""
+        for start in range(0, len(ids), self.segment_size):
+            chunk = ids[start:start + self.segment_size]
+            self._segments.append(_Segment(chunk, [self._keys[idx]
+                                                   for idx in chunk]))
+
+    def add(self, keys: Sequence[str]) -> range:
+        """Indexes the keys & returns their ids."""
+        with self._lock:
+            start = len(self._keys)
+            self._keys.extend(keys)
+            ids = range(start, len(self._keys))
+            self._alive = np.concatenate([self._alive,
+                                          np.ones(len(ids), np.bool_)])
+            self._index(np.arange(start, len(self._keys)))
+            if len(self._segments) > TRIGRAM_MAX_SEGMENTS:
+                # Merging the small segments keeps the number of
+                # lookups per query bounded.
+                small = [segment for segment in self._segments
+                         if len(segment) < self.segment_size]
+                self._segments = [segment for segment in self._segments
+                                  if len(segment) >= self.segment_size]
+                merged = np.concatenate([segment.ids for segment in small])
+                self._index(np.sort(merged[self._alive[merged]]))
+            return ids
+
+    def remove(self, ids: Sequence[int]) -> None:
+        """Removes keys of the ids from the index."""
+        with self._lock:
+            for idx in ids:
+                self._keys[idx] = None
+            self._alive[np.asarray(ids, np.int64)] = False
+            if np.count_nonzero(self._alive) * 2 < len(self._keys):
+                self._compact()
+
+    def compact(self) -> None:
+        """Rebuilds the segments without the removed keys."""
+        with self._lock:
+            self._compact()
+
+    def _compact(self) -> None:
+        """Rebuilds the segments, the lock being held."""
+        self._segments = []
+        self._index(np.flatnonzero(self._alive))
+
+    def candidates(self,
+                   query: str,
+                   overlap: Optional[float] = DEFAULT_TRIGRAM_OVERLAP,
+                   shortlist: Optional[int] = DEFAULT_TRIGRAM_SHORTLIST
+                   ) -> Optional[np.ndarray]:
+        """Returns ids of the keys sharing the most trigrams of the query.
+
+        A key sharing at least ``overlap`` of the query trigrams must be
+        in one of the shortest posting lists left once the longest ones
+        are set aside, hence only those are merged. The merged keys are
+        then counted through binary searches in the other lists.
+
+        Args:
+            query: Processed string to be matched.
+            overlap: Fraction of the query trigrams a key needs to share.
+                     Default: 0.5
+            shortlist: Maximum number of ids returned, the keys sharing
+                       the most trigrams are kept.
+                       Default: 2000
+
+        Returns:
+            Sorted ids of the candidates, ``None`` if the query is too
+            short to have a trigram & can't be filtered.
+        """
+        codes, _ = trigrams([query])
+        if not len(codes):
+            return None
+        need = max(1, int(np.ceil(overlap * len(codes))))
+        with self._lock:
+            segments, alive = list(self._segments), self._alive
+        found, counts = [], []
+        for segment in segments:
+            lists = sorted(segment.postings_of(codes), key=len)
+            if len(lists) < need:
+                continue
+            seeds = np.unique(np.concatenate(lists[:len(lists) - need + 1]))
+            hits = np.zeros(len(seeds), np.int32)
+            for postings in lists:
+                pos = np.searchsorted(postings, seeds)
+                pos[pos == len(postings)] = 0
+                hits += postings[pos] == seeds
+            keep = (hits >= need) & alive[seeds]
+            found.append(seeds[keep])
+            counts.append(hits[keep])
+        if not found:
+            return np.empty(0, np.int64)
+        found, counts = np.concatenate(found), np.concatenate(counts)
+        if len(found) > shortlist:
+            found = found[np.argpartition(-counts, shortlist - 1)[:shortlist]]
+        return np.sort(found).astype(np.int64)
+
+
+class FuzzyIndex(object):
+    """Reusable index for fuzzy matching against a list of choices.
+
+    The choices are preprocessed once, every query is then processed
+    and scored against the preprocessed keys only. Scores range from 0
+    to 100 and ties are broken in favor of the earlier choice.
+
+    Lists of ``DEFAULT_TRIGRAM_MIN_CHOICES`` or more are prefiltered by
+    a ``TrigramIndex``, only the shortlisted choices are then scored.
+    Queries shorter than three characters are still scored against all
+    the choices. Choices can be added & removed without rebuilding the
+    index, their indexes never change.
+
+    Args:
+        choices: Strings to be matched against.
+        scorer: ``rapidfuzz.fuzz`` scorer used for the matching.
+                ``partial_ratio`` is used if ``None`` is passed.
+                Default: None
+        processor: Function normalizing the choices & the queries.
+                   ``rapidfuzz.utils.default_process`` is used if
+                   ``None`` is passed.
+                   Default: None
+        keys: Already processed choices, spares processing them again.
+              Default: None
+        workers: Number of threads the batches are scored with, ``-1``
+                 uses all the cores.
+                 Default: -1
+        prefilter: Boolean, if the choices should be shortlisted by
+                   trigrams. Decided by the number of choices if
+                   ``None`` is passed.
+                   Default: None
+        overlap: Fraction of the query trigrams a shortlisted choice
+                 needs to share. Lower values raise the recall.
+                 Default: 0.5
+        shortlist: Maximum number of choices scored per query. Higher
+                   values raise the recall.
+                   Default: 2000
+
+    Example:
+        >>> from pyxa.utils.fuzzy import FuzzyIndex
+        >>> index = FuzzyIndex(['Google Chrome', 'Visual Studio Code'])
+        >>> index.match('chrome')
+        ('Google Chrome', 100.0, 0)
+        >>> index.match_many(['studio', 'firefox'])
+        [('Visual Studio Code', 100.0, 1), None]
+    """
+
+    def __init__(self,
+                 choices: Sequence[str],
+                 scorer: Optional[Callable] = None,
+                 processor: Optional[Callable[[str], str]] = None,
+                 keys: Optional[Sequence[str]] = None,
+                 workers: Optional[int] = DEFAULT_FUZZY_WORKERS,
+                 prefilter: Optional[bool] = None,
+                 overlap: Optional[float] = DEFAULT_TRIGRAM_OVERLAP,
+                 shortlist: Optional[int] = DEFAULT_TRIGRAM_SHORTLIST
+                 ) -> None:
+        from rapidfuzz.fuzz import partial_ratio
+        from rapidfuzz.utils import default_process
+
+        self.choices = list(choices)
+        self.scorer = scorer or partial_ratio
+        self.processor = processor or default_process
+        self.keys = (list(keys) if keys is not None
+                     else [self.processor(str(choice))
+                           for choice in self.choices])
+        self.workers = workers
+        self.prefilter = prefilter
+        self.overlap = overlap
+        self.shortlist = shortlist
+        self.fingerprint = fingerprint(self.choices)
+        self.trigrams = None
+        self._removed = 0
+        self._lock = threading.RLock()
+        self._maybe_prefilter()
+
+    def __len__(self) -> int:
+        return len(self.choices) - self._removed
+
+    def _maybe_prefilter(self) -> None:
+        """Builds the trigram index once the choices call for it."""
+        if self.trigrams is None and (
+                self.prefilter or (self.prefilter is None and len(self)
+                                   >= DEFAULT_TRIGRAM_MIN_CHOICES)):
+            self.trigrams = TrigramIndex(self.keys)
+
+    def add(self,
+            choices: Sequence[str],
+            keys: Optional[Sequence[str]] = None) -> range:
+        """Adds the choices & returns their indexes.
+
+        Args:
+            choices: Strings to be matched against.
+            keys: Already processed choices.
+                  Default: None
+        """
+        choices = list(choices)
+        if not choices:
+            return range(len(self.choices), len(self.choices))
+        keys = (list(keys) if keys is not None
+                else [self.processor(str(choice)) for choice in choices])
+        with self._lock:
+            start = len(self.choices)
+            self.choices.extend(choices)
+            self.keys.extend(keys)
+            if self.trigrams is not None:
+                self.trigrams.add(keys)
+            self._maybe_prefilter()
+            self.fingerprint = hash((self.fingerprint, start,
+                                     tuple(choices)))
+            return range(start, len(self.choices))
+
+    def remove(self, indexes: Sequence[int]) -> None:
+        """Removes the choices of the indexes."""
+        with self._lock:
+            indexes = [idx for idx in indexes
+                       if self.keys[idx] is not None]
+            if not indexes:
+                return
+            for idx in indexes:
+                self.choices[idx] = self.keys[idx] = None
+            self._removed += len(indexes)
+            if self.trigrams is not None:
+                self.trigrams.remove(indexes)
+            self.fingerprint = hash((self.fingerprint, -1,
+                                     tuple(indexes)))
+
+    def _result(self, idx: int, score: float) -> Tuple[str, float, int]:
+        """Returns choice, score & index of the match."""
+        return self.choices[idx], float(score), idx
+
+    def _cache_key(self, query: str, min_score: float, limit: int) -> Tuple:
+        """Returns key of the query in the results cache."""
+        return (self.fingerprint, id(self.scorer), id(self.processor), query,
+                min_score, limit, self.trigrams is not None and (
+                    self.overlap, self.shortlist))
+
+    def extract(self,
+                query: str,
+                limit: Optional[int] = 3,
+                min_score: Optional[float] = 0
+                ) -> List[Tuple[str, float, int]]:
+        """Returns best matches of the query, the best first.
+
+        Args:
+            query: Approximate or exact string to be matched.
+            limit: Maximum number of matches returned.
+                   Default: 3
+            min_score: Score a match needs to exceed.
+                       Default: 0
+        """
+        from rapidfuzz.process import extract
+
+        key = self._cache_key(query, min_score, limit)
+        matches = _results.get(key)
+        if matches is None:
+            query = self.processor(query)
+            keys, candidates = self.keys, None
+            if self.trigrams is not None:
+                candidates = self.trigrams.candidates(query, self.overlap,
+                                                      self.shortlist)
+            if candidates is not None:
+                keys = {idx: self.keys[idx] for idx in candidates.tolist()}
+            matches = [self._result(idx, score)
+                       for _, score, idx in extract(
+                           query, keys, scorer=self.scorer, processor=None,
+                           limit=limit, score_cutoff=min_score)
+                       if score > min_score]
+            _results.set(key, matches)
+        return list(matches)
+
+    def match(self, query: str, min_score: Optional[float] = 70
+              ) -> Optional[Tuple[str, float, int]]:
+        """Returns best match of the query, ``None`` if none is good.
+
+        Args:
+            query: Approximate or exact string to be matched.
+            min_score: Score the match needs to exceed.
+                       Default: 70
+        """
+        matches = self.extract(query, 1, min_score)
+        return matches[0] if matches else None
+
+    def match_many(self,
+                   queries: Sequence[str],
+                   min_score: Optional[float] = 70
+                   ) -> List[Optional[Tuple[str, float, int]]]:
+        """Returns best matches for a batch of queries.
+
+        The queries are scored against all the choices in a single
+        score matrix computed across ``workers`` threads. Large batches
+        are split into blocks of rows so that the matrix stays within
+        ``FUZZY_MATRIX_MAX_CELLS``. Prefiltered indexes score every
+        query against its own shortlist instead.
+
+        Args:
+            queries: Approximate or exact strings to be matched.
+            min_score: Score the matches need to exceed.
+                       Default: 70
+
+        Returns:
+            List holding the best match of every query, ``None`` for the
+            queries without a good enough match.
+        """
+        from rapidfuzz.process import cdist
+
+        if self.trigrams is not None:
+            return [self.match(query, min_score) for query in queries]
+        results = [_results.get(self._cache_key(query, min_score, 1))
+                   for query in queries]
+        pending = [idx for idx, result in enumerate(results)
+                   if result is None]
+        if pending and self.keys:
+            rows = max(1, FUZZY_MATRIX_MAX_CELLS // len(self.keys))
+            for start in range(0, len(pending), rows):
+                block = pending[start:start + rows]
+                scores = cdist([self.processor(queries[idx])
+                                for idx in block],
+                               self.keys, scorer=self.scorer, processor=None,
+                               score_cutoff=min_score, dtype=np.float32,
+                               workers=self.workers)
+                best = scores.argmax(axis=1)
+                for row, idx in enumerate(block):
+                    score = scores[row, best[row]]
+                    results[idx] = ([self._result(int(best[row]), score)]
+                                    if score > min_score else [])
+                    _results.set(self._cache_key(queries[idx], min_score, 1),
+                                 results[idx])
+        return [result[0] if result else None for result in results]
+
+
+def fuzzy_index(choices: Sequence[str], **kwargs: Any) -> FuzzyIndex:
+    """Returns index of the choices, reusing a recently built one.
+
+    Accepts the same keyword arguments as ``FuzzyIndex``. Indexes built
+    with keyword arguments aren't reused and a reused index which has
+    been changed since is built again.
+    """
+    if kwargs:
+        return FuzzyIndex(choices, **kwargs)
+    key = fingerprint(choices)
+    index = _indexes.get(key)
+    if index is None or index.fingerprint != key:
+        index = FuzzyIndex(choices)
+        _indexes.set(key, index)
+    return index
+
+
+def cache_stats() -> Dict[str, int]:
+    """Returns hits, misses & size of the results cache."""
+    return {'hits': _results.hits,
+            'misses': _results.misses,
+            'results': len(_results),
+            'indexes': len(_indexes)}
@@ -0,0 +1,515 @@
+# Copyright 2020 XAMES3. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ======================================================================
+"""
+The `pyxa.utils.network` module manages the outbound HTTP connections.
+
+All the outbound calls made by pyXA go through the single pooled session
+provided by this module. This keeps the connections alive across the
+calls and the hosts, and records per host latency & reuse metrics.
+Every host also gets a circuit breaker, so a degraded upstream fails
+fast instead of holding the callers for the full timeout.
+"""
+# The following comment should be removed at some point in the future.
+# pylint: disable=import-error
+# pylint: disable=no-name-in-module
+
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from pyxa.utils.exceptions import CircuitOpen
+from pyxa.utils.settings import (DEFAULT_BREAKER_COOLDOWN,
+                                 DEFAULT_BREAKER_FAILURE_RATE,
+                                 DEFAULT_BREAKER_MIN_CALLS,
+                                 DEFAULT_BREAKER_SLOW_CALL,
+                                 DEFAULT_BREAKER_WINDOW,
+                                 DEFAULT_HEDGE_REQUESTS,
+                                 DEFAULT_HTTP_BACKOFF,
+                                 DEFAULT_HTTP_POOL_CONNECTIONS,
+                                 DEFAULT_HTTP_POOL_MAXSIZE,
+                                 DEFAULT_HTTP_RETRIES, DEFAULT_HTTP_TIMEOUT)
+from pyxa.utils.system import connectivity
+
+# Number of recent latencies kept per host for the percentiles.
+LATENCY_WINDOW = 1000
+
+# States of the circuit breakers.
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker(object):
+    """Circuit breaker guarding the calls made to a single host.
+
+    The breaker keeps the outcomes of the recent calls. Calls which
+    fail, respond with a ``5xx`` or take longer than ``slow_call``
+    seconds count as failures. Once enough of them fail the breaker
+    opens and refuses the calls for ``cooldown`` seconds, after which a
+    single trial call is let through. The breaker closes again if the
+    trial succeeds and stays open for another cooldown otherwise.
+
+    Args:
+        window: Number of recent outcomes considered.
+                Default: 20
+        min_calls: Number of outcomes needed before the breaker opens.
+                   Default: 5
+        failure_rate: Fraction of failed outcomes which opens it.
+                      Default: 0.5
+        slow_call: Seconds after which a call counts as failed.
+                   Default: 5.0
+        cooldown: Seconds for which the calls are refused.
+                  Default: 30.0
+    """
+
+    def __init__(self,
+                 window: Optional[int] = DEFAULT_BREAKER_WINDOW,
+                 min_calls: Optional[int] = DEFAULT_BREAKER_MIN_CALLS,
+                 failure_rate: Optional[float] = DEFAULT_BREAKER_FAILURE_RATE,
+                 slow_call: Optional[float] = DEFAULT_BREAKER_SLOW_CALL,
+                 cooldown: Optional[float] = DEFAULT_BREAKER_COOLDOWN) -> None:
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call = slow_call
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.opened_at = None
+        self.trips = self.rejected = 0
+        self._outcomes = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Returns whether a call may be sent to the host."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            # A trial which never reported back is retried after another
+            # cooldown, hence the breaker can't get stuck half open.
+            if time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = HALF_OPEN
+                self.opened_at = time.monotonic()
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, succeeded: bool, elapsed: float = 0.0) -> None:
+        """Records outcome of a call, opening or closing the breaker."""
+        failed = not succeeded or elapsed >= self.slow_call
+        with self._lock:
+            if self.state == HALF_OPEN:
+                if failed:
+                    self._open()
+                else:
+                    self.state = CLOSED
+                    self._outcomes.clear()
+                return
+            self._outcomes.append(failed)
+            if (self.state == CLOSED and len(self._outcomes) >= self.min_calls
+                    and (sum(self._outcomes) / len(self._outcomes)
+                         >= self.failure_rate)):
+                self._open()
+
+    def _open(self) -> None:
+        """Opens the breaker, restarting its cooldown."""
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.trips += 1
+        self._outcomes.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns state, recent failure rate, trips & rejected calls."""
+        with self._lock:
+            outcomes = len(self._outcomes)
+            return {'state': self.state,
+                    'failure_rate': (sum(self._outcomes) / outcomes
+                                     if outcomes else 0.0),
+                    'trips': self.trips,
+                    'rejected': self.rejected}
+
+
+class PooledSession(requests.Session):
+    """Requests session which applies a default timeout.
+
+    Args:
+        timeout: Seconds after which a request is given up.
+                 Default: 10.0
+        breaker: Function returning the circuit breaker of a host. The
+                 requests aren't guarded if ``None`` is passed.
+                 Default: None
+    """
+
+    def __init__(self,
+                 timeout: Optional[float] = DEFAULT_HTTP_TIMEOUT,
+                 breaker: Optional[Callable[[str], CircuitBreaker]] = None
+                 ) -> None:
+        super(PooledSession, self).__init__()
+        self.timeout = timeout
+        self.breaker = breaker
+
+    def request(self, method: str, url: str, **kwargs: Any) -> Any:
+        """Sends request, falling back to the default timeout.
+
+        Raises:
+            CircuitOpen: If the circuit breaker of the host is open.
+        """
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        if self.breaker is None:
+            return super(PooledSession, self).request(method, url, **kwargs)
+
+        host = urlsplit(url).hostname
+        breaker = self.breaker(host)
+        if not breaker.allow():
+            raise CircuitOpen(f'Circuit of "{host}" is open.')
+        start = time.monotonic()
+        try:
+            response = super(PooledSession, self).request(method, url,
+                                                          **kwargs)
+        except requests.RequestException:
+            breaker.record(False)
+            raise
+        breaker.record(response.status_code < 500, time.monotonic() - start)
+        return response
+
+
+class RedirectAdapter(HTTPAdapter):
+    """Transport adapter which sends the requests to another base URL.
+
+    Args:
+        upstream: Base URL whose requests are redirected.
+        target: Base URL the requests are sent to instead.
+    """
+
+    def __init__(self, upstream: str, target: str, **kwargs: Any) -> None:
+        self.upstream = upstream.rstrip('/')
+        self.target = target.rstrip('/')
+        super(RedirectAdapter, self).__init__(**kwargs)
+
+    def send(self, request: requests.PreparedRequest,
+             **kwargs: Any) -> requests.Response:
+        """Sends request to the target instead of the upstream."""
+        url = request.url
+        if url.startswith(self.upstream):
+            request.url = self.target + url[len(self.upstream):]
+        response = super(RedirectAdapter, self).send(request, **kwargs)
+        # Keeps the metrics & latencies keyed by the upstream host.
+        response.url = url
+        return response
+
+
+class SessionManager(object):
+    """Central manager of the pooled HTTP session.
+
+    The session keeps one keep-alive connection pool per host and
+    retries idempotent requests on connection errors, ``429`` & ``5xx``
+    responses with an exponential backoff. Latency, errors & connection
+    reuse are recorded per host for every response, including the ones
+    made by ``googlemaps`` & ``geocoder`` through the session.
+
+    Requests to a host whose circuit breaker is open raise
+    ``CircuitOpen`` without being sent. GET requests made through the
+    manager can also be hedged: a duplicate is sent once the p95 latency
+    of the host has elapsed and the first response to arrive is used.
+    Hedging trims the tail latency at the cost of extra upstream calls,
+    hence it is off by default.
+
+    Args:
+        pool_connections: Number of hosts whose pools are kept alive.
+                          Default: 10
+        pool_maxsize: Number of connections kept alive per host.
+                      Default: 16
+        timeout: Seconds after which a request is given up.
+                 Default: 10.0
+        retries: Number of retries for the failed requests.
+                 Default: 3
+        backoff: Backoff factor between the retries.
+                 Default: 0.3
+        failure_rate: Fraction of failed calls which opens the circuit
+                      breaker of a host.
+                      Default: 0.5
+        slow_call: Seconds after which a call counts as failed.
+                   Default: 5.0
+        cooldown: Seconds for which an open breaker refuses the calls.
+                  Default: 30.0
+        hedge: Boolean, if GET requests should be hedged.
+               Default: False
+
+    Example:
+        >>> from pyxa.utils.network import session_manager
+        >>> session_manager.get('https://api.darksky.net/forecast/...')
+        <Response [200]>
+        >>> session_manager.metrics()
+        {'api.darksky.net': {'requests': 1, 'errors': 0, ...}}
+        >>> session_manager.breakers()
+        {'api.darksky.net': {'state': 'closed', 'failure_rate': 0.0, ...}}
+    """
+
+    def __init__(self,
+                 pool_connections: Optional[int] = (
+                     DEFAULT_HTTP_POOL_CONNECTIONS),
+                 pool_maxsize: Optional[int] = DEFAULT_HTTP_POOL_MAXSIZE,
+                 timeout: Optional[float] = DEFAULT_HTTP_TIMEOUT,
+                 retries: Optional[int] = DEFAULT_HTTP_RETRIES,
+                 backoff: Optional[float] = DEFAULT_HTTP_BACKOFF,
+                 failure_rate: Optional[float] = DEFAULT_BREAKER_FAILURE_RATE,
+                 slow_call: Optional[float] = DEFAULT_BREAKER_SLOW_CALL,
+                 cooldown: Optional[float] = DEFAULT_BREAKER_COOLDOWN,
+                 hedge: Optional[bool] = DEFAULT_HEDGE_REQUESTS) -> None:
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.failure_rate = failure_rate
+        self.slow_call = slow_call
+        self.cooldown = cooldown
+        self.hedge = hedge
+        self._session = None
+        self._redirects = {}
+        self._breakers = {}
+        self._hedger = None
+        self._lock = threading.Lock()
+        self._latencies = defaultdict(lambda: deque(maxlen=LATENCY_WINDOW))
+        self._counts = defaultdict(lambda: {'requests': 0, 'errors': 0})
+        self._hedges = defaultdict(lambda: {'hedged': 0, 'hedge_wins': 0})
+
+    @property
+    def session(self) -> PooledSession:
+        """Returns the shared session, creating it if needed."""
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = self._build()
+        return self._session
+
+    def _build(self) -> PooledSession:
+        """Builds session with the configured pools & retries."""
+        session = PooledSession(self.timeout, self.breaker)
+        self._mount(session)
+        session.hooks['response'].append(self._record)
+        return session
+
+    def _mount(self, session: PooledSession) -> None:
+        """Mounts adapter with the configured pools & retries."""
+        retry = Retry(total=self.retries,
+                      backoff_factor=self.backoff,
+                      status_forcelist=(429, 500, 502, 503, 504),
+                      raise_on_status=False)
+        options = {'pool_connections': self.pool_connections,
+                   'pool_maxsize': self.pool_maxsize,
+                   'max_retries': retry}
+        adapter = HTTPAdapter(**options)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        for upstream, target in self._redirects.items():
+            session.mount(upstream, RedirectAdapter(upstream, target,
+                                                    **options))
+
+    def configure(self, **kwargs: Any) -> None:
+        """Updates the settings of the shared session.
+
+        Accepts the same keyword arguments as the constructor. The
+        session object itself is kept, so clients already holding it
+        pick up the new pools, timeout & retries. The circuit breakers
+        are reset.
+        """
+        with self._lock:
+            for name, value in kwargs.items():
+                if not hasattr(self, name) or name.startswith('_'):
+                    raise TypeError(f'Unknown session setting "{name}".')
+                setattr(self, name, value)
+            self._breakers = {}
+            if self._session is not None:
+                old_adapters = set(self._session.adapters.values())
+                self._session.timeout = self.timeout
+                self._mount(self._session)
+                for adapter in old_adapters:
+                    adapter.close()
+
+    def redirect(self, upstream: str, target: Optional[str] = None) -> None:
+        """Redirects requests made to an upstream base URL.
+
+        Every request whose URL starts with ``upstream`` is sent to
+        ``target`` instead, keeping the rest of the URL as is. This lets
+        ``googlemaps``, ``geocoder`` & the weather calls be pointed to
+        a stand-in server without touching their base URLs.
+
+        Args:
+            upstream: Base URL to be redirected, i.e.
+                      ``https://api.darksky.net``.
+            target: Base URL to redirect to. The redirect is removed if
+                    ``None`` is passed.
+                    Default: None
+        """
+        upstream = upstream.rstrip('/')
+        with self._lock:
+            if target is None:
+                self._redirects.pop(upstream, None)
+            else:
+                self._redirects[upstream] = target.rstrip('/')
+            if self._session is not None:
+                old_adapters = set(self._session.adapters.values())
+                self._session.adapters.pop(upstream, None)
+                self._mount(self._session)
+                for adapter in old_adapters:
+                    adapter.close()
+
+    def redirects(self) -> Dict[str, str]:
+        """Returns the active redirects."""
+        return dict(self._redirects)
+
+    def breaker(self, host: str) -> CircuitBreaker:
+        """Returns circuit breaker of the host, creating it if needed."""
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(
+                    host, CircuitBreaker(failure_rate=self.failure_rate,
+                                         slow_call=self.slow_call,
+                                         cooldown=self.cooldown))
+        return breaker
+
+    def breakers(self) -> Dict[str, Dict[str, Any]]:
+        """Returns state of the circuit breaker of every host."""
+        return {host: breaker.stats()
+                for host, breaker in list(self._breakers.items())}
+
+    def _record(self, response: requests.Response,
+                *args: Any, **kwargs: Any) -> requests.Response:
+        """Response hook recording latency & errors of the host."""
+        # Any response proves connectivity, sparing a separate probe.
+        connectivity.update(True)
+        host = urlsplit(response.url).hostname
+        with self._lock:
+            self._latencies[host].append(response.elapsed.total_seconds())
+            self._counts[host]['requests'] += 1
+            if response.status_code >= 400:
+                self._counts[host]['errors'] += 1
+        return response
+
+    def request(self, method: str, url: str, **kwargs: Any
+                ) -> requests.Response:
+        """Sends request through the shared session."""
+        try:
+            return self.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            host = urlsplit(url).hostname
+            with self._lock:
+                self._counts[host]['requests'] += 1
+                self._counts[host]['errors'] += 1
+            raise
+
+    def get(self, url: str, **kwargs: Any) -> requests.Response:
+        """Sends GET request through the shared session, hedging it."""
+        if not self.hedge:
+            return self.request('GET', url, **kwargs)
+        host = urlsplit(url).hostname
+        delay = self.latency(host, 95)
+        if delay is None:
+            return self.request('GET', url, **kwargs)
+
+        if self._hedger is None:
+            with self._lock:
+                if self._hedger is None:
+                    self._hedger = ThreadPoolExecutor(self.pool_maxsize,
+                                                      'pyxa-hedge')
+        first = self._hedger.submit(self.request, 'GET', url, **kwargs)
+        if wait([first], timeout=delay).done:
+            return first.result()
+
+        second = self._hedger.submit(self.request, 'GET', url, **kwargs)
+        with self._lock:
+            self._hedges[host]['hedged'] += 1
+        pending, error = {first, second}, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is second:
+                        with self._lock:
+                            self._hedges[host]['hedge_wins'] += 1
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def head(self, url: str, **kwargs: Any) -> requests.Response:
+        """Sends HEAD request through the shared session."""
+        return self.request('HEAD', url, **kwargs)
+
+    def latency(self, host: str, percentile: float) -> Optional[float]:
+        """Returns latency percentile of the host in seconds."""
+        with self._lock:
+            latencies = sorted(self._latencies.get(host, ()))
+        if not latencies:
+            return None
+        idx = min(len(latencies) - 1, int(percentile / 100 * len(latencies)))
+        return latencies[idx]
+
+    def _reuse(self) -> Dict[str, Dict[str, int]]:
+        """Returns new connections & requests made by each host pool."""
+        reuse = defaultdict(lambda: {'connections': 0, 'pooled_requests': 0})
+        if self._session is None:
+            return reuse
+        for adapter in set(self._session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                reuse[pool.host]['connections'] += pool.num_connections
+                reuse[pool.host]['pooled_requests'] += pool.num_requests
+        return reuse
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        """Returns latency, errors, reuse, breaker & hedges of hosts."""
+        reuse = self._reuse()
+        breakers = self.breakers()
+        metrics = {}
+        for host in set(self._counts) | set(reuse) | set(breakers):
+            counts = self._counts.get(host, {'requests': 0, 'errors': 0})
+            pooled = reuse.get(host, {'connections': 0, 'pooled_requests': 0})
+            hedges = self._hedges.get(host, {'hedged': 0, 'hedge_wins': 0})
+            requests_made = pooled['pooled_requests']
+            metrics[host] = {
+                **counts,
+                **pooled,
+                **hedges,
+                'reuse_ratio': (1 - pooled['connections'] / requests_made
+                                if requests_made else 0.0),
+                'hedge_win_rate': (hedges['hedge_wins'] / hedges['hedged']
+                                   if hedges['hedged'] else 0.0),
+                'breaker': breakers.get(host, {}).get('state', CLOSED),
+                'p50': self.latency(host, 50),
+                'p95': self.latency(host, 95),
+                'p99': self.latency(host, 99)}
+        return metrics
+
+
+# Shared manager for all the outbound calls.
+session_manager = SessionManager()
+
+
+def get_session() -> PooledSession:
+    """Returns the shared pooled session."""
+    return session_manager.session
@@ -0,0 +1,398 @@
+# Copyright 2020 XAMES3. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ======================================================================
+"""
+The `pyxa.utils.replay` module provides a local stand-in for the APIs.
+
+The weather, ``Google Maps`` & ``OSM`` APIs cannot be called freely
+while benchmarking, and DarkSky doesn't exist anymore. The server in
+this module answers their requests locally with recorded payloads, or
+synthesized ones, after an injected latency & with injected errors.
+"""
+# The following comment should be removed at some point in the future.
+# pylint: disable=import-error
+# pylint: disable=no-name-in-module
+
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from pyxa.core.geodesy import format_distance, haversine
+from pyxa.utils.network import session_manager
+from pyxa.utils.settings import (DEFAULT_CHARSET, DEFAULT_GEOLOCATION_URL,
+                                 DEFAULT_MAPS_URL, DEFAULT_OSM_URL,
+                                 DEFAULT_WEATHER_URL)
+from pyxa.utils.system import connectivity
+
+# Routes served by the replay server mapped to the path they match.
+ROUTES = {'forecast': '/forecast/',
+          'geocode': '/maps/api/geocode/json',
+          'distancematrix': '/maps/api/distancematrix/json',
+          'geolocate': '/geolocation/v1/geolocate',
+          'search': '/search',
+          'reverse': '/reverse'}
+
+# Average speed in meters per second used for the synthesized durations.
+TRAVEL_SPEEDS = {'driving': 13.9, 'walking': 1.4, 'bicycling': 4.2,
+                 'transit': 8.3}
+
+
+def _origin(url: str) -> str:
+    """Returns scheme & host of the URL."""
+    address = urlsplit(url)
+    return f'{address.scheme}://{address.netloc}'
+
+
+def _coordinates(value: str) -> List[Tuple[float, float]]:
+    """Returns coordinates from ``lat,lng|lat,lng`` parameter."""
+    return [tuple(map(float, pair.split(',')))
+            for pair in value.split('|') if pair]
+
+
+def _fake_coordinates(address: str) -> Tuple[float, float]:
+    """Returns stable made-up coordinates for the address."""
+    digest = hashlib.md5(address.lower().encode()).digest()
+    return (round(int.from_bytes(digest[:4], 'big') / 2**32 * 120 - 55, 7),
+            round(int.from_bytes(digest[4:8], 'big') / 2**32 * 360 - 180, 7))
+
+
+def _duration_text(seconds: float) -> str:
+    """Returns duration as human readable text."""
+    minutes = int(round(seconds / 60))
+    if minutes < 60:
+        return f'{max(minutes, 1)} mins'
+    hours, minutes = divmod(minutes, 60)
+    if hours < 24:
+        return f'{hours} hours {minutes} mins'
+    days, hours = divmod(hours, 24)
+    return f'{days} days {hours} hours'
+
+
+def synthesize_forecast(latitude: float,
+                        longitude: float,
+                        units: Optional[str] = 'si') -> Dict[str, Any]:
+    """Returns made-up forecast payload in the DarkSky format."""
+    now = int(time.time())
+    rng = random.Random(f'{latitude:.2f},{longitude:.2f}')
+    base = rng.uniform(-5, 30) if units == 'si' else rng.uniform(23, 86)
+    summaries = ['Clear.', 'Partly cloudy.', 'Light rain.', 'Overcast.']
+
+    def point(offset: int, step: int) -> Dict[str, Any]:
+        """Returns a data point ``offset`` steps from now."""
+        temperature = round(base + rng.uniform(-3, 3), 2)
+        return {'time': now + offset * step,
+                'summary': rng.choice(summaries),
+                'icon': 'partly-cloudy-day',
+                'temperature': temperature,
+                'apparentTemperature': round(temperature - 1.5, 2),
+                'apparentTemperatureMax': round(temperature + 4, 2),
+                'apparentTemperatureMin': round(temperature - 4, 2),
+                'humidity': round(rng.uniform(0.3, 0.95), 2),
+                'windSpeed': round(rng.uniform(0, 12), 2),
+                'windBearing': rng.randrange(360),
+                'cloudCover': round(rng.random(), 2),
+                'precipProbability': round(rng.random(), 2)}
+
+    return {'latitude': latitude,
+            'longitude': longitude,
+            'timezone': 'Etc/UTC',
+            'currently': point(0, 0),
+            'hourly': {'summary': 'Mostly cloudy throughout the day.',
+                       'data': [point(idx, 3600) for idx in range(49)]},
+            'daily': {'summary': 'Light rain through the week.',
+                      'data': [point(idx, 86400) for idx in range(8)]},
+            'flags': {'units': units}}
+
+
+class _ReplayHandler(BaseHTTPRequestHandler):
+    """Request handler answering from the replay server."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def handle(self) -> None:
+        """Handles requests, ignoring clients which hung up early."""
+        try:
+            super(_ReplayHandler, self).handle()
+        except ConnectionError:
+            pass
+
+    def log_message(self, *args: Any) -> None:
+        """Keeps the replayed requests out of the console."""
+
+    def do_GET(self) -> None:
+        """Answers GET request."""
+        self._reply()
+
+    def do_POST(self) -> None:
+        """Answers POST request, discarding its body."""
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self._reply()
+
+    def _reply(self) -> None:
+        """Sends the replayed or the injected error response."""
+        replay = self.server.replay
+        address = urlsplit(self.path)
+        status, payload = replay.respond(address.path,
+                                         parse_qs(address.query))
+        body = json.dumps(payload).encode(DEFAULT_CHARSET)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class ReplayServer(object):
+    """Local stand-in HTTP server for the upstream APIs.
+
+    Serves the weather, geocode, geolocate, distance matrix & OSM
+    lookups on ``localhost``. A route answers with its recording if one
+    is loaded, otherwise a payload is synthesized from the request so
+    that the coordinates, zones & distances stay consistent. Every
+    response is delayed by ``latency`` plus up to ``jitter`` seconds
+    and ``error_rate`` of them fail with ``error_status``.
+
+    Args:
+        recordings: Directory holding the recorded payloads as
+                    ``<route>.json`` files, i.e. ``forecast.json``, or a
+                    mapping of route to payload.
+                    Default: None
+        latency: Seconds every response is delayed by.
+                 Default: 0.0
+        jitter: Maximum random seconds added to the latency.
+                Default: 0.0
+        error_rate: Fraction of the requests which fail.
+                    Default: 0.0
+        error_status: HTTP status of the failed requests.
+                      Default: 503
+        host: Host the server listens on.
+              Default: 127.0.0.1
+        port: Port the server listens on, any free port if 0.
+              Default: 0
+        seed: Seed of the latency & error injection.
+              Default: None
+
+    Example:
+        >>> from pyxa.utils.replay import ReplayServer
+        >>> from pyxa.core.weather import forecast
+        >>> with ReplayServer(latency=0.05, error_rate=0.01) as server:
+        ...     forecast('AIzaReplay', 'replay', 'London')
+        ('London', 2, '21.52°C', '20.02°C', ...)
+        >>> server.stats()
+        {'requests': 2, 'errors': 0, 'by_route': {'geocode': 1, ...}}
+    """
+
+    def __init__(self,
+                 recordings: Optional[Any] = None,
+                 latency: Optional[float] = 0.0,
+                 jitter: Optional[float] = 0.0,
+                 error_rate: Optional[float] = 0.0,
+                 error_status: Optional[int] = 503,
+                 host: Optional[str] = '127.0.0.1',
+                 port: Optional[int] = 0,
+                 seed: Optional[int] = None) -> None:
+        self.recordings = {}
+        if isinstance(recordings, dict):
+            self.recordings.update(recordings)
+        elif recordings is not None:
+            self.load(recordings)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.host = host
+        self.port = port
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+        self._redirected = None
+        self.requests = Counter()
+        self.errors = 0
+
+    def __enter__(self) -> 'ReplayServer':
+        self.start()
+        self.redirect()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.restore()
+        self.stop()
+
+    @property
+    def url(self) -> str:
+        """Returns base URL of the running server."""
+        return f'http://{self.host}:{self.port}'
+
+    def load(self, directory: str) -> None:
+        """Loads ``<route>.json`` recordings from the directory."""
+        for route in ROUTES:
+            path = os.path.join(directory, f'{route}.json')
+            if os.path.isfile(path):
+                with open(path, encoding=DEFAULT_CHARSET) as file:
+                    self.recordings[route] = json.load(file)
+
+    def respond(self, path: str, query: Dict[str, List[str]]
+                ) -> Tuple[int, Any]:
+        """Returns status & payload for the request path & query."""
+        route = next((name for name, prefix in ROUTES.items()
+                      if path.startswith(prefix)), None)
+        with self._lock:
+            self.requests[route] += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        if delay > 0:
+            time.sleep(delay)
+        if route is None:
+            return 404, {'error': f'Unknown route "{path}".'}
+        if failed:
+            return self.error_status, {'error': 'Injected error.'}
+        if route in self.recordings:
+            return 200, self.recordings[route]
+        return 200, getattr(self, f'_synthesize_{route}')(path, query)
+
+    def _synthesize_forecast(self, path: str,
+                             query: Dict[str, List[str]]) -> Dict[str, Any]:
+        """Returns forecast for ``/forecast/<key>/<lat>,<lng>``."""
+        latitude, longitude = _coordinates(path.rsplit('/', 1)[-1])[0]
+        return synthesize_forecast(latitude, longitude,
+                                   query.get('units', ['si'])[0])
+
+    def _synthesize_geocode(self, path: str,
+                            query: Dict[str, List[str]]) -> Dict[str, Any]:
+        """Returns geocode result for the address."""
+        address = query.get('address', [''])[0]
+        latitude, longitude = _fake_coordinates(address)
+        return {'status': 'OK',
+                'results': [{'formatted_address': address,
+                             'geometry': {'location': {'lat': latitude,
+                                                       'lng': longitude}}}]}
+
+    def _synthesize_geolocate(self, path: str,
+                              query: Dict[str, List[str]]) -> Dict[str, Any]:
+        """Returns a fixed current location."""
+        return {'location': {'lat': 51.5074, 'lng': -0.1278},
+                'accuracy': 20.0}
+
+    def _synthesize_distancematrix(self, path: str,
+                                   query: Dict[str, List[str]]
+                                   ) -> Dict[str, Any]:
+        """Returns great-circle based rows for the origins."""
+        origins = _coordinates(query.get('origins', [''])[0])
+        destinations = _coordinates(query.get('destinations', [''])[0])
+        speed = TRAVEL_SPEEDS.get(query.get('mode', ['driving'])[0], 13.9)
+        metric = query.get('units', ['metric'])[0] == 'metric'
+        rows = []
+        for origin in origins:
+            elements = []
+            for destination in destinations:
+                # Roads are rarely straight, hence the detour factor.
+                meters = float(haversine(*origin, *destination)) * 1.3
+                seconds = meters / speed
+                elements.append({
+                    'status': 'OK',
+                    'distance': {'value': int(meters),
+                                 'text': format_distance(meters, metric)},
+                    'duration': {'value': int(seconds),
+                                 'text': _duration_text(seconds)}})
+            rows.append({'elements': elements})
+        return {'status': 'OK',
+                'origin_addresses': [f'{lat},{lng}' for lat, lng in origins],
+                'destination_addresses': [f'{lat},{lng}'
+                                          for lat, lng in destinations],
+                'rows': rows}
+
+    def _synthesize_reverse(self, path: str,
+                            query: Dict[str, List[str]]) -> Dict[str, Any]:
+        """Returns OSM reverse lookup for the coordinates."""
+        latitude = float(query.get('lat', query.get('q', ['0,0']))[0]
+                         .split(',')[0])
+        longitude = float(query.get('lon', query.get('q', ['0,0']))[0]
+                          .split(',')[-1])
+        return {'lat': str(latitude),
+                'lon': str(longitude),
+                'display_name': 'Replay Street, Replay City, Replayland',
+                'address': {'road': 'Replay Street',
+                            'suburb': 'Replay Suburb',
+                            'city': 'Replay City',
+                            'state': 'Replay State',
+                            'country': 'Replayland',
+                            'country_code': 'rp'}}
+
+    def _synthesize_search(self, path: str,
+                           query: Dict[str, List[str]]) -> List[Dict]:
+        """Returns OSM search results, used by the reverse lookups."""
+        return [self._synthesize_reverse(path, query)]
+
+    def start(self) -> str:
+        """Starts serving in a daemon thread and returns the base URL."""
+        if self._server is None:
+            self._server = ThreadingHTTPServer((self.host, self.port),
+                                               _ReplayHandler)
+            self._server.daemon_threads = True
+            self._server.replay = self
+            self.host, self.port = self._server.server_address[:2]
+            self._thread = threading.Thread(target=self._server.serve_forever,
+                                            name='pyxa-replay',
+                                            daemon=True)
+            self._thread.start()
+        return self.url
+
+    def stop(self) -> None:
+        """Stops the server."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = self._thread = None
+
+    def redirect(self) -> None:
+        """Redirects the upstream APIs & connectivity probe to itself."""
+        if self._redirected is not None:
+            return
+        for upstream in (_origin(DEFAULT_WEATHER_URL), DEFAULT_MAPS_URL,
+                         DEFAULT_GEOLOCATION_URL, DEFAULT_OSM_URL):
+            session_manager.redirect(upstream, self.url)
+        self._redirected = connectivity.host, connectivity.port
+        connectivity.host, connectivity.port = self.host, self.port
+        connectivity.probe()
+
+    def restore(self) -> None:
+        """Points the upstream APIs & connectivity probe back."""
+        if self._redirected is None:
+            return
+        for upstream in (_origin(DEFAULT_WEATHER_URL), DEFAULT_MAPS_URL,
+                         DEFAULT_GEOLOCATION_URL, DEFAULT_OSM_URL):
+            session_manager.redirect(upstream)
+        connectivity.host, connectivity.port = self._redirected
+        # Forces a fresh probe of the real internet on the next check.
+        connectivity.checked_at = None
+        self._redirected = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns number of requests & injected errors per route."""
+        return {'requests': sum(self.requests.values()),
+                'errors': self.errors,
+                'by_route': dict(self.requests)}
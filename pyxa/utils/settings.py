@@ -53,6 +53,55 @@ DEFAULT_CHARSET = 'utf-8'
 DEFAULT_PING_URL = 'https://www.google.com/'
 DEFAULT_WEATHER_URL = 'https://api.darksky.net/forecast/'
 
+# Upstream APIs whose requests can be redirected, for example to the
+# local replay server of `pyxa.utils.replay`.
+DEFAULT_MAPS_URL = 'https://maps.googleapis.com'
+DEFAULT_GEOLOCATION_URL = 'https://www.googleapis.com'
+DEFAULT_OSM_URL = 'https://nominatim.openstreetmap.org'
+
+# Outbound HTTP settings.
+# Number of hosts whose connection pools are kept alive, connections
+# kept per host, seconds before a request is given up & the retries
+# made with an exponential backoff factor on failures.
+DEFAULT_HTTP_POOL_CONNECTIONS = 10
+DEFAULT_HTTP_POOL_MAXSIZE = 16
+DEFAULT_HTTP_TIMEOUT = 10.0
+DEFAULT_HTTP_RETRIES = 3
+DEFAULT_HTTP_BACKOFF = 0.3
+
+# Circuit breaker settings.
+# Outcomes of recent calls kept per host, calls needed before the host
+# can trip, fraction of failed calls which trips it & the seconds after
+# which a call counts as failed for being slow. A tripped host is given
+# a single trial call after the cooldown seconds.
+DEFAULT_BREAKER_WINDOW = 20
+DEFAULT_BREAKER_MIN_CALLS = 5
+DEFAULT_BREAKER_FAILURE_RATE = 0.5
+DEFAULT_BREAKER_SLOW_CALL = 5.0
+DEFAULT_BREAKER_COOLDOWN = 30.0
+
+# Hedged requests setting.
+# Sends a duplicate GET once the p95 latency of the host has elapsed.
+DEFAULT_HEDGE_REQUESTS = False
+
+# Connectivity monitor settings.
+# Seconds between the background probes, the seconds for which a probe
+# result is trusted & the seconds after which a probe is given up.
+DEFAULT_PING_INTERVAL = 5.0
+DEFAULT_PING_TTL = 15.0
+DEFAULT_PING_TIMEOUT = 1.0
+
+# Concurrency settings.
+# Upper limit on simultaneous upstream calls made by the batch helpers.
+DEFAULT_MAX_CONCURRENCY = 16
+
+# Google Maps Distance Matrix limits per request.
+# You can find the current limits here:
+# https://developers.google.com/maps/documentation/distance-matrix/usage-and-billing
+MAPS_MATRIX_MAX_ORIGINS = 25
+MAPS_MATRIX_MAX_DESTINATIONS = 25
+MAPS_MATRIX_MAX_ELEMENTS = 100
+
 # Default package structure.
 # You can override this later. pyXA recommends against doing it.
 # User config settings.
@@ -64,10 +113,91 @@ FILES_PATH = 'files'
 TEMP_PATH = FILES_PATH + '/temp/'
 CACHE_PATH = TEMP_PATH + '/cache/'
 
+# Fuzzy matching settings.
+# Recent results & indexes kept, threads the batches are scored with
+# (-1 uses all the cores) and the largest score matrix computed at once.
+DEFAULT_FUZZY_RESULTS = 4096
+DEFAULT_FUZZY_INDEXES = 8
+DEFAULT_FUZZY_WORKERS = -1
+FUZZY_MATRIX_MAX_CELLS = 10 * 1000 * 1000
+# Lists of at least these many choices are shortlisted by trigrams. A
+# candidate shares at least the overlap fraction of the query trigrams
+# & the shortlist caps the number of candidates scored. Lower overlap &
+# longer shortlists trade speed for recall.
+DEFAULT_TRIGRAM_MIN_CHOICES = 20000
+DEFAULT_TRIGRAM_OVERLAP = 0.5
+DEFAULT_TRIGRAM_SHORTLIST = 2000
+# Keys indexed per segment and segments kept before the small ones are
+# merged together.
+DEFAULT_TRIGRAM_SEGMENT = 1 << 20
+TRIGRAM_MAX_SEGMENTS = 16
+
+# File name index settings.
+# Indexes of the searched directories are persisted here & trusted for
+# this many seconds before a lookup checks them for changes again.
+FILE_INDEX_PATH = CACHE_PATH + '/file_index/'
+DEFAULT_FILE_INDEX_REFRESH = 5.0
+
+# Forecast cache settings.
+# Forecasts are reused for this many seconds before being refetched.
+DEFAULT_FORECAST_TTL = 600
+# Geohash precision of the cache key, 5 characters is a ~4.9 km cell.
+DEFAULT_FORECAST_PRECISION = 5
+# Limits for the in-memory & on-disk tiers of the forecast cache.
+DEFAULT_FORECAST_MEMORY_ENTRIES = 256
+DEFAULT_FORECAST_DISK_BYTES = 50 * 1024 * 1024
+
+# Forecast prefetch settings.
+# Warm forecasts are refreshed once they are older than this fraction of
+# their TTL, checking for such forecasts every interval seconds.
+DEFAULT_PREFETCH_REFRESH_AHEAD = 0.8
+DEFAULT_PREFETCH_INTERVAL = 30.0
+
+# Forecast archive settings.
+# Fetched forecasts are appended to the columnar archive in this
+# directory once recording is turned on.
+ARCHIVE_PATH = FILES_PATH + '/archive/'
+DEFAULT_ARCHIVE_FORECASTS = False
+
 # Database settings.
 DATABASE_PATH = 'database'
 DATABASE_FILE_PATH = DATABASE_PATH + '/tracker_store.db'
 
+# API quota settings.
+# Requests allowed per second, per day & per month for every upstream
+# API key. ``None`` leaves that budget unlimited. The free tier of
+# DarkSky allows 1000 calls per month & OSM asks for 1 call per second.
+DEFAULT_API_QUOTAS = {
+    'darksky': {'per_second': 10, 'daily': None, 'monthly': 1000},
+    'maps': {'per_second': 50, 'daily': None, 'monthly': None},
+    'osm': {'per_second': 1, 'daily': None, 'monthly': None},
+}
+# Seconds a queued request waits for its rate limit slot.
+DEFAULT_QUOTA_TIMEOUT = 30.0
+# Usage is persisted once this many requests were granted or this many
+# seconds passed since the last write, and on exit.
+DEFAULT_QUOTA_SAVE_EVERY = 50
+DEFAULT_QUOTA_SAVE_INTERVAL = 5.0
+
+# Geocode cache settings.
+# Geocoded addresses & zones are reused for this many seconds.
+DEFAULT_GEOCODE_TTL = 30 * 24 * 60 * 60
+# Geohash precision of the reverse lookups, 7 characters is a ~150 m
+# cell.
+DEFAULT_GEOCODE_PRECISION = 7
+# Geohash precisions whose hit ratio is reported by the caches & the
+# number of recent cells remembered per precision to estimate it.
+DEFAULT_TRACKED_PRECISIONS = (4, 5, 6, 7, 8)
+DEFAULT_TRACKED_CELLS = 4096
+
+# Offline reverse geocoding settings.
+# Places farther than this many kilometers fall back to the OSM lookup.
+DEFAULT_OFFLINE_ZONE_DISTANCE = 50.0
+
+# Bulk geocoding settings.
+# Rows geocoded, written & checkpointed together by ``pyxa geocode``.
+DEFAULT_GEOCODE_BATCH = 256
+
 # Virtual environment settings.
 VENV_NAME = 'venv'
 
@@ -85,3 +215,24 @@ TEST_HOST_PORT = 2121
 # Sets the logging level to INFO.
 ENV_LOG_LEVEL_NAME = 'PYXA_LOG_LEVEL'
 DEFAULT_LOG_LEVEL = 'INFO'
+
+# Profiler settings.
+# Mode of the profiled functions: off, full, aggregate, sample or stack.
+# The sample mode profiles 1 in every rate calls and the stack mode
+# samples the stacks of the running calls every interval seconds. The
+# aggregated profiles are dumped every dump interval seconds & on exit.
+ENV_PROFILER_NAME = 'PYXA_PROFILER'
+ENV_PROFILER_RATE_NAME = 'PYXA_PROFILER_RATE'
+ENV_PROFILER_INTERVAL_NAME = 'PYXA_PROFILER_INTERVAL'
+DEFAULT_PROFILER_MODE = 'off'
+DEFAULT_PROFILER_RATE = 100
+DEFAULT_PROFILER_INTERVAL = 0.005
+DEFAULT_PROFILER_DUMP_INTERVAL = 60.0
+PROFILER_PATH = CACHE_PATH + '/profiles/'
+
+# Memory profiler settings.
+# Allocation sites reported, frames kept per allocation traceback and
+# the per call records kept by every memory profile.
+DEFAULT_MEMORY_TOP = 10
+DEFAULT_MEMORY_FRAMES = 1
+DEFAULT_MEMORY_CALLS = 100
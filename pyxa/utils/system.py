@@ -31,50 +31,759 @@ Note:
 # This is for the Win32con and Win32Gui import
 # pyright: reportMissingImports=false
 
+import atexit
 import cProfile
 import ctypes
 import io
+import json
+import logging
 import os
 import pstats
 import random
+import re
+import socket
+import sys
+import threading
 import time
+from collections import Counter, deque
 from datetime import date, datetime
-from itertools import cycle, islice
-from typing import Any, Callable, List, Optional, Union
-
-import requests
+from functools import partial, wraps
+from itertools import count, cycle, islice
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from urllib.parse import urlsplit
 
 from pyxa.utils.common import find_string
-from pyxa.utils.settings import DEFAULT_PING_URL
+from pyxa.utils.settings import (DEFAULT_CHARSET, DEFAULT_PING_INTERVAL,
+                                 DEFAULT_PING_TIMEOUT, DEFAULT_PING_TTL,
+                                 DEFAULT_MEMORY_CALLS, DEFAULT_MEMORY_FRAMES,
+                                 DEFAULT_MEMORY_TOP, DEFAULT_PING_URL,
+                                 DEFAULT_PROFILER_DUMP_INTERVAL,
+                                 DEFAULT_PROFILER_INTERVAL,
+                                 DEFAULT_PROFILER_MODE, DEFAULT_PROFILER_RATE,
+                                 ENV_PROFILER_INTERVAL_NAME, ENV_PROFILER_NAME,
+                                 ENV_PROFILER_RATE_NAME, PROFILER_PATH)
+
+logger = logging.getLogger(__name__)
+
+
+# Modes of the ``profiler`` decorator.
+PROFILER_MODES = ('off', 'full', 'aggregate', 'sample', 'stack')
+
+# Number of the most expensive functions listed in the JSON dumps.
+PROFILE_TOP_FUNCTIONS = 50
+
+# Only one call is profiled by cProfile at a time, the nested & the
+# concurrent calls of the profiled functions run unprofiled meanwhile.
+_profiling = threading.Lock()
+
+
+def _env_number(name: str, default: Union[float, int]) -> Union[float, int]:
+    """Returns number set in the environment variable, else the default."""
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    try:
+        return type(default)(value)
+    except ValueError:
+        logger.warning(f'Ignoring invalid {name}="{value}".')
+        return default
+
+
+def _profile_name(function: Callable) -> str:
+    """Returns dotted name of the function, safe for a file name."""
+    name = f'{function.__module__}.{function.__qualname__}'
+    return re.sub(r'[^\w.-]', '_', name.replace('<locals>.', ''))
+
+
+def _dump_json(path: str, data: Dict[str, Any]) -> None:
+    """Replaces the JSON file, never leaving a partial one behind."""
+    with open(f'{path}.tmp', 'w', encoding=DEFAULT_CHARSET) as file:
+        json.dump(data, file, indent=2)
+    os.replace(f'{path}.tmp', path)
+
+
+class AggregateProfile(object):
+    """Deterministic profile of a function merged across its calls.
+
+    Profiled calls of the function accumulate into a single
+    ``cProfile.Profile``, 1 in every ``rate`` calls is profiled. The
+    merged stats are dumped every ``dump_interval`` seconds & on exit as
+    a ``.prof`` file, readable by ``pstats`` & ``snakeviz``, along with
+    a JSON summary of the most expensive functions.
+
+    Args:
+        name: Name of the profiled function, used for the dump files.
+        rate: Profiles 1 in every these many calls.
+              Default: 1
+        directory: Directory in which the stats are dumped.
+                   Default: PROFILER_PATH
+        dump_interval: Seconds between the dumps.
+                       Default: 60.0
+    """
+
+    def __init__(self,
+                 name: str,
+                 rate: Optional[int] = 1,
+                 directory: Optional[str] = PROFILER_PATH,
+                 dump_interval: Optional[float] = (
+                     DEFAULT_PROFILER_DUMP_INTERVAL)) -> None:
+        self.name = name
+        self.rate = max(1, rate)
+        self.directory = directory
+        self.dump_interval = dump_interval
+        self.calls = self.profiled = 0
+        self._calls = count(1)
+        self._profile = cProfile.Profile()
+        self._dumped_at = time.monotonic()
+
+    def run(self, function: Callable, args: Tuple, kwargs: Dict) -> Any:
+        """Calls the function, profiling it if it's sampled."""
+        self.calls = idx = next(self._calls)
+        if idx % self.rate or not _profiling.acquire(False):
+            return function(*args, **kwargs)
+        try:
+            self._profile.enable()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self._profile.disable()
+                self.profiled += 1
+        finally:
+            _profiling.release()
+            if time.monotonic() - self._dumped_at >= self.dump_interval:
+                self.dump()
+
+    def dump(self) -> Optional[str]:
+        """Dumps the merged stats.
+
+        Returns:
+            Path of the ``.prof`` file, ``None`` if no call has been
+            profiled yet or the stats couldn't be written.
+        """
+        with _profiling:
+            self._dumped_at = time.monotonic()
+            if not self.profiled:
+                return None
+            stats = pstats.Stats(self._profile)
+        path = os.path.join(self.directory, f'{self.name}.prof')
+        top = sorted(stats.stats.items(), key=lambda item: item[1][3],
+                     reverse=True)[:PROFILE_TOP_FUNCTIONS]
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            stats.dump_stats(f'{path}.tmp')
+            os.replace(f'{path}.tmp', path)
+            _dump_json(os.path.join(self.directory, f'{self.name}.json'), {
+                'function': self.name,
+                'mode': 'aggregate' if self.rate == 1 else 'sample',
+                'rate': self.rate,
+                'calls': self.calls,
+                'profiled_calls': self.profiled,
+                'total_time': stats.total_tt,
+                'top': [{'function': f'{file}:{line}({function})',
+                         'calls': calls,
+                         'primitive_calls': primitive,
+                         'total_time': total,
+                         'cumulative_time': cumulative}
+                        for (file, line, function),
+                        (primitive, calls, total, cumulative, _) in top]})
+        except OSError as error:
+            logger.warning(f'Couldn\'t dump profile of {self.name}: {error}')
+            return None
+        return path
+
+
+class StackSampler(object):
+    """Statistical profiler sampling the stacks of the running calls.
+
+    Calls of the functions profiled in the ``stack`` mode only register
+    their thread. A daemon thread wakes up every ``interval`` seconds &
+    records the stacks of the registered threads from
+    ``sys._current_frames``, hence the overhead on the calls stays flat
+    no matter how deep they go. The samples are kept as collapsed
+    stacks, root first, which flame graph tools read as they are. They
+    are dumped as JSON every ``dump_interval`` seconds & on exit.
+
+    Args:
+        interval: Seconds between the samples.
+                  Default: 0.005
+        directory: Directory in which the samples are dumped.
+                   Default: PROFILER_PATH
+        dump_interval: Seconds between the dumps.
+                       Default: 60.0
+    """
+
+    def __init__(self,
+                 interval: Optional[float] = DEFAULT_PROFILER_INTERVAL,
+                 directory: Optional[str] = PROFILER_PATH,
+                 dump_interval: Optional[float] = (
+                     DEFAULT_PROFILER_DUMP_INTERVAL)) -> None:
+        self.interval = interval
+        self.directory = directory
+        self.dump_interval = dump_interval
+        self._active = {}
+        self._calls = Counter()
+        self._samples = {}
+        self._seconds = Counter()
+        self._dumped_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def run(self,
+            name: str,
+            function: Callable,
+            args: Tuple,
+            kwargs: Dict) -> Any:
+        """Calls the function with its thread registered for sampling."""
+        ident = threading.get_ident()
+        if ident in self._active:
+            # Nested calls are sampled as part of the outermost one.
+            return function(*args, **kwargs)
+        if self._thread is None:
+            self._start()
+        self._active[ident] = name
+        self._calls[name] += 1
+        self._wake.set()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            del self._active[ident]
+
+    def _start(self) -> None:
+        """Starts the sampling thread once."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run,
+                                                name='pyxa-stack-sampler',
+                                                daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        """Samples the registered threads until the process exits."""
+        while True:
+            if not self._active:
+                self._wake.clear()
+                if not self._active:
+                    self._wake.wait(self.dump_interval)
+            started = time.perf_counter()
+            time.sleep(self.interval)
+            self.sample(time.perf_counter() - started)
+            if time.monotonic() - self._dumped_at >= self.dump_interval:
+                self.dump()
+
+    def sample(self, elapsed: Optional[float] = None) -> None:
+        """Records the current stacks of the registered threads.
+
+        Args:
+            elapsed: Seconds since the previous sample, every sample
+                     stands for that much running time. The interval is
+                     used if ``None`` is passed.
+                     Default: None
+        """
+        active = dict(self._active)
+        if not active:
+            return
+        frames = sys._current_frames()
+        with self._lock:
+            for ident, name in active.items():
+                frame, stack = frames.get(ident), []
+                while frame is not None and frame.f_code is not _RUN_CODE:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ('
+                                 f'{os.path.basename(code.co_filename)}:'
+                                 f'{code.co_firstlineno})')
+                    frame = frame.f_back
+                if stack:
+                    samples = self._samples.setdefault(name, Counter())
+                    samples[';'.join(reversed(stack))] += 1
+                    self._seconds[name] += (self.interval if elapsed is None
+                                            else elapsed)
+
+    def stats(self, name: str) -> Dict[str, Any]:
+        """Returns samples of the function along with its hot spots.
+
+        Args:
+            name: Name of the profiled function.
 
+        Returns:
+            Dictionary of the calls, samples & sampled seconds along
+            with the collapsed stacks and the functions ranked by the
+            samples they were on top of the stack (``self``) & anywhere
+            in the stack (``inclusive``).
+        """
+        with self._lock:
+            stacks = dict(self._samples.get(name, {}))
+        own, inclusive = Counter(), Counter()
+        for stack, hits in stacks.items():
+            frames = stack.split(';')
+            own[frames[-1]] += hits
+            for frame in set(frames):
+                inclusive[frame] += hits
+        samples = sum(stacks.values())
+        return {'function': name,
+                'mode': 'stack',
+                'interval': self.interval,
+                'calls': self._calls[name],
+                'samples': samples,
+                'sampled_time': self._seconds[name],
+                'top': [{'function': frame,
+                         'self': own[frame],
+                         'inclusive': hits}
+                        for frame, hits in inclusive.most_common(
+                            PROFILE_TOP_FUNCTIONS)],
+                'stacks': dict(Counter(stacks).most_common())}
 
-def profiler(function: Callable) -> Any:
+    def dump(self) -> List[str]:
+        """Dumps samples of every sampled function.
+
+        Returns:
+            Paths of the JSON files written.
+        """
+        self._dumped_at = time.monotonic()
+        with self._lock:
+            names = list(self._samples)
+        paths = []
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            for name in names:
+                path = os.path.join(self.directory, f'{name}.stack.json')
+                _dump_json(path, self.stats(name))
+                paths.append(path)
+        except OSError as error:
+            logger.warning(f'Couldn\'t dump stack samples: {error}')
+        return paths
+
+
+# Code of the frame at which the sampled stacks stop.
+_RUN_CODE = StackSampler.run.__code__
+
+# Aggregated profiles & the shared stack sampler, dumped on exit.
+_profiles = []
+_sampler = None
+
+
+def dump_profiles() -> List[str]:
+    """Dumps stats of all the aggregated & sampled functions.
+
+    Returns:
+        Paths of the files written.
+    """
+    paths = [profile.dump() for profile in list(_profiles)]
+    if _sampler is not None:
+        paths.extend(_sampler.dump())
+    return [path for path in paths if path is not None]
+
+
+def profiler(function: Optional[Callable] = None,
+             mode: Optional[str] = None,
+             rate: Optional[int] = None) -> Any:
     """Profiler & optimizer decorator.
 
     Decorator function that uses cProfile to profile, test & optimise
-    other functions. The profiling is done at the later stage once the
-    bruteforced code is compliled.
+    other functions. The mode is read from the ``PYXA_PROFILER``
+    environment variable once the function is decorated, hence the
+    decorator can be left in place & turned on in production:
+
+        * ``off``: The function is left untouched. (default)
+        * ``full``: Every call is profiled & its top 10 functions are
+          printed.
+        * ``aggregate``: Every call is profiled & the stats are merged
+          across the calls, then dumped as ``.prof`` & JSON files under
+          ``PROFILER_PATH``.
+        * ``sample``: Same as ``aggregate`` but only 1 in every
+          ``PYXA_PROFILER_RATE`` calls is profiled.
+        * ``stack``: The stacks of the running calls are sampled every
+          ``PYXA_PROFILER_INTERVAL`` seconds by a background thread &
+          dumped as JSON under ``PROFILER_PATH``.
+
+    The dumps are refreshed every minute & when the process exits.
+
+    Args:
+        function: Function to be profiled.
+        mode: Mode used instead of the environment variable.
+              Default: None
+        rate: Profiles 1 in every these many calls in the ``sample``
+              mode, instead of the environment variable.
+              Default: None
+
+    Example:
+        >>> from pyxa.utils.system import profiler
+        >>> @profiler
+        ... def forecast_for(place: str) -> Tuple:
+        ...     return forecast(maps_key, darksky_key, place)
+        >>> @profiler(mode='sample', rate=50)
+        ... def find(name: str) -> str:
+        ...     return find_file(name, 'D:/Music/')
 
     Returns:
-        ``inner`` function object which displays the stats of the
-        operating function.
+        ``inner`` function object which profiles the operating function.
     """
+    global _sampler
+
+    if function is None:
+        return partial(profiler, mode=mode, rate=rate)
+    mode = (mode or os.environ.get(ENV_PROFILER_NAME,
+                                   DEFAULT_PROFILER_MODE)).lower()
+    if mode not in PROFILER_MODES:
+        logger.warning(f'Unknown profiler mode "{mode}", profiling is off.')
+        mode = 'off'
+    if mode == 'off':
+        return function
+
+    if mode == 'full':
+        @wraps(function)
+        def inner(*args: Any, **kwargs: Any) -> Any:
+            """Inner decorator function."""
+            profile = cProfile.Profile()
+            profile.enable()
+            ret_val = function(*args, **kwargs)
+            profile.disable()
+            string = io.StringIO()
+            sort_by = 'cumulative'
+            stats = pstats.Stats(profile, stream=string).sort_stats(sort_by)
+            stats.print_stats(10)
+            print(string.getvalue())
+            return ret_val
+        return inner
 
-    def inner(*args: Any, **kwargs: Any) -> None:
+    if not _profiles and _sampler is None:
+        atexit.register(dump_profiles)
+    name = _profile_name(function)
+
+    if mode == 'stack':
+        if _sampler is None:
+            _sampler = StackSampler(_env_number(ENV_PROFILER_INTERVAL_NAME,
+                                                DEFAULT_PROFILER_INTERVAL))
+        sampler = _sampler
+
+        @wraps(function)
+        def inner(*args: Any, **kwargs: Any) -> Any:
+            """Inner decorator function."""
+            return sampler.run(name, function, args, kwargs)
+        return inner
+
+    if mode == 'sample' and rate is None:
+        rate = _env_number(ENV_PROFILER_RATE_NAME, DEFAULT_PROFILER_RATE)
+    profile = AggregateProfile(name, rate if mode == 'sample' else 1)
+    _profiles.append(profile)
+
+    @wraps(function)
+    def inner(*args: Any, **kwargs: Any) -> Any:
         """Inner decorator function."""
-        profile = cProfile.Profile()
-        profile.enable()
-        ret_val = function(*args, **kwargs)
-        profile.disable()
-        string = io.StringIO()
-        sort_by = 'cumulative'
-        stats = pstats.Stats(profile,stream=string).sort_stats(sort_by)
-        stats.print_stats(10)
-        print(string.getvalue())
-        return ret_val
+        return profile.run(function, args, kwargs)
+    inner.profile = profile
     return inner
 
 
+class _PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+    """Memory counters of a process returned by the Windows API."""
+    _fields_ = [('cb', ctypes.c_ulong),
+                ('PageFaultCount', ctypes.c_ulong),
+                ('PeakWorkingSetSize', ctypes.c_size_t),
+                ('WorkingSetSize', ctypes.c_size_t),
+                ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                ('PagefileUsage', ctypes.c_size_t),
+                ('PeakPagefileUsage', ctypes.c_size_t)]
+
+
+def peak_rss() -> Optional[int]:
+    """Returns peak resident set size of the process in bytes.
+
+    Uses ``getrusage`` on Unix & ``GetProcessMemoryInfo`` on Windows.
+    ``None`` is returned if neither is available.
+    """
+    try:
+        import resource
+    except ImportError:
+        resource = None
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes while macOS reports bytes.
+        return peak if sys.platform == 'darwin' else peak * 1024
+    try:
+        counters = _PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        if ctypes.windll.psapi.GetProcessMemoryInfo(
+                ctypes.windll.kernel32.GetCurrentProcess(),
+                ctypes.byref(counters), counters.cb):
+            return counters.PeakWorkingSetSize
+    except (AttributeError, OSError):
+        pass
+    return None
+
+
+# Number of memory profiles tracing at the moment, ``tracemalloc`` is
+# stopped once the last one started by them exits.
+_tracing = [0, False]
+_tracing_lock = threading.Lock()
+
+# States of the profiled calls running at the moment, each being the
+# traced bytes at its start, its start time & its peak so far.
+_active_calls = []
+
+
+def _fold_peak() -> None:
+    """Folds the traced peak into the running calls & restarts it.
+
+    ``tracemalloc`` keeps a single peak for the process. It is folded
+    into the peak of every running call whenever a call starts or ends
+    before being reset, hence a nested call never wipes the peak of the
+    call around it. Without ``reset_peak`` (Python < 3.9) the peak since
+    ``tracemalloc`` started is folded, which overstates the peaks.
+    """
+    import tracemalloc
+
+    peak = tracemalloc.get_traced_memory()[1]
+    for state in _active_calls:
+        state[2] = max(state[2], peak)
+    if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+
+
+def _allocation_sites(stats: List[Any], top: int) -> List[Dict[str, Any]]:
+    """Returns the largest allocation differences as dictionaries."""
+    return [{'site': str(stat.traceback[-1]),
+             'size': stat.size_diff,
+             'count': stat.count_diff,
+             'traceback': [str(frame) for frame in stat.traceback]}
+            for stat in stats[:top]]
+
+
+class MemoryProfiler(object):
+    """Memory profiler built on ``tracemalloc``.
+
+    Usable as a decorator or a context manager. Every profiled call
+    records the bytes it left allocated, the peak of the bytes traced
+    while it ran above those traced when it started and the allocation
+    sites which grew the most, found by diffing the snapshots taken
+    around the call. The peak RSS of the process is reported along.
+
+    The snapshot of the last call can be saved under ``PROFILER_PATH``
+    & compared against a later run, hence memory regressions in the
+    dataset & forecast code show up as the sites which grew since.
+
+    ``tracemalloc`` is started on entry if it isn't tracing already &
+    stopped once the last profile exits. Every profiled call keeps its
+    own peak, nested calls included. The peak of a call also counts the
+    allocations made meanwhile by the other threads, as ``tracemalloc``
+    traces the whole process.
+
+    Args:
+        name: Name of the profile, used for the saved files. Name of
+              the decorated function or ``memory`` is used if ``None``
+              is passed.
+              Default: None
+        top: Number of allocation sites reported.
+             Default: 10
+        frames: Number of frames kept per allocation traceback, the
+                sites are grouped by their whole traceback if more than
+                one frame is kept.
+                Default: 1
+        directory: Directory in which the snapshots are saved.
+                   Default: PROFILER_PATH
+
+    Example:
+        >>> from pyxa.utils.system import memory_profiler
+        >>> with memory_profiler(name='forecast') as memory:
+        ...     forecast(maps_key, darksky_key, 'London')
+        >>> memory.last['allocated'], memory.last['peak']
+        (48213, 1904377)
+        >>> memory.save()
+        'files/temp/cache/profiles/forecast.snapshot'
+        >>> # Next run, after a change to the forecast code.
+        >>> memory.compare()[0]
+        {'site': 'pyxa/core/forecast.py:120', 'size': 524288, ...}
+    """
+
+    def __init__(self,
+                 name: Optional[str] = None,
+                 top: Optional[int] = DEFAULT_MEMORY_TOP,
+                 frames: Optional[int] = DEFAULT_MEMORY_FRAMES,
+                 directory: Optional[str] = PROFILER_PATH) -> None:
+        self.name = name
+        self.top = top
+        self.frames = frames
+        self.directory = directory
+        self.calls = deque(maxlen=DEFAULT_MEMORY_CALLS)
+        self.last = None
+        self.snapshot = None
+        self._local = threading.local()
+
+    def __call__(self, function: Callable) -> Callable:
+        """Profiles every call of the function."""
+        if self.name is None:
+            self.name = _profile_name(function)
+
+        @wraps(function)
+        def inner(*args: Any, **kwargs: Any) -> Any:
+            """Inner decorator function."""
+            with self:
+                return function(*args, **kwargs)
+        inner.memory = self
+        return inner
+
+    def _filter(self, snapshot: Any) -> Any:
+        """Returns snapshot without the allocations of the profiler."""
+        import tracemalloc
+
+        return snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            tracemalloc.Filter(False, '<unknown>')])
+
+    @property
+    def _key_type(self) -> str:
+        """Returns how the allocation statistics are grouped."""
+        return 'traceback' if self.frames > 1 else 'lineno'
+
+    def __enter__(self) -> 'MemoryProfiler':
+        import tracemalloc
+
+        with _tracing_lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self.frames)
+                _tracing[1] = True
+            _tracing[0] += 1
+        before = self._filter(tracemalloc.take_snapshot())
+        with _tracing_lock:
+            _fold_peak()
+            current = tracemalloc.get_traced_memory()[0]
+            state = [current, time.perf_counter(), current]
+            _active_calls.append(state)
+        # Recursive calls of a profiled function nest their states.
+        stack = self._local.__dict__.setdefault('stack', [])
+        stack.append((before, state))
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        import tracemalloc
+
+        before, state = self._local.stack.pop()
+        with _tracing_lock:
+            _fold_peak()
+            current = tracemalloc.get_traced_memory()[0]
+            _active_calls.remove(state)
+        start, started, peak = state
+        elapsed = time.perf_counter() - started
+        after = self._filter(tracemalloc.take_snapshot())
+        with _tracing_lock:
+            _tracing[0] -= 1
+            if not _tracing[0] and _tracing[1]:
+                tracemalloc.stop()
+                _tracing[1] = False
+        stats = after.compare_to(before, self._key_type)
+        self.snapshot = after
+        self.last = {'allocated': current - start,
+                     'peak': max(0, peak - start),
+                     'peak_rss': peak_rss(),
+                     'seconds': elapsed,
+                     'top': _allocation_sites(stats, self.top)}
+        self.calls.append(self.last)
+
+    def report(self) -> Dict[str, Any]:
+        """Returns summary of the profiled calls.
+
+        Returns:
+            Dictionary of the number of calls, the bytes left allocated
+            in total & per call on average, the highest peak of a call,
+            the peak RSS of the process and the allocation sites of the
+            last call.
+        """
+        calls = list(self.calls)
+        allocated = sum(call['allocated'] for call in calls)
+        return {'name': self.name,
+                'calls': len(calls),
+                'allocated': allocated,
+                'allocated_per_call': (allocated / len(calls)
+                                       if calls else 0.0),
+                'peak': max((call['peak'] for call in calls), default=0),
+                'peak_rss': peak_rss(),
+                'top': self.last['top'] if self.last else []}
+
+    def _path(self, path: Optional[str] = None) -> str:
+        """Returns path of the saved snapshot."""
+        return path or os.path.join(self.directory,
+                                    f'{self.name or "memory"}.snapshot')
+
+    def save(self, path: Optional[str] = None) -> str:
+        """Saves snapshot of the last call along with the report.
+
+        Args:
+            path: Path of the snapshot. ``<name>.snapshot`` under the
+                  directory is used if ``None`` is passed.
+                  Default: None
+
+        Returns:
+            Path of the saved snapshot.
+
+        Raises:
+            ValueError: If no call has been profiled yet.
+        """
+        if self.snapshot is None:
+            raise ValueError(f'No call of "{self.name}" profiled yet.')
+        path = self._path(path)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.snapshot.dump(f'{path}.tmp')
+        os.replace(f'{path}.tmp', path)
+        _dump_json(f'{os.path.splitext(path)[0]}.memory.json',
+                   self.report())
+        return path
+
+    def compare(self, baseline: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Returns allocation sites which grew since the baseline.
+
+        Args:
+            baseline: Path of a snapshot saved by an earlier run. The
+                      snapshot last saved under the name is used if
+                      ``None`` is passed, hence comparing before saving
+                      diffs this run against the previous one.
+                      Default: None
+
+        Returns:
+            Allocation sites sorted by the bytes they grew by.
+
+        Raises:
+            ValueError: If no call has been profiled yet.
+            FileNotFoundError: If the baseline doesn't exist.
+        """
+        import tracemalloc
+
+        if self.snapshot is None:
+            raise ValueError(f'No call of "{self.name}" profiled yet.')
+        previous = tracemalloc.Snapshot.load(self._path(baseline))
+        stats = self.snapshot.compare_to(previous, self._key_type)
+        return _allocation_sites(stats, self.top)
+
+
+def memory_profiler(function: Optional[Callable] = None,
+                    **kwargs: Any) -> Union[Callable, MemoryProfiler]:
+    """Memory profiler decorator & context manager.
+
+    Profiles the allocations of every call of the decorated function or
+    of the block of code in the ``with`` statement through a
+    ``MemoryProfiler``. Accepts the same keyword arguments.
+
+    Example:
+        >>> from pyxa.utils.system import memory_profiler
+        >>> @memory_profiler(top=5)
+        ... def load(path: str) -> List[str]:
+        ...     return open(path).read().splitlines()
+        >>> load('phrases.txt')
+        >>> load.memory.report()
+        {'name': '__main__.load', 'calls': 1, 'allocated': 1048576, ...}
+
+    Returns:
+        ``inner`` function object if a function is passed, else the
+        ``MemoryProfiler`` itself.
+    """
+    if function is None:
+        return MemoryProfiler(**kwargs)
+    return MemoryProfiler(**kwargs)(function)
+
+
 def active_windows() -> List:
     """Returns list of active windows"""
     # You can find the reference code here:
@@ -112,15 +821,124 @@ def minimize_window(window_title: str, delay: Union[float, int] = 1.0) -> None:
                SW_MINIMIZE)
 
 
-def check_internet(timeout: Optional[Union[float, int]] = 10.0) -> bool:
-    """Checks the internet."""
-    # You can find the reference code here:
-    # https://gist.github.com/yasinkuyu/aa505c1f4bbb4016281d7167b8fa2fc2
-    try:
-        _ = requests.get(DEFAULT_PING_URL, timeout=timeout)
-        return True
-    except ConnectionError:
-        return False
+class ConnectivityMonitor(object):
+    """Background internet connectivity monitor.
+
+    Probes the internet with a cheap TCP handshake instead of a complete
+    HTTP request and caches the result. A daemon thread re-probes every
+    ``interval`` seconds, hence callers only read the cached state and
+    never wait on the network unless the state has gone stale.
+
+    Args:
+        url: URL whose host & port is probed.
+             Default: DEFAULT_PING_URL
+        interval: Seconds between the background probes.
+                  Default: 5.0
+        ttl: Seconds for which the probed state is trusted.
+             Default: 15.0
+        timeout: Seconds after which the probe is given up.
+                 Default: 1.0
+
+    Example:
+        >>> from pyxa.utils.system import connectivity
+        >>> connectivity.is_online()
+        True
+    """
+
+    def __init__(self,
+                 url: Optional[str] = DEFAULT_PING_URL,
+                 interval: Optional[float] = DEFAULT_PING_INTERVAL,
+                 ttl: Optional[float] = DEFAULT_PING_TTL,
+                 timeout: Optional[float] = DEFAULT_PING_TIMEOUT) -> None:
+        address = urlsplit(url)
+        self.host = address.hostname
+        self.port = address.port or (443 if address.scheme == 'https' else 80)
+        self.interval = interval
+        self.ttl = ttl
+        self.timeout = timeout
+        self.online = False
+        # ``None`` until the first probe, the monotonic clock counts from
+        # boot so no timestamp can stand in for "never checked".
+        self.checked_at = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def probe(self, timeout: Optional[float] = None) -> bool:
+        """Probes the internet and caches the result."""
+        try:
+            with socket.create_connection((self.host, self.port),
+                                          timeout=timeout or self.timeout):
+                online = True
+        except OSError:
+            online = False
+        self.update(online)
+        return online
+
+    def update(self, online: bool) -> None:
+        """Records the connectivity observed by a real request."""
+        with self._lock:
+            self.online = online
+            self.checked_at = time.monotonic()
+
+    def fresh(self) -> bool:
+        """Returns whether the cached state can still be trusted."""
+        checked_at = self.checked_at
+        return (checked_at is not None
+                and time.monotonic() - checked_at < self.ttl)
+
+    def known_offline(self) -> bool:
+        """Returns whether the cached state is fresh and offline."""
+        return not self.online and self.fresh()
+
+    def is_online(self, timeout: Optional[float] = None) -> bool:
+        """Returns cached connectivity state, probing only if stale."""
+        self.start()
+        if self.fresh():
+            return self.online
+        return self.probe(timeout)
+
+    def _run(self) -> None:
+        """Probes the internet until stopped."""
+        while not self._stop.wait(self.interval):
+            self.probe()
+
+    def start(self) -> None:
+        """Starts the background probing thread if not running."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run,
+                                                name='pyxa-connectivity',
+                                                daemon=True)
+                self._thread.start()
+
+    def stop(self) -> None:
+        """Stops the background probing thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+# Shared monitor used by ``check_internet``.
+connectivity = ConnectivityMonitor()
+
+
+def check_internet(timeout: Optional[Union[float, int]] = None) -> bool:
+    """Checks the internet.
+
+    Reads the state cached by the shared ``connectivity`` monitor, hence
+    it doesn't make a network round trip on every call. The internet is
+    probed with a TCP handshake only if the cached state has gone stale.
+
+    Args:
+        timeout: Seconds after which a stale state probe is given up.
+                 Default: None (uses DEFAULT_PING_TIMEOUT)
+    """
+    return connectivity.is_online(timeout)
 
 
 def find_file(file: str,
@@ -128,7 +946,10 @@ def find_file(file: str,
               min_score: Optional[int] = 70) -> Optional[str]:
     """Finds file in the directory.
 
-    Finds the file in the directory using fuzzy logic.
+    Finds the file in the directory & its subdirectories using fuzzy
+    logic. The file names are looked up in the persistent index of the
+    directory, which only rescans the subdirectories changed since the
+    last lookup.
 
     Args:
         file: Approximate or Exact file name to search in the directory.
@@ -142,30 +963,32 @@ def find_file(file: str,
         Okami - Kamiki Village.mp3
 
     Returns:
-        file name to be searched from the directory.
+        file name to be searched from the directory, relative to the
+        directory if it is in a subdirectory.
 
     Raises:
         FileNotFoundError: If file not found.
     """
-    from rapidfuzz.fuzz import partial_ratio
-    from rapidfuzz.process import extract
+    from pyxa.utils.filesystem import file_index
 
-    # This will give us list of 3 best matches for our search query.
-    guessed = extract(file,
-                      os.listdir(directory),
-                      limit=3,
-                      scorer=partial_ratio)
+    found = file_index(directory).find(file, min_score)
+    if found is None:
+        raise FileNotFoundError('File not found.')
+    return found
 
-    for best_guess in guessed:
-        current_score = partial_ratio(file, best_guess)
-        if current_score > min_score and current_score > 0:
-            return best_guess[0]
-        else:
-            raise FileNotFoundError('File not found.')
 
+def resolve_number_of_days(days: Optional[int] = None,
+                           today: Optional[datetime] = None
+                           ) -> Union[int, str]:
+    """Returns day.
 
-def resolve_number_of_days(days: Optional[int] = None) -> Union[int, str]:
-    """Returns day."""
+    Args:
+        days: Number of days from today.
+              Default: None
+        today: Today's date, i.e. at the queried location. Local date of
+               the system is used if ``None`` is passed.
+               Default: None
+    """
     week = ['monday',
             'tuesday',
             'wednesday',
@@ -174,7 +997,7 @@ def resolve_number_of_days(days: Optional[int] = None) -> Union[int, str]:
             'saturday',
             'sunday']
 
-    today = datetime.now()
+    today = today or datetime.now()
 
     if days == 0 or days is None:
         return 'today'
@@ -192,8 +1015,13 @@ def resolve_number_of_days(days: Optional[int] = None) -> Union[int, str]:
         return days
 
 
-def resolve_day(day: str, next_week: Optional[bool] = False) -> int:
-    """Resolves day to index value."""
+def resolve_day(day: str,
+                next_week: Optional[bool] = False,
+                today: Optional[datetime] = None) -> int:
+    """Resolves day to index value.
+
+    Local date of the system is used as today if ``today`` isn't passed.
+    """
     week = ['monday',
             'tuesday',
             'wednesday',
@@ -202,7 +1030,7 @@ def resolve_day(day: str, next_week: Optional[bool] = False) -> int:
             'saturday',
             'sunday']
 
-    today = datetime.now()
+    today = today or datetime.now()
     today_idx = date.weekday(today)
 
     day_idx = week.index(day)
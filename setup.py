@@ -48,7 +48,10 @@ REQUIRED_PACKAGES = [
     'geolocation-python',
     'googlemaps',
     'hurry.filesize',
-    'reverse-geocode']
+    'reverse-geocode',
+    'numpy',
+    'scipy',
+    'PyYAML']
 
 
 def use_readme() -> str:
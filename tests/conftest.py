@@ -0,0 +1,37 @@
+# Copyright 2020 XAMES3. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ======================================================================
+"""Fixtures shared by the pyXA tests."""
+
+import pytest
+
+from pyxa.utils.benchmark import _isolated
+from pyxa.utils.replay import ReplayServer
+
+
+@pytest.fixture
+def isolated(tmp_path, monkeypatch):
+    """Keeps the shared caches & budgets away from the real ones."""
+    monkeypatch.chdir(tmp_path)
+    with _isolated():
+        yield tmp_path
+
+
+@pytest.fixture
+def replay(isolated):
+    """Serves the upstream APIs locally for the duration of the test."""
+    with ReplayServer(seed=0) as server:
+        yield server
@@ -0,0 +1,90 @@
+# Copyright 2020 XAMES3. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ======================================================================
+"""Tests for the `pyxa.core.cache` module."""
+
+import os
+
+from pyxa.core import cache
+from pyxa.core.cache import ForecastCache
+
+
+def _cache(tmp_path, **kwargs):
+    return ForecastCache(directory=str(tmp_path / 'cache'), **kwargs)
+
+
+def test_nearby_locations_share_an_entry(tmp_path):
+    forecasts = _cache(tmp_path)
+    forecasts.set(51.5119, -0.0808, 'si', {'currently': {}})
+    assert forecasts.get(51.5123, -0.0812, 'si') == {'currently': {}}
+    assert forecasts.get(51.5123, -0.0812, 'us') is None
+
+
+def test_entries_expire_after_ttl(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, 'time', lambda: now[0])
+    forecasts = _cache(tmp_path, ttl=60)
+    forecasts.set(51.5, -0.1, 'si', {'a': 1})
+
+    now[0] += 59
+    assert forecasts.get(51.5, -0.1, 'si') == {'a': 1}
+    now[0] += 2
+    assert forecasts.get(51.5, -0.1, 'si') is None
+    # Expired entries can still be served stale.
+    assert forecasts.lookup(51.5, -0.1, 'si') == (1000.0, {'a': 1})
+    assert forecasts.stats()['misses'] == 1
+
+
+def test_memory_tier_evicts_least_recently_used(tmp_path):
+    forecasts = ForecastCache(max_entries=2, directory=None)
+    forecasts.set(10.0, 10.0, 'si', {'a': 1})
+    forecasts.set(20.0, 20.0, 'si', {'b': 2})
+    forecasts.get(10.0, 10.0, 'si')
+    forecasts.set(30.0, 30.0, 'si', {'c': 3})
+
+    assert forecasts.get(20.0, 20.0, 'si') is None
+    assert forecasts.get(10.0, 10.0, 'si') == {'a': 1}
+    assert forecasts.get(30.0, 30.0, 'si') == {'c': 3}
+
+
+def test_disk_tier_survives_restarts(tmp_path):
+    _cache(tmp_path).set(51.5, -0.1, 'si', {'a': 1})
+    forecasts = _cache(tmp_path)
+    assert forecasts.get(51.5, -0.1, 'si') == {'a': 1}
+    assert forecasts.stats()['disk_hits'] == 1
+
+
+def test_disk_tier_evicts_oldest_files(tmp_path):
+    forecasts = _cache(tmp_path, max_disk_bytes=2000)
+    for idx in range(40):
+        forecasts.set(-60.0 + 3 * idx, 0.0, 'si', {'data': 'x' * 100})
+
+    directory = tmp_path / 'cache'
+    sizes = [os.path.getsize(directory / name)
+             for name in os.listdir(directory)]
+    assert sum(sizes) <= 2000
+    assert len(sizes) < 40
+    restarted = _cache(tmp_path)
+    assert restarted.get(-60.0 + 3 * 39, 0.0, 'si') is not None
+    assert restarted.get(-60.0, 0.0, 'si') is None
+
+
+def test_clear_empties_both_tiers(tmp_path):
+    forecasts = _cache(tmp_path)
+    forecasts.set(51.5, -0.1, 'si', {'a': 1})
+    forecasts.clear()
+    assert forecasts.get(51.5, -0.1, 'si') is None
+    assert os.listdir(tmp_path / 'cache') == []
@@ -0,0 +1,94 @@
+# Copyright 2020 XAMES3. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ======================================================================
+"""Tests for the `pyxa.utils.filesystem` module."""
+
+import os
+import time
+
+import pytest
+
+from pyxa.utils.filesystem import FileIndex
+
+
+@pytest.fixture
+def music(tmp_path):
+    root = tmp_path / 'music'
+    for album, tracks in {'Okami': ['Kamiki Village', 'Shinshu Field'],
+                          'Journey': ['Nascence', 'The Road of Trials'],
+                          'Celeste': ['Resurrections']}.items():
+        (root / album).mkdir(parents=True)
+        for track in tracks:
+            (root / album / f'{album} - {track}.mp3').touch()
+    _age(root)
+    return root
+
+
+def _age(root):
+    """Backdates the directories past the racy window of the index."""
+    past = time.time() - 60
+    for directory, _, _ in os.walk(root):
+        os.utime(directory, (past, past))
+
+
+def _index(root, path=None):
+    return FileIndex(str(root), path=path, refresh_interval=0)
+
+
+def test_finds_exact_and_approximate_names(music):
+    index = _index(music)
+    assert index.find('Okami - Kamiki Village.mp3') == os.path.join(
+        'Okami', 'Okami - Kamiki Village.mp3')
+    assert index.find('road of trials') == os.path.join(
+        'Journey', 'Journey - The Road of Trials.mp3')
+    assert index.find('zzzzzz') is None
+
+
+def test_refresh_rescans_only_changed_directories(music):
+    index = _index(music)
+    index.refresh()
+
+    assert index.refresh() == 0
+    (music / 'Celeste' / 'Celeste - Reach for the Summit.mp3').touch()
+    assert index.refresh() == 1
+    assert index.find('reach for the summit') == os.path.join(
+        'Celeste', 'Celeste - Reach for the Summit.mp3')
+
+
+def test_refresh_applies_additions_and_removals(music):
+    index = _index(music)
+    assert len(index.files()) == 5
+
+    os.remove(music / 'Okami' / 'Okami - Shinshu Field.mp3')
+    (music / 'Okami' / 'Ryoshima').mkdir()
+    (music / 'Okami' / 'Ryoshima' / 'Okami - Ryoshima Coast.mp3').touch()
+
+    files = index.files()
+    assert os.path.join('Okami', 'Okami - Shinshu Field.mp3') not in files
+    assert os.path.join('Okami', 'Ryoshima',
+                        'Okami - Ryoshima Coast.mp3') in files
+    assert index.find('Okami - Shinshu Field.mp3') != os.path.join(
+        'Okami', 'Okami - Shinshu Field.mp3')
+    assert index.find('ryoshima coast') == os.path.join(
+        'Okami', 'Ryoshima', 'Okami - Ryoshima Coast.mp3')
+
+
+def test_persisted_index_is_reused(music, tmp_path):
+    _index(music, str(tmp_path / 'index')).refresh()
+    index = _index(music, str(tmp_path / 'index'))
+
+    assert len(index) == 5
+    assert index.refresh() == 0
@@ -0,0 +1,77 @@
+# Copyright 2020 XAMES3. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ======================================================================
+"""Tests for the `pyxa.utils.fuzzy` module."""
+
+import random
+import string
+
+import numpy as np
+import pytest
+
+from pyxa.utils.fuzzy import FuzzyIndex, TrigramIndex
+
+
+@pytest.fixture(scope='module')
+def titles():
+    rng = random.Random(0)
+    words = [''.join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9)))
+             for _ in range(2000)]
+    return [' '.join(rng.choices(words, k=rng.randint(3, 5)))
+            for _ in range(30000)]
+
+
+def _fragment(text, rng):
+    """Returns part of the text with a typo, as a user would type it."""
+    start = rng.randrange(max(1, len(text) // 3))
+    query = list(text[start:start + 16])
+    query[len(query) // 2] = rng.choice(string.ascii_lowercase)
+    return ''.join(query)
+
+
+def test_candidates_contain_every_key_with_the_query(titles):
+    index = TrigramIndex(titles)
+    for query in ['abc', titles[7][:8], titles[123][2:12]]:
+        expected = {idx for idx, title in enumerate(titles) if query in title}
+        found = set(index.candidates(query, shortlist=len(titles)).tolist())
+        assert expected <= found
+
+
+def test_removed_and_added_keys(titles):
+    index = TrigramIndex(titles[:100])
+    query = titles[5]
+    assert 5 in index.candidates(query)
+    index.remove([5])
+    assert 5 not in index.candidates(query)
+    ids = index.add([query])
+    assert list(ids) == [100]
+    assert 100 in index.candidates(query)
+
+
+def test_prefiltered_recall_matches_full_scan(titles):
+    rng = random.Random(1)
+    queries = [_fragment(titles[rng.randrange(len(titles))], rng)
+               for _ in range(200)]
+    full = FuzzyIndex(titles, prefilter=False)
+    prefiltered = FuzzyIndex(titles, prefilter=True)
+
+    expected = [match and match[1] for match in full.match_many(queries)]
+    found = [match and match[1] for match in prefiltered.match_many(queries)]
+
+    # The full scan scores in single precision.
+    recall = np.mean([score is not None and score >= best - 1e-4
+                      for score, best in zip(found, expected)])
+    assert recall >= 0.98
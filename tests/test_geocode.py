@@ -0,0 +1,111 @@
+# Copyright 2020 XAMES3. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ======================================================================
+"""Tests for the `pyxa.cli.commands.geocode` module."""
+
+import csv
+import os
+
+import pytest
+
+from pyxa.cli.commands.geocode import geocode_file
+
+MAPS_KEY = 'AIzaReplay'
+
+
+class Interrupted(Exception):
+    pass
+
+
+@pytest.fixture
+def addresses(replay, isolated):
+    path = isolated / 'addresses.csv'
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['id', 'address'])
+        writer.writerows([idx, f'{idx} Fenchurch St, London']
+                         for idx in range(10))
+    return str(path)
+
+
+def _rows(path):
+    with open(path, newline='') as file:
+        return list(csv.DictReader(file))
+
+
+def _interrupt_after(batches):
+    done = []
+
+    def progress(stats):
+        done.append(stats)
+        if len(done) == batches:
+            raise Interrupted()
+    return progress
+
+
+def test_geocodes_every_row(addresses):
+    stats = geocode_file(MAPS_KEY, addresses, batch=4)
+    rows = _rows(addresses.replace('.csv', '_geocoded.csv'))
+
+    assert stats['rows'] == 10 and stats['errors'] == 0
+    assert [row['id'] for row in rows] == [str(idx) for idx in range(10)]
+    assert all(row['latitude'] and row['longitude'] for row in rows)
+
+
+def test_resumes_from_checkpoint(addresses, replay):
+    with pytest.raises(Interrupted):
+        geocode_file(MAPS_KEY, addresses, batch=4,
+                     progress=_interrupt_after(2))
+    requests = replay.stats()['requests']
+
+    stats = geocode_file(MAPS_KEY, addresses, batch=4)
+    rows = _rows(addresses.replace('.csv', '_geocoded.csv'))
+
+    assert stats['resumed'] == 8 and stats['rows'] == 10
+    assert [row['id'] for row in rows] == [str(idx) for idx in range(10)]
+    # Only the rows past the checkpoint are geocoded again.
+    assert replay.stats()['requests'] - requests == 2
+
+
+def test_refuses_output_without_checkpoint(addresses):
+    output = addresses.replace('.csv', '_geocoded.csv')
+    with open(output, 'w') as file:
+        file.write('precious\n')
+
+    with pytest.raises(FileExistsError):
+        geocode_file(MAPS_KEY, addresses)
+    geocode_file(MAPS_KEY, addresses, restart=True)
+    assert len(_rows(output)) == 10
+
+
+@pytest.mark.parametrize('damage', ['remove', 'shorten'])
+def test_restarts_when_output_is_behind_checkpoint(addresses, damage):
+    output = addresses.replace('.csv', '_geocoded.csv')
+    with pytest.raises(Interrupted):
+        geocode_file(MAPS_KEY, addresses, batch=4,
+                     progress=_interrupt_after(2))
+    if damage == 'remove':
+        os.remove(output)
+    else:
+        with open(output, 'r+') as file:
+            file.truncate(10)
+
+    stats = geocode_file(MAPS_KEY, addresses, batch=4)
+    with open(output, 'rb') as file:
+        assert b'\0' not in file.read()
+    assert stats['resumed'] == 0
+    assert [row['id'] for row in _rows(output)] == [str(idx)
+                                                    for idx in range(10)]
@@ -0,0 +1,41 @@
+# Copyright 2020 XAMES3. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ======================================================================
+"""Tests for the `pyxa.core.geohash` module."""
+
+import pytest
+
+from pyxa.core.geohash import decode, encode
+
+
+def test_encode_matches_reference():
+    assert encode(57.64911, 10.40744, 11) == 'u4pruydqqvj'
+
+
+def test_encode_prefixes_nest():
+    cell = encode(51.5119, -0.0808, 9)
+    assert all(encode(51.5119, -0.0808, precision) == cell[:precision]
+               for precision in range(1, 9))
+
+
+@pytest.mark.parametrize('latitude, longitude', [(51.5119, -0.0808),
+                                                 (-33.8688, 151.2093),
+                                                 (0.0, 0.0)])
+def test_decode_contains_point(latitude, longitude):
+    center_lat, center_lon, lat_error, lon_error = decode(
+        encode(latitude, longitude, 7))
+    assert abs(latitude - center_lat) <= lat_error
+    assert abs(longitude - center_lon) <= lon_error
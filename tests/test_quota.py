@@ -0,0 +1,104 @@
+# Copyright 2020 XAMES3. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ======================================================================
+"""Tests for the `pyxa.core.quota` module."""
+
+import threading
+import time
+
+import pytest
+
+from pyxa.core.quota import PRIORITY_HIGH, PRIORITY_LOW, QuotaLimiter
+from pyxa.utils.exceptions import QuotaExceeded
+
+
+def _limiter(path=None, **limits):
+    quotas = {'api': {'per_second': None, 'daily': None, 'monthly': None,
+                      **limits}}
+    return QuotaLimiter(quotas, path=path, timeout=5.0)
+
+
+def test_spent_budget_is_refused():
+    limiter = _limiter(daily=3)
+    for _ in range(3):
+        limiter.acquire('api', 'key')
+    with pytest.raises(QuotaExceeded):
+        limiter.acquire('api', 'key')
+    assert limiter.remaining('api', 'key') == {'daily': 0, 'monthly': None}
+    # Every key has budgets of its own.
+    limiter.acquire('api', 'other key')
+    assert limiter.stats()['rejected'] == 1
+
+
+def test_usage_survives_restarts(tmp_path):
+    path = str(tmp_path / 'quota.db')
+    limiter = _limiter(path, monthly=10)
+    for _ in range(4):
+        limiter.acquire('api', 'key')
+    assert limiter.flush()
+
+    restarted = _limiter(path, monthly=10)
+    assert restarted.remaining('api', 'key')['monthly'] == 6
+
+
+def test_concurrent_grants_are_all_persisted(tmp_path):
+    path = str(tmp_path / 'quota.db')
+    limiter = _limiter(path)
+
+    def grant():
+        for _ in range(200):
+            limiter.acquire('api', 'key')
+
+    threads = [threading.Thread(target=grant) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    limiter.flush()
+
+    restarted = _limiter(path, daily=2000)
+    assert restarted.remaining('api', 'key')['daily'] == 400
+
+
+def test_rate_limit_serves_higher_priority_first():
+    # A rate of 4 per second bursts up to 4 requests, drain the bucket.
+    limiter = _limiter(per_second=4)
+    for _ in range(4):
+        limiter.acquire('api', 'key')
+    order = []
+
+    def acquire(priority, name):
+        limiter.acquire('api', 'key', priority)
+        order.append(name)
+
+    low = threading.Thread(target=acquire, args=(PRIORITY_LOW, 'low'))
+    high = threading.Thread(target=acquire, args=(PRIORITY_HIGH, 'high'))
+    low.start()
+    deadline = time.monotonic() + 5.0
+    while limiter.stats()['waiting'] < 1 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    high.start()
+    low.join()
+    high.join()
+
+    assert order == ['high', 'low']
+
+
+def test_queued_request_times_out():
+    limiter = _limiter(per_second=0.5)
+    limiter.acquire('api', 'key')
+    with pytest.raises(QuotaExceeded):
+        limiter.acquire('api', 'key', timeout=0.05)
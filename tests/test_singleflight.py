@@ -0,0 +1,97 @@
+# Copyright 2020 XAMES3. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ======================================================================
+"""Tests for the `pyxa.core.singleflight` module."""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from pyxa.core.singleflight import SingleFlight, coalesce
+
+
+def _wait_for_followers(group, followers):
+    """Waits until the followers joined the running call."""
+    deadline = time.monotonic() + 5.0
+    while group.coalesced < followers and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+
+def test_concurrent_identical_calls_are_coalesced():
+    group, release, calls = SingleFlight(), threading.Event(), []
+
+    def fetch(location):
+        calls.append(location)
+        release.wait(5.0)
+        return f'forecast of {location}'
+
+    with ThreadPoolExecutor(8) as executor:
+        futures = [executor.submit(group.do, ('forecast', 'London'), fetch,
+                                   'London') for _ in range(8)]
+        _wait_for_followers(group, 7)
+        release.set()
+        results = [future.result() for future in futures]
+
+    assert calls == ['London']
+    assert results == ['forecast of London'] * 8
+    assert group.stats() == {'calls': 1, 'coalesced': 7, 'in_flight': 0,
+                             'by_name': {'fetch': 7}}
+
+
+def test_errors_are_shared_by_coalesced_callers():
+    group, release = SingleFlight(), threading.Event()
+
+    def fail():
+        release.wait(5.0)
+        raise ValueError('upstream failed')
+
+    with ThreadPoolExecutor(4) as executor:
+        futures = [executor.submit(group.do, 'key', fail) for _ in range(4)]
+        _wait_for_followers(group, 3)
+        release.set()
+        for future in futures:
+            with pytest.raises(ValueError):
+                future.result()
+    assert group.calls == 1
+
+
+def test_calls_after_completion_run_again():
+    group, calls = SingleFlight(), []
+    for _ in range(3):
+        group.do('key', calls.append, 1)
+    assert len(calls) == 3
+
+
+def test_coalesce_keys_on_arguments():
+    release, calls = threading.Event(), []
+
+    @coalesce
+    def lookup(location):
+        calls.append(location)
+        release.wait(5.0)
+        return location.upper()
+
+    with ThreadPoolExecutor(6) as executor:
+        futures = [executor.submit(lookup, location)
+                   for location in ['london', 'paris'] * 3]
+        time.sleep(0.1)
+        release.set()
+        results = [future.result() for future in futures]
+
+    assert sorted(calls) == ['london', 'paris']
+    assert results == ['LONDON', 'PARIS'] * 3